@@ -1,6 +1,7 @@
 import pm4py
 from processtree import *
 from alignment import *
+from sagncache import RuntimeHistory, tree_hash
 import pandas as pd
 from tqdm import tqdm
 
@@ -18,7 +19,7 @@ from enum import Enum
 import sys
 from pm4py.util.constants import PARAMETER_CONSTANT_ACTIVITY_KEY, PARAMETER_CONSTANT_CASEID_KEY, CASE_CONCEPT_NAME
 import importlib.util
-from typing import Optional, Dict, Any, Union
+from typing import Optional, Dict, Any, Union, Tuple
 from pm4py.objects.log.obj import EventLog, EventStream, Trace
 from pm4py.objects.petri_net.obj import PetriNet, Marking
 from pm4py.util import typing, constants, pandas_utils
@@ -710,37 +711,273 @@ def align_sk_all_for_one(tree:ProcessTree, var:List[str], timeout=100, cnt=2000)
         aligner.align2(list(var), [100000]*len(var), True, timeout=timeout)
     return (time.process_time_ns()-timer)/cnt 
 
-def align_sk_all(variant_strings:List[List[str]], tree:ProcessTree, timeout=100):
+_worker_aligner:Optional[Aligner] = None
+
+
+def _init_aligner_worker(tree:ProcessTree, incentive:int, aligner_args:Dict[str, Any]):
+    # runs once per worker process of an AlignerPool
+    global _worker_aligner
+    Aligner.set_level_incentive(incentive)
+    _worker_aligner = Aligner(tree, **aligner_args)
+
+
+def _align_chunk(variant_strings:List[List[str]], timeout, deadline=None):
+    codec = StateCodec(_worker_aligner.mapper)
+    results = []
+    for var in variant_strings:
+        states, t = _worker_aligner.align2(list(var), [100000]*len(var), True, timeout=timeout, deadline=deadline)
+        results.append((codec.encode(states), t))
+    return results
+
+
+def _align_trie_chunk(variant_strings:List[List[str]], timeout):
+    codec = StateCodec(_worker_aligner.mapper)
+    return [(codec.encode(states), t) for states, t in _worker_aligner.align_trie([list(var) for var in variant_strings], 100000, timeout=timeout)]
+
+
+def available_cores() -> int:
+    """
+    Returns the number of cores this process may run on.
+    """
+    import os
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class AlignerPool(object):
+    """
+    Pool of worker processes that each build an Aligner for a fixed tree once, when the worker starts. Tasks only send the variants, neither the tree nor a Mapper is pickled or rebuilt per variant.
+    Results come back encoded by a StateCodec and are decoded into states bound to the tree of the pool.
+    The level incentive at construction is set in every worker.
+    """
+
+    def __init__(self, tree:ProcessTree, max_workers:Optional[int]=None, **aligner_args) -> None:
+        """
+        tree: Process tree to align to
+        max_workers: Number of worker processes; default: number of available cores
+        aligner_args: Further arguments for the Aligner of the workers, e.g., heuristic
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        import alignment
+        self.max_workers = max_workers if max_workers is not None else available_cores()
+        self.codec = StateCodec(Mapper(tree))
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_aligner_worker, initargs=(tree, alignment.level_incentive, aligner_args))
+
+    def __enter__(self) -> "AlignerPool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+
+    def shutdown(self, cancel_futures:bool=False) -> None:
+        """
+        Waits for the running tasks and stops the workers. With cancel_futures, tasks that did not start are cancelled.
+        """
+        self.executor.shutdown(cancel_futures=cancel_futures)
+
+    def submit(self, variant_strings:List[List[str]], timeout=100, deadline=None):
+        """
+        Returns a future of the encoded results of align2 for the variants, computed by one worker. Use results to decode them.
+        With a deadline, a wall-clock time (time.time()), the worker stops every variant at the deadline as on timeout.
+        """
+        return self.executor.submit(_align_chunk, variant_strings, timeout, deadline)
+
+    def submit_trie(self, variant_strings:List[List[str]], timeout=100):
+        """
+        Returns a future of the encoded results of align_trie for the variants, computed by one worker. Use results to decode them.
+        """
+        return self.executor.submit(_align_trie_chunk, variant_strings, timeout)
+
+    def results(self, future, variant_strings:List[List[str]]) -> List[Tuple[List[State], int]]:
+        """
+        Returns the decoded results of a future of submit or submit_trie for the variants.
+        """
+        return [(self.codec.decode(encoded, list(var)), t) for var, (encoded, t) in zip(variant_strings, future.result())]
+
+    def align(self, variant_strings:List[List[str]], timeout=100, target_time:float=1., progress=None, costs:Optional[List[float]]=None) -> List[Tuple[List[State], int]]:
+        """
+        Computes all optimal skip alignments in normal form of the variants.
+        Variants are sent by decreasing expected costs, i.e., long running variants start first and do not delay the end. Idle workers take the next chunk, so no worker waits while others have work left. The first chunk holds one variant; afterwards chunks are filled up to about target_time, with the expected costs scaled to the computation times measured so far, but to at most half of the remaining variants per worker, such that the last chunks are small and the workers finish together.
+
+        variant_strings: List of lists of activities that represent a trace
+        timeout: Maximal computation time per variant in s
+        target_time: Desired computation time per chunk in s
+        progress: tqdm progress bar to update; default None
+        costs: Expected costs of the variants in any unit, e.g., by VariantCostModel; default None, i.e., equal costs
+
+        Returns: List of the tuple (list of states, computation time in ns or -1 on timeout) per variant
+        """
+        from concurrent.futures import wait, FIRST_COMPLETED
+        if costs is None:
+            costs = [1.]*len(variant_strings)
+        order = sorted(range(len(variant_strings)), key=lambda i: -costs[i])
+        results = [None]*len(variant_strings)
+        running = {}
+        next_index = 0
+        measured_s = 0.
+        expected = 0.
+        while next_index < len(order) or len(running) > 0:
+            while next_index < len(order) and len(running) < 2*self.max_workers:
+                limit = max(1, (len(order) - next_index) // (2*self.max_workers))
+                chunk = [order[next_index]]
+                if expected > 0:
+                    scale = measured_s / expected # s per unit of costs
+                    chunk_time = costs[chunk[0]] * scale
+                    while len(chunk) < limit and next_index+len(chunk) < len(order):
+                        i = order[next_index+len(chunk)]
+                        if chunk_time + costs[i] * scale > target_time:
+                            break
+                        chunk.append(i)
+                        chunk_time += costs[i] * scale
+                running[self.submit([variant_strings[i] for i in chunk], timeout)] = chunk
+                next_index += len(chunk)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = running.pop(future)
+                for i, (agns, t) in zip(chunk, self.results(future, [variant_strings[i] for i in chunk])):
+                    results[i] = (agns, t)
+                    measured_s += t / 10**9 if t != -1 else timeout
+                    expected += max(costs[i], 1e-12)
+                    if progress is not None:
+                        progress.update()
+        return results
+
+
+class VariantCostModel(object):
+    """
+    Estimates the computation time of the skip alignments of a variant. The search branches on events of activities below an And or a Loop, so the estimate is a power law in the length of the variant and the number of such events:
+    time = exp(c0) * (length+1)^c1 * (events below And/Loop+1)^c2
+    The coefficients are fitted to the recorded times for the tree if there are enough of them, recorded variants get their recorded time.
+    """
+
+    def __init__(self, tree:ProcessTree, history:Optional[RuntimeHistory]=None) -> None:
+        """
+        tree: Process tree to align to
+        history: Recorded computation times; default None, i.e., default coefficients
+        """
+        self.branching_labels = set()
+        stack = [(tree, False)]
+        while len(stack) > 0:
+            node, below = stack.pop()
+            if isinstance(node, Activity) and below:
+                self.branching_labels.add(node.name)
+            stack += [(c, below or isinstance(node, And) or isinstance(node, Loop)) for c in node.children]
+        self.recorded = history.runtimes(tree_hash(tree)) if history is not None else {}
+        self.coefficients = np.array([np.log(1e-3), 2., 1.]) # 1 ms for a variant of one event
+        if len(self.recorded) >= 3:
+            x = np.array([self.features(v) for v in self.recorded])
+            y = np.log(np.maximum(np.array(list(self.recorded.values()), dtype=float), 1.) / 10**9)
+            if np.linalg.matrix_rank(x) == x.shape[1]:
+                self.coefficients = np.linalg.lstsq(x, y, rcond=None)[0]
+
+    def features(self, variant:List[str]) -> List[float]:
+        return [1., np.log(len(variant)+1), np.log(sum(1 for a in variant if a in self.branching_labels)+1)]
+
+    def estimate(self, variant:List[str]) -> float:
+        """
+        Returns the expected computation time of the variant in s.
+        """
+        if tuple(variant) in self.recorded:
+            return self.recorded[tuple(variant)] / 10**9
+        return float(np.exp(np.dot(self.coefficients, self.features(variant))))
+
+
+def align_sk_all(variant_strings:List[List[str]], tree:ProcessTree, timeout=100, max_workers:Optional[int]=None, costs:Optional[List[float]]=None):
     """
-    Computes all optimal skip alignments in normal form. It does use multiprocessing.
+    Computes all optimal skip alignments in normal form. It does use multiprocessing by an AlignerPool.
 
     variant_strings: List of lists of activities that represent a trace
     tree: Process tree to align to
     timeout: Maximal computation time in s
+    max_workers: Number of worker processes; default: number of available cores
+    costs: Expected costs per variant; the most expensive variants are started first. Default: None, i.e., in the given order
 
-    Returns: Futures of the tuple (list of states whose paths represent optimal skip alignments in normal form, computation time in ns or -1 on timeout)
+    Returns: List of the tuple (list of states whose paths represent optimal skip alignments in normal form, computation time in ns or -1 on timeout) per trace
     """
-    from concurrent.futures import ProcessPoolExecutor, as_completed
-    with ProcessPoolExecutor(max_workers=14) as executor:
-        futures = []
-        for var in variant_strings:
-            futures.append(executor.submit(Aligner(tree).align2, list(var), [100000]*len(var), True, timeout=timeout))
-        print("Futures created")
-        progress = tqdm(total=len(futures))
+    with AlignerPool(tree, max_workers) as pool:
+        return pool.align(variant_strings, timeout, progress=tqdm(total=len(variant_strings)), costs=costs)
+
+def align_sk_all_trie(variant_strings:List[List[str]], tree:ProcessTree, timeout=100, max_workers:Optional[int]=None):
+    """
+    Computes all optimal skip alignments in normal form sharing the search for common prefixes of the variants (see Aligner.align_trie). It does use multiprocessing with one task per first activity.
+
+    variant_strings: List of lists of activities that represent a trace
+    tree: Process tree to align to
+    timeout: Maximal computation time in s spent on the prefixes of a trace
+    max_workers: Number of worker processes; default: number of available cores
 
+    Returns: List of the tuple (list of states whose paths represent optimal skip alignments in normal form, computation time in ns or -1 on timeout) per trace
+    """
+    from concurrent.futures import as_completed
+    groups = {} # first activity -> indices of variants
+    for i, var in enumerate(variant_strings):
+        groups.setdefault(var[0] if len(var) > 0 else None, []).append(i)
+    results = [None]*len(variant_strings)
+    with AlignerPool(tree, max_workers) as pool:
+        futures = {}
+        for idxs in groups.values():
+            futures[pool.submit_trie([variant_strings[i] for i in idxs], timeout)] = idxs
+        progress = tqdm(total=len(variant_strings))
         for future in as_completed(futures):
-            progress.update()
-        return futures
+            for i, res in zip(futures[future], pool.results(future, [variant_strings[i] for i in futures[future]])):
+                results[i] = res
+            progress.update(len(futures[future]))
+    return results
 
-        if progress is not None:
-            alignments_ready = 0
-            while alignments_ready != len(futures):
-                current = 0
-                for index, variant in enumerate(futures):
-                    current = current + 1 if futures[index].done() else current
-                if current > alignments_ready:
-                    for i in range(0, current - alignments_ready):
-                        
-                        progress.update()
-                alignments_ready = current
-        return futures
\ No newline at end of file
+
+def align_sk_all_budget(variant_strings:List[List[str]], frequencies:List[int], tree:ProcessTree, budget:float, timeout=100, max_workers:Optional[int]=None, costs:Optional[List[float]]=None):
+    """
+    Computes all optimal skip alignments in normal form within a global time budget. It does use multiprocessing.
+    Variants are started in the given order, i.e., the most important ones should come first. Each variant gets a share of the remaining budget proportional to its frequency times its expected costs; time left by variants that finish early is shared among the remaining ones. Variants not started before the budget is used up are cut.
+    A share is the CPU-time (process_time) timeout of align2 in the worker. The budget is a wall-clock deadline: workers stop their variants at the deadline, running variants are only awaited until then and the ones still running are cut.
+
+    variant_strings: List of lists of activities that represent a trace
+    frequencies: Frequency of each variant
+    tree: Process tree to align to
+    budget: Time for all variants in s, i.e., the wall-clock deadline
+    timeout: Maximal computation time per variant in s
+    max_workers: Number of worker processes; default: number of available cores
+    costs: Expected costs per variant, e.g., by VariantCostModel; default None, i.e., the length of the variant plus one
+
+    Returns: List of the tuple (list of states whose paths represent optimal skip alignments in normal form, computation time in ns or -1 on timeout or cut) per trace
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED
+    deadline = time.time() + budget
+    if costs is None:
+        costs = [len(var)+1 for var in variant_strings]
+    weights = [frequencies[i] * costs[i] for i in range(len(variant_strings))]
+    open_weight = sum(weights) # weight of variants not finished yet
+    results = [None]*len(variant_strings)
+    progress = tqdm(total=len(variant_strings))
+    with AlignerPool(tree, max_workers) as pool:
+        parallel = min(pool.max_workers, available_cores())
+        running = {}
+        next_index = 0
+        while next_index < len(variant_strings) or len(running) > 0:
+            while next_index < len(variant_strings) and len(running) < pool.max_workers:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                i = next_index
+                share = min(timeout, remaining, remaining * parallel * weights[i] / open_weight)
+                running[pool.submit([variant_strings[i]], share, deadline)] = i
+                next_index += 1
+            if len(running) == 0:
+                # budget used up
+                break
+            done, _ = wait(running, timeout=max(deadline - time.time(), 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                results[i] = pool.results(future, [variant_strings[i]])[0]
+                open_weight -= weights[i]
+                progress.update()
+            if time.time() >= deadline and len(running) > 0:
+                # budget used up, the workers stop the running variants at the deadline themselves
+                for i in running.values():
+                    results[i] = ([], -1)
+                running = {}
+                pool.shutdown(cancel_futures=True)
+    for i in range(next_index, len(variant_strings)):
+        results[i] = ([], -1)
+    return results
@@ -1,42 +1,172 @@
 from processtree import *
 from typing import List, Optional, Any, Set
-from enum import Enum
+from enum import Enum, IntEnum
 import queue
 from functools import total_ordering
-from collections import defaultdict
+from collections import defaultdict, deque
+import heapq
+from array import array
 import time
 
 level_incentive = 0
 
-@total_ordering
-class NodeState(Enum):
+class NodeState(IntEnum):
+    """
+    Execution state of a tree node. The values fit into a byte, such that the states of all nodes are kept in a bytearray.
+    """
     CLOSED = 1
     ACTIVE = 2
     ENABLED = 3
     FUTURE = 4
 
-    def __lt__(self, other):
-        if not isinstance(other, NodeState):
-            raise ValueError("Expected Enum value.")
-        return self.value < other.value
+class Heuristic(Enum):
+    NONE = 1 # uniform cost search
+    REMAINING_COST = 2 # lower bound of CostEstimator
+
+class Frontier(Enum):
+    PRIORITY_QUEUE = 1 # queue.PriorityQueue ordered by State.__lt__
+    BUCKETS = 2 # BucketQueue
+
+def _trail_from_items(items):
+    return Trail() + items
+
+class Trail(object):
+    """
+    Persistent append-only sequence. Adding to a trail returns a new trail sharing all previous entries with the original one, i.e., copying a trail takes constant time independent of its length.
+    Reading works like on a tuple, random access materialises the entries once per trail.
+    """
+    __slots__ = ('value', 'prev', 'length', 'items')
+
+    def __init__(self) -> None:
+        self.value = None
+        self.prev = None
+        self.length = 0
+        self.items = None
+
+    def push(self, value) -> "Trail":
+        """
+        Returns a new trail with value added at the end, the current trail is left unchanged.
+        """
+        trail = Trail.__new__(Trail)
+        trail.value = value
+        trail.prev = self
+        trail.length = self.length + 1
+        trail.items = None
+        return trail
+
+    def materialize(self) -> tuple:
+        if self.items is None:
+            items = []
+            trail = self
+            while trail.length > 0:
+                items.append(trail.value)
+                trail = trail.prev
+            items.reverse()
+            self.items = tuple(items)
+        return self.items
+
+    def __add__(self, other) -> "Trail":
+        trail = self
+        for value in other:
+            trail = trail.push(value)
+        return trail
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __reversed__(self):
+        trail = self
+        while trail.length > 0:
+            yield trail.value
+            trail = trail.prev
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self.materialize()[i])
+        if self.items is None and -8 <= i < 0 and -i <= self.length:
+            # recent entries are reached without materialising
+            trail = self
+            for _ in range(-i-1):
+                trail = trail.prev
+            return trail.value
+        return self.materialize()[i]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Trail, list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # flat, such that long trails do not hit the recursion limit of pickle
+        return (_trail_from_items, (list(self),))
+
+    def __str__(self) -> str:
+        return list(self).__str__()
+
+    def __repr__(self) -> str:
+        return self.__str__()
 
 @total_ordering
 class State(object):
     """
     State in the search space for skip alignments in normal form. It represents the tuple (sigma',delta) of remaining activities to be aligned and the current alignment. delts is guaranteed to be normal formed.
+
+    Copies are cheap: node states are a bytearray, the remaining trace is a position in the full trace and path, fired leafs and AND indices are Trails shared with the predecessor states.
+    Executions are logged persistently while searching and materialised into a list of Execution on first access of executions.
     """
     def __init__(self, tree:ProcessTree, trace:List[str], mapper:"Mapper") -> None:
         self.name = None
         self.tree = tree
         self.mapper = mapper
-        self.state = [NodeState.ENABLED] + [NodeState.CLOSED]*(mapper.size()-1)
-        self.trace = trace
-        self.path = []
+        self.state = bytearray([NodeState.CLOSED])*mapper.size()
+        self.state[0] = NodeState.ENABLED
+        self.full_trace = trace
+        self.trace_pos = 0
+        self.path = Trail()
         self.acc_costs = 0
-        self.already_fired = []
-        self.executions:List[Execution] = []
-        self.and_stops = defaultdict(list) # indices do not respect unfolding
-        self.and_starts = defaultdict(list) # indices do not respect unfolding
+        self.already_fired = Trail()
+        self.last_fired = (None,)*len(mapper.loops) # leaf fired last within every Loop node, see loop_history
+        self.running = {} # node -> (number of execution, start) of ongoing executions
+        self.finished = Trail() # (number of execution, node, start, stop) of finished executions
+        self.execution_count = 0
+        self._executions:List[Execution]|None = None
+        self.and_stops = defaultdict(Trail) # indices do not respect unfolding
+        self.and_starts = defaultdict(Trail) # indices do not respect unfolding
+        self.estimator:CostEstimator|None = None
+        self.estimate = None
+
+    @property
+    def trace(self) -> List[str]:
+        return self.full_trace[self.trace_pos:]
+
+    @trace.setter
+    def trace(self, trace:List[str]) -> None:
+        self.full_trace = trace
+        self.trace_pos = 0
+
+    def remaining(self) -> int:
+        """
+        Returns the number of activities left to be aligned.
+        """
+        return len(self.full_trace) - self.trace_pos
+
+    @property
+    def executions(self) -> List[Execution]:
+        if self._executions is None:
+            execs = [(n, node, start, stop) for n, node, start, stop in self.finished]
+            execs += [(n, node, start, None) for node, (n, start) in self.running.items()]
+            execs.sort(key=lambda e: e[0])
+            self._executions = [Execution(node, start, stop) for _, node, start, stop in execs]
+        return self._executions
+
+    @executions.setter
+    def executions(self, executions:List[Execution]) -> None:
+        self._executions = executions
     
     @staticmethod
     def initial_state(tree:ProcessTree, trace:List[str], mapper:"Mapper"):
@@ -49,7 +179,7 @@ class State(object):
         """
         Returns true iff the current state is a goal state.
         """
-        return self.state == [NodeState.CLOSED]*self.mapper.size() and len(self.trace) == 0
+        return self.trace_pos == len(self.full_trace) and self.state.count(NodeState.CLOSED) == len(self.state)
 
     def successors2(self, log_move_costs:List[int], time_bound:int):
         """
@@ -63,55 +193,49 @@ class State(object):
         Details can be found in the paper section 4.4.
         """
         # idea: for every remaining event, try to directly go there
-        if self.is_init() and len(self.trace) == 0:
+        if self.is_init() and self.remaining() == 0:
             # trying to align empty trace, i.e., entire trace before wasn't fitting
             new_state = self.copy()
             self.shortest_execution(self.tree, new_state)
             return [new_state]
-        if len(self.trace) == 0:
+        if self.remaining() == 0:
             # before we aligned, but now trace is done
             # first ensure that the last sync move is covered
 
-            leaf_idxs = [self.mapper.node_to_index(leaf) for leaf in self.tree.get_leafs()]
-            current_activity = None
-            for i, idx in enumerate(leaf_idxs):
-                if self.state[idx] == NodeState.ACTIVE:
-                    current_activity = self.tree.get_leafs()[i]
+            current_activity = self.get_active_leaf()
             new_state = self.finish_subtree(self.tree, current_activity)
             return [new_state]
         # still an activity left, try to align it
-        successor_states = self.shortest_path_to_activate(self.trace[0], time_bound)
+        activity = self.full_trace[self.trace_pos]
+        successor_states = self.shortest_path_to_activate(activity, time_bound)
         # or just skip over the next move
         new_state = self.copy()
-        new_state.path += [(self.trace[0], ">>")]
-        new_state.trace = new_state.trace[1:]
-        new_state.acc_costs += log_move_costs[-len(self.trace)]
+        new_state.path += [(activity, ">>")]
+        new_state.trace_pos += 1
+        new_state.acc_costs += log_move_costs[-self.remaining()]
         return successor_states + [new_state]
     
     def shortest_path_to_activate(self, activity:str, time_bound) -> Optional[List[Any]]:
-        if activity not in self.tree.get_leaf_labels():
+        leafs = self.mapper.activities.get(activity)
+        if leafs is None:
             return [] # activity does not exist
         new_states = []
         if self.is_init():
             # sure there exists a path
             assert len(self.already_fired) == 0
-            for leaf in [l for l in self.tree.get_leafs() if l.name == activity and isinstance(l, Activity)]:
+            for leaf in leafs:
                 # these leafs would match and a path to each does exist
                 new_state = self.get_shortest_path_down(self.tree, leaf)
                 assert new_state is not None
                 new_states.append(new_state)
-                new_state.trace = new_state.trace[1:]
+                new_state.trace_pos += 1
         else:
             # check, if from current activity exists a path
             # NOTE: still need to fire the last activity
-            leaf_idxs = [self.mapper.node_to_index(leaf) for leaf in self.tree.get_leafs()]
-            current_activity = None
-            for i, idx in enumerate(leaf_idxs):
-                if self.state[idx] == NodeState.ACTIVE:
-                    current_activity = self.tree.get_leafs()[i]
+            current_activity = self.get_active_leaf()
             assert current_activity is not None
 
-            for leaf in [l for l in self.tree.get_leafs() if l.name == activity and isinstance(l, Activity)]:
+            for leaf in leafs:
                 # these leafs would match but not neccessarily a path does exist
                 if self.is_execution_order_possible(current_activity, leaf):
                     lcas = self.get_generalized_lca(current_activity, leaf)
@@ -127,7 +251,7 @@ class State(object):
                                 if new_state.state[self.mapper.node_to_index(c)] == NodeState.CLOSED:
                                     continue
                                 assert new_state.state[self.mapper.node_to_index(c)] == NodeState.FUTURE
-                                if c.contains_tree(leaf):
+                                if self.mapper.compiled.contains(c, leaf):
                                     # go in
                                     new_state = self.get_shortest_path_down(c, leaf, new_state)
                                     break
@@ -142,7 +266,7 @@ class State(object):
                                 if new_state.state[self.mapper.node_to_index(c)] == NodeState.CLOSED:
                                     continue
                                 assert new_state.state[self.mapper.node_to_index(c)] == NodeState.ENABLED or NodeState.ACTIVE
-                                if c.contains_tree(leaf):
+                                if self.mapper.compiled.contains(c, leaf):
                                     # go in
                                     start_node = leaf
                                     while new_state.state[self.mapper.node_to_index(start_node)] != NodeState.ENABLED and new_state.state[self.mapper.node_to_index(start_node)] != NodeState.ACTIVE:
@@ -166,7 +290,7 @@ class State(object):
                                                     self.complete_partial_tree(c2, new_state)
                                                 if new_state.state[self.mapper.node_to_index(c2)] == NodeState.FUTURE:
                                                     # maybe we need to go in
-                                                    if c2.contains_tree(leaf):
+                                                    if self.mapper.compiled.contains(c2, leaf):
                                                         # go in
                                                         new_state.state[self.mapper.node_to_index(c2)] == NodeState.ENABLED
                                                         new_state = self.get_shortest_path_down(c2, leaf, new_state)
@@ -179,16 +303,16 @@ class State(object):
                                             # and maybe we need to finish the old execution
                                             last_was_do = False
                                             branch = None
-                                            for i in range(len(new_state.already_fired)):
+                                            for fired in reversed(new_state.already_fired):
                                                 if branch is not None:
                                                     break
-                                                if start_node.children[0].contains_tree(new_state.already_fired[-(i+1)]):
+                                                if self.mapper.compiled.contains(start_node.children[0], fired):
                                                     # last was do
                                                     last_was_do = True
                                                     branch = start_node.children[0]
                                                     break
                                                 for c3 in start_node.children[1:]:
-                                                    if c3.contains_tree(new_state.already_fired[-(i+1)]):
+                                                    if self.mapper.compiled.contains(c3, fired):
                                                         # last was redo
                                                         last_was_do = False
                                                         branch = c3
@@ -196,7 +320,7 @@ class State(object):
                                             next_is_do = True
                                             next_branch = start_node.children[0]
                                             for c3 in start_node.children[1:]:
-                                                if c3.contains_tree(leaf):
+                                                if self.mapper.compiled.contains(c3, leaf):
                                                     next_is_do = False
                                                     next_branch = c3
                                                     break
@@ -233,21 +357,21 @@ class State(object):
                         elif isinstance(lca, Loop):
                             current_activity_belonging_to_loop = current_activity
                             found_last_activity = False
-                            for i in range(len(new_state.already_fired)):
+                            for fired in reversed(new_state.already_fired):
                                 if found_last_activity:
                                     break
                                 for loop_c in lca.children:
-                                    if loop_c.contains_tree(new_state.already_fired[len(new_state.already_fired)-i-1]):
+                                    if self.mapper.compiled.contains(loop_c, fired):
                                         found_last_activity = True
-                                        current_activity_belonging_to_loop = new_state.already_fired[len(new_state.already_fired)-i-1]
+                                        current_activity_belonging_to_loop = fired
                                         break
                             if belongs_to_a_higher_and:
                                 # the loop is triggered on the path from the real LCA And to an activity, i.e., we need to finish the execution of the loop first
                                 new_state = new_state.complete_running_subtree(current_activity_belonging_to_loop, leaf, lca)
 
-                            if lca.children[0].contains_tree(current_activity_belonging_to_loop):
+                            if self.mapper.compiled.contains(lca.children[0], current_activity_belonging_to_loop):
                                 # we executed the do part
-                                if lca.children[0].contains_tree(leaf):
+                                if self.mapper.compiled.contains(lca.children[0], leaf):
                                     # again do part
                                     new_states2:List["State"] = []
                                     min_idx = -1
@@ -262,29 +386,37 @@ class State(object):
                                 else:
                                     # now it is a redo part
                                     for c in lca.children[1:]:
-                                        if c.contains_tree(leaf):
+                                        if self.mapper.compiled.contains(c, leaf):
                                             new_state = self.get_shortest_path_down(c, leaf, new_state)
                                             break
                             else:
                                 # we executed the redo part
-                                if lca.children[0].contains_tree(leaf):
+                                if self.mapper.compiled.contains(lca.children[0], leaf):
                                     # now it is do part
                                     new_state = self.get_shortest_path_down(lca.children[0], leaf, new_state)
                                 else:
                                     # now it is again redo part
                                     self.shortest_execution(lca.children[0], new_state)
                                     for c in lca.children[1:]:
-                                        if c.contains_tree(leaf):
+                                        if self.mapper.compiled.contains(c, leaf):
                                             new_state = self.get_shortest_path_down(c, leaf, new_state)
                         else:
                             raise ValueError("Turning at LCA did not work at:", lca, current_activity, leaf)
                         new_states.append(new_state)
-                        new_state.trace = new_state.trace[1:]
+                        new_state.trace_pos += 1
                 else:
                     pass
         return new_states
 
 
+    def get_active_leaf(self) -> Optional[ProcessTree]:
+        # the last ACTIVE leaf from left to right
+        current_activity = None
+        for idx in self.mapper.leafs:
+            if self.state[idx] == NodeState.ACTIVE:
+                current_activity = self.mapper.order[idx]
+        return current_activity
+
     def complete_running_subtree(self, act_running:ProcessTree, act_new:ProcessTree,lca:ProcessTree) -> "State":
         # NOTE: This does also fire the current activity
         
@@ -352,7 +484,7 @@ class State(object):
                     self.complete_partial_tree(c, state)
             state.state[self.mapper.node_to_index(root)] = NodeState.CLOSED
             state.stop_execution(root)
-            state.and_stops[root].append(state.get_last_executed_event_idx(root))
+            state.and_stops[root] += [state.get_last_executed_event_idx(root)]
             return
         if isinstance(root, Loop):
             if last_node == root.children[0]:
@@ -434,7 +566,7 @@ class State(object):
                 self.shortest_execution(tree, state)
                 state.state[self.mapper.node_to_index(tree)] = NodeState.CLOSED
                 state.stop_execution(tree)
-                state.and_stops[tree].append(state.get_last_executed_event_idx(tree))
+                state.and_stops[tree] += [state.get_last_executed_event_idx(tree)]
             elif state.state[self.mapper.node_to_index(tree)] == NodeState.ACTIVE:
                 for c in tree.children:
                     if state.state[self.mapper.node_to_index(c)] == NodeState.CLOSED:
@@ -454,7 +586,7 @@ class State(object):
                         raise ValueError("Enexpected state of child:", c, state.state[self.mapper.node_to_index(c)])
                 state.state[self.mapper.node_to_index(tree)] = NodeState.CLOSED
                 state.stop_execution(tree)
-                state.and_stops[tree].append(state.get_last_executed_event_idx(tree))
+                state.and_stops[tree] += [state.get_last_executed_event_idx(tree)]
             else:
                 raise ValueError("Enexpected state of tree:", tree, state.state[self.mapper.node_to_index(tree)])
         elif isinstance(tree, Loop):
@@ -488,16 +620,16 @@ class State(object):
                         # we need to check which execution was last, whether it is finished and what branch to take next
                         last_was_do = False
                         branch = None
-                        for i in range(len(state.already_fired)):
+                        for fired in reversed(state.already_fired):
                             if branch is not None:
                                 break
-                            if tree.children[0].contains_tree(state.already_fired[-(i+1)]):
+                            if self.mapper.compiled.contains(tree.children[0], fired):
                                 # last was do
                                 last_was_do = True
                                 branch = tree.children[0]
                                 break
                             for c3 in tree.children[1:]:
-                                if c3.contains_tree(state.already_fired[-(i+1)]):
+                                if self.mapper.compiled.contains(c3, fired):
                                     # last was redo
                                     last_was_do = False
                                     branch = c3
@@ -521,39 +653,18 @@ class State(object):
         return
 
     def get_generalized_lca(self, act1:ProcessTree, act2:ProcessTree) -> List["State"]:
-        lca = self.tree.get_lca(act1, act2)
-        assert lca is not None
-
-        if isinstance(lca, LeafNode):
-            # same node again
-            return [(x,False) for x in self.get_all_loops_before(lca)]
-        elif isinstance(lca, Sequence):
-            # current activity has to come first or a Loop was before
-            for c in lca.children:
-                if c.contains_tree(act1):
-                    return [(lca,False)] + [(x,False) for x in self.get_all_loops_before(lca.parent)]
-                if c.contains_tree(act2):
-                    return [(x,False) for x in self.get_all_loops_before(lca)]
-        elif isinstance(lca, Xor):
-            # only possible, if a Loop node was executed before
-            return [(x,False) for x in self.get_all_loops_before(lca)]
-        elif isinstance(lca, And):
-            # either the leaf is still awaiting execution of the And or a Loop was before
-            lcas = []
-            for c in lca.children:
-                if c.contains_tree(act2):
-                    current_node = act2
-                    while current_node != lca: # NOTE: Enough if on the path from the And to the node is an ENABLED node
-                        if self.state[self.mapper.node_to_index(current_node)] == NodeState.ENABLED or self.state[self.mapper.node_to_index(current_node)] == NodeState.FUTURE:
-                            lcas.append((lca,False)) # from the lca there exists a path of execution that can fire or continue without needing to loop
-                        if (self.state[self.mapper.node_to_index(current_node)] == NodeState.ACTIVE and isinstance(current_node, Loop)):
-                            lcas.append((current_node,True)) # on the path AND --> act2 there is a loop that can iterate
-                        current_node = current_node.parent
-                    # still possible as another branch was chosen
-            return lcas + [(x,False) for x in self.get_all_loops_before(lca)]
-        elif isinstance(lca, Loop):
-            # a loop can always repeat
-            return [(lca,False)] + [(x,False) for x in self.get_all_loops_before(lca.parent)]
+        transition = self.mapper.get_transition(act1, act2)
+        if transition.path is None:
+            return transition.lcas
+        # And: either the leaf is still awaiting execution of the And or a Loop was before
+        lcas = []
+        for idx, node in transition.path: # NOTE: Enough if on the path from the And to the node is an ENABLED node
+            if self.state[idx] == NodeState.ENABLED or self.state[idx] == NodeState.FUTURE:
+                lcas.append((transition.lca,False)) # from the lca there exists a path of execution that can fire or continue without needing to loop
+            if self.state[idx] == NodeState.ACTIVE and isinstance(node, Loop):
+                lcas.append((node,True)) # on the path AND --> act2 there is a loop that can iterate
+        # still possible as another branch was chosen
+        return lcas + transition.lcas
     
     def get_next_loop(self, node:ProcessTree):
         if isinstance(node, Loop):
@@ -562,53 +673,21 @@ class State(object):
         return self.get_next_loop(node.parent)
     
     def get_all_loops_before(self, node:ProcessTree):
-        if node is None:
-            return []
-        if isinstance(node, Loop):
-            return [node] + self.get_all_loops_before(node.parent)
-        else:
-            return self.get_all_loops_before(node.parent)
+        return self.mapper.compiled.loops_before(node)
 
     def is_execution_order_possible(self, act1:ProcessTree, act2:ProcessTree):
-        lca = self.tree.get_lca(act1, act2)
-        assert lca is not None
-
-        if isinstance(lca, LeafNode):
-            # same node again
-            return self.check_if_loop_before(lca)
-        elif isinstance(lca, Sequence):
-            # current activity has to come first or a Loop was before
-            for c in lca.children:
-                if c.contains_tree(act1):
-                    return True
-                if c.contains_tree(act2):
-                    return self.check_if_loop_before(lca)
-        elif isinstance(lca, Xor):
-            # only possible, if a Loop node was executed before
-            return self.check_if_loop_before(lca)
-        elif isinstance(lca, And):
-            # either the leaf is still awaiting execution of the And or a Loop was before
-            for c in lca.children:
-                if c.contains_tree(act2):
-                    current_node = act2
-                    while current_node != lca: # NOTE: Enough if on the path from the And to the node is an ENABLED node
-                        if self.state[self.mapper.node_to_index(current_node)] == NodeState.ENABLED or self.state[self.mapper.node_to_index(current_node)] == NodeState.FUTURE or (self.state[self.mapper.node_to_index(current_node)] == NodeState.ACTIVE and isinstance(current_node, Loop)):
-                            return True 
-                        current_node = current_node.parent
-                    # still possible as another branch was chosen
-            return self.check_if_loop_before(lca)
-        elif isinstance(lca, Loop):
-            # a loop can always repeat
-            return True
-        else:
-            raise ValueError("Did not expect the LCA to be a non-inner node:", lca, act1, act2)
+        transition = self.mapper.get_transition(act1, act2)
+        if transition.path is None:
+            return transition.possible
+        # And: either the leaf is still awaiting execution of the And or a Loop was before
+        for idx, node in transition.path: # NOTE: Enough if on the path from the And to the node is an ENABLED node
+            if self.state[idx] == NodeState.ENABLED or self.state[idx] == NodeState.FUTURE or (self.state[idx] == NodeState.ACTIVE and isinstance(node, Loop)):
+                return True
+        # still possible as another branch was chosen
+        return transition.possible
 
     def check_if_loop_before(self, node:ProcessTree):
-        while node is not None:
-            if isinstance(node, Loop):
-                return True
-            node = node.parent
-        return False
+        return self.mapper.compiled.has_loop_before(node)
 
     def get_shortest_path_down(self, start_node:ProcessTree, leaf_node:ProcessTree, new_state:"State"=None):
         if start_node == leaf_node:
@@ -620,7 +699,7 @@ class State(object):
             new_state.acc_costs += leaf_node.sync_move_cost
             new_state.path += [(leaf_node.name, leaf_node)]
             #print(self.tree.contains_tree(leaf_node))
-            new_state.already_fired += [leaf_node]
+            new_state.fire([leaf_node])
             return new_state
         reverse_node_path = [] # [NOT start_node, start_node+1, ..., leaf_node]
         reverse_node_path.append(leaf_node)
@@ -658,7 +737,7 @@ class State(object):
                 new_state.start_execution(current_node)
             elif isinstance(current_node, And):
                 # enable all, but only execute the needed one
-                new_state.and_starts[current_node].append(len(new_state.path))
+                new_state.and_starts[current_node] += [len(new_state.path)]
                 new_state.start_execution(current_node)
                 for i in range(len(current_node.children)):
                     # only do enablement
@@ -694,7 +773,7 @@ class State(object):
         new_state.acc_costs += leaf_node.sync_move_cost
         new_state.path += [(leaf_node.name, leaf_node)]
         #print(self.tree.contains_tree(leaf_node))
-        new_state.already_fired += [leaf_node]
+        new_state.fire([leaf_node])
         return new_state
 
     def shortest_execution(self, tree:ProcessTree, new_state:"State"):
@@ -703,12 +782,12 @@ class State(object):
         cost_skip, only_taus = tree.get_cheapest_execution(level_incentive)
         if only_taus:
             # there exists a path only of taus that we want to take
-            new_state.already_fired += lfs
+            new_state.fire(lfs)
             new_state.path += [('>>', TauPath(tree))]
             new_state.acc_costs += 0 #sum(leaf.skip_cost for leaf in lfs)
         else:
             # skipping is cheaper
-            new_state.already_fired += lfs
+            new_state.fire(lfs)
             new_state.path += [('>>', Skip(tree, cost_skip))]
             new_state.acc_costs += cost_skip
 
@@ -758,8 +837,9 @@ class State(object):
 
     def get_last_executed_event_idx(self, tree:ProcessTree) -> int:
         # returns the index in the folded path at which the most recent activity execution belonging to tree arised
-        for i in range(len(self.path)-1, -1, -1):
-            model_move = self.path[i][1]
+        i = len(self.path)
+        for _, model_move in reversed(self.path):
+            i -= 1
             if model_move == '>>':
                 continue
             elif isinstance(model_move, Skip):
@@ -767,11 +847,16 @@ class State(object):
             elif isinstance(model_move, TauPath):
                 model_move = model_move.node
             
-            if tree.contains_tree(model_move):
+            if self.mapper.compiled.contains(tree, model_move):
                 return i
         raise ValueError("Did not expect the finished node ")
 
     def start_execution(self, node:ProcessTree):
+        if self._executions is None:
+            if node not in self.running:
+                self.running[node] = (self.execution_count, len(self.path))
+                self.execution_count += 1
+            return
         for i in range(len(self.executions)-1, -1, -1):
             if self.executions[i].node is not None and self.executions[i].node == node and self.executions[i].start is not None and self.executions[i].stop is None:
                 # execution of node is already started and ongoing, skip
@@ -779,6 +864,11 @@ class State(object):
         self.executions.append(Execution(node, len(self.path)))
     
     def stop_execution(self, node:ProcessTree):
+        if self._executions is None:
+            if node in self.running:
+                n, start = self.running.pop(node)
+                self.finished = self.finished.push((n, node, start, len(self.path)))
+            return
         for i in range(len(self.executions)-1, -1, -1):
             # if execution of node is already stopped, then skip
             if self.executions[i].node is not None and self.executions[i].node == node and self.executions[i].start is not None and self.executions[i].stop is None:
@@ -840,6 +930,7 @@ class State(object):
         res = []
         for path in list(itertools.product(*paths)):
             new_state = self.copy()
+            new_state.path = list(new_state.path)
             for i, elem in enumerate(path):
                 # elem = [a,b] [c,d], i.e., we need to flat afterwards
                 new_state.path[indizes[i]] = [('>>', tau) for tau in elem]
@@ -876,34 +967,48 @@ class State(object):
         return res
 
     def is_init(self):
-        for i in self.state[1:]:
-            if i != NodeState.CLOSED:
-                return False
-        return self.state[0] == NodeState.ENABLED
+        return self.state[0] == NodeState.ENABLED and self.state.count(NodeState.CLOSED) == len(self.state)-1
 
     def copy(self):
-        state = State(self.tree, self.trace, self.mapper)
+        state = State.__new__(State)
         state.name = self.name
-        for i, v in enumerate(self.state):
-            state.state[i] = v
-        state.path = []
-        for i, v in enumerate(self.path):
-            state.path.append(v)
+        state.tree = self.tree
+        state.mapper = self.mapper
+        state.state = self.state[:]
+        state.full_trace = self.full_trace
+        state.trace_pos = self.trace_pos
+        # trails are immutable, i.e., they can be shared
+        state.path = self.path if isinstance(self.path, Trail) else list(self.path)
         state.acc_costs = self.acc_costs
-        state.already_fired = [f for f in self.already_fired]
+        state.already_fired = self.already_fired if isinstance(self.already_fired, Trail) else list(self.already_fired)
+        state.last_fired = self.last_fired
+        state.and_starts = defaultdict(Trail)
         for k,v in self.and_starts.items():
-            state.and_starts[k] = [w for w in v]
+            state.and_starts[k] = v if isinstance(v, Trail) else list(v)
+        state.and_stops = defaultdict(Trail)
         for k,v in self.and_stops.items():
-            state.and_stops[k] = [w for w in v]
-        for exec in self.executions:
-            state.executions.append(Execution(exec.node, exec.start, exec.stop))
+            state.and_stops[k] = v if isinstance(v, Trail) else list(v)
+        state.running = dict(self.running)
+        state.finished = self.finished
+        state.execution_count = self.execution_count
+        state.estimator = self.estimator
+        state.estimate = None
+        if self._executions is None:
+            state._executions = None
+        else:
+            state._executions = [Execution(exec.node, exec.start, exec.stop) for exec in self._executions]
         return state
     
     def heuristic(self):
         """
-        By now, no heuristic is needed
+        Lower bound on the costs to reach a goal state, 0 if the state has no estimator.
+        The bound only depends on the node states and the position in the trace, it is computed once per state.
         """
-        return 0
+        if self.estimator is None:
+            return 0
+        if self.estimate is None:
+            self.estimate = self.estimator.estimate(self)
+        return self.estimate
     
     def costs(self):
         return self.acc_costs + self.heuristic()
@@ -922,14 +1027,334 @@ class State(object):
     def matches_without_cost(self, other:"State"):
         return self.state == other.state and self.trace == other.trace
 
+    def closed_key(self):
+        """
+        Returns a hashable key that is equal for two states iff matches_without_cost holds for them, given that both states align the same trace.
+        """
+        return (bytes(self.state), self.remaining())
+
+    def fire(self, leafs:List[ProcessTree]) -> None:
+        """
+        Appends leafs to the fired leafs and updates the leaf fired last within every Loop node above them.
+        """
+        self.already_fired += leafs
+        if len(self.mapper.loops) == 0:
+            return
+        compiled = self.mapper.compiled
+        slots = self.mapper.loop_slots
+        last_fired = list(self.last_fired)
+        for leaf in leafs:
+            for loop in compiled.loops[compiled.node_index(leaf)]:
+                last_fired[slots[loop]] = leaf
+        self.last_fired = tuple(last_fired)
+
+    def loop_history(self) -> tuple:
+        """
+        Returns the leaf fired last within every Loop node, None for Loops without fired leafs.
+        Besides the node states, successors only look back at the fired leafs to find the running branch of a Loop. So, states with equal closed_key, costs and loop history have the same successors up to the moves before.
+        The history is kept up to date by fire, so this takes constant time.
+        """
+        return self.last_fired
+
+class ClosedSet(object):
+    """
+    Closed set of the A* algorithm. States are indexed by their closed_key, i.e., the node states and the position in the trace, such that lookup and replacement take constant time.
+    """
+
+    def __init__(self) -> None:
+        self.states = {}
+
+    def find(self, state:State) -> State|None:
+        """
+        Returns the state in the set that matches state without considering costs, None if there is no such state.
+        """
+        return self.states.get(state.closed_key())
+
+    def replace(self, state:State) -> None:
+        """
+        Adds state to the set. A matching state already in the set is removed, i.e., there is at most one state per key.
+        """
+        self.states[state.closed_key()] = state
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def __iter__(self):
+        return iter(self.states.values())
+
+    def __str__(self) -> str:
+        return list(self.states.values()).__str__()
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+class BucketQueue(object):
+    """
+    Open list of the A* algorithm with one bucket per cost value (Dial's algorithm). Skip alignment costs are sums of a few constants, i.e., there are only few distinct costs and most states share their bucket.
+    States of equal costs are returned first in first out, which gives a deterministic tie break without comparing states. Putting and getting a state takes constant time except for the first state of a new cost value.
+    """
+
+    def __init__(self) -> None:
+        self.buckets = {} # costs -> deque of states
+        self.costs = [] # heap of the costs with a bucket
+        self.size = 0
+
+    def put(self, state:State) -> None:
+        costs = state.costs()
+        bucket = self.buckets.get(costs)
+        if bucket is None:
+            bucket = deque()
+            self.buckets[costs] = bucket
+            heapq.heappush(self.costs, costs)
+        bucket.append(state)
+        self.size += 1
+
+    def get(self) -> State:
+        costs = self.costs[0]
+        bucket = self.buckets[costs]
+        state = bucket.popleft()
+        if len(bucket) == 0:
+            del self.buckets[costs]
+            heapq.heappop(self.costs)
+        self.size -= 1
+        return state
+
+    def empty(self) -> bool:
+        return self.size == 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def queue(self) -> List[State]:
+        return [state for costs in sorted(self.buckets) for state in self.buckets[costs]]
+
+
+class CostTable(object):
+    """
+    Lowest accumulated costs found for node states, i.e., closed keys, in the depth-first passes of Aligner.align_bounded.
+    At most capacity entries are kept. If the table is full, the entry with the highest costs that is not pinned is evicted, cheap node states prune the largest parts of the search. Dropping an entry only loses pruning, as every cost in the table was reached by some state.
+    After a complete pass, i.e., a pass that reaches every state of lowest costs, an entry is exact if it was in the table since the start of the pass or was added before the first eviction of the pass. Exact entries hold the lowest costs of their node states.
+    Pinned entries are never evicted. They are exact after a pass that reaches every state of lowest costs for them, even if it is not complete.
+    """
+
+    def __init__(self, capacity:Optional[int]=None) -> None:
+        self.capacity = capacity
+        self.costs = {} # closed key -> [lowest costs, exact]
+        self.heap = [] # (-costs, number, closed key), outdated entries are skipped
+        self.count = 0
+        self.pinned = set()
+        self.evictions = 0
+        self.pass_evictions = 0
+        self.complete = True
+
+    def start_pass(self, complete:bool) -> None:
+        if complete:
+            for entry in self.costs.values():
+                entry[1] = True
+        self.pass_evictions = 0
+        self.complete = complete
+
+    def get(self, key) -> Optional[int]:
+        entry = self.costs.get(key)
+        return entry[0] if entry is not None else None
+
+    def is_exact(self, key) -> bool:
+        entry = self.costs.get(key)
+        return entry is not None and entry[1]
+
+    def update(self, key, costs:int) -> None:
+        """
+        Lowers the costs of key to costs, adds key if it is not in the table and evicts another entry if needed.
+        """
+        entry = self.costs.get(key)
+        if entry is not None:
+            if costs < entry[0]:
+                entry[0] = costs
+                self._push(key, costs)
+            return
+        if self.capacity is not None and len(self.costs) >= self.capacity:
+            if not self._evict():
+                return
+        self.costs[key] = [costs, self.complete and self.pass_evictions == 0]
+        self._push(key, costs)
+
+    def _push(self, key, costs:int) -> None:
+        if len(self.heap) > 2*len(self.costs) + 16:
+            # drop outdated entries
+            self.heap = [(-entry[0], n, k) for n, (k, entry) in enumerate(self.costs.items())]
+            heapq.heapify(self.heap)
+        self.count += 1
+        heapq.heappush(self.heap, (-costs, self.count, key))
+
+    def _evict(self) -> bool:
+        skipped = []
+        evicted = False
+        while len(self.heap) > 0:
+            neg_costs, n, key = heapq.heappop(self.heap)
+            entry = self.costs.get(key)
+            if entry is None or entry[0] != -neg_costs:
+                continue
+            if key in self.pinned:
+                skipped.append((neg_costs, n, key))
+                continue
+            del self.costs[key]
+            self.evictions += 1
+            self.pass_evictions += 1
+            evicted = True
+            break
+        for item in skipped:
+            heapq.heappush(self.heap, item)
+        return evicted
+
+    def pin(self, keys) -> None:
+        """
+        Pins keys, unknown ones with infinite costs. Requires that at most capacity keys are pinned.
+        """
+        for key in keys:
+            if key not in self.costs:
+                self.update(key, float('inf'))
+            self.pinned.add(key)
+
+    def unpin(self) -> None:
+        """
+        Unpins all keys, they are exact from now on.
+        """
+        for key in self.pinned:
+            self.costs[key][1] = True
+        self.pinned = set()
+
+    def __contains__(self, key) -> bool:
+        return key in self.costs
+
+    def __len__(self) -> int:
+        return len(self.costs)
+
+class CostEstimator(object):
+    """
+    Admissible and consistent lower bound on the remaining costs of states aligning a fixed trace. It adds up
+    - log moves on remaining activities that no leaf able to fire anymore can match, and
+    - the cheapest executions of subtrees that still have to be executed but contain no remaining activity, i.e., that can only be skipped.
+    """
+
+    def __init__(self, compiled:CompiledTree, trace:List[str], log_move_costs:List[int], model_moves:bool=True) -> None:
+        """
+        compiled: compiled tree the states refer to
+        trace: List of activities
+        log_move_costs: List of integers for the costs of log moves on the activities of trace
+        model_moves: If False, only log moves are estimated. Required if skip costs are changed by a level incentive
+        """
+        self.compiled = compiled
+        self.model_moves = model_moves
+        n = compiled.size()
+        # activity labels per subtree, bottom up
+        self.labels:List[frozenset] = [frozenset()]*n
+        for i in range(n-1, -1, -1):
+            if compiled.types[i] == CompiledTree.ACTIVITY:
+                self.labels[i] = frozenset([compiled.nodes[i].name])
+            else:
+                self.labels[i] = frozenset().union(*[self.labels[c] for c in compiled.children[i]])
+        self.cheapest = [compiled.nodes[i].get_cheapest_execution(0)[0] for i in range(n)]
+        # remaining activities and their log move costs per position in the trace
+        self.remaining:List[frozenset] = [frozenset()]*(len(trace)+1)
+        self.log_costs = {label:[0]*(len(trace)+1) for label in trace}
+        for pos in range(len(trace)-1, -1, -1):
+            self.remaining[pos] = self.remaining[pos+1] | {trace[pos]}
+            for label, costs in self.log_costs.items():
+                costs[pos] = costs[pos+1]
+            self.log_costs[trace[pos]][pos] += log_move_costs[pos]
+
+    def estimate(self, state:State) -> int:
+        remaining = self.remaining[state.trace_pos]
+        compiled = self.compiled
+        reachable = set()
+        skip_costs = 0
+        i = 0
+        while i < len(state.state):
+            node_state = state.state[i]
+            if node_state == NodeState.ENABLED or node_state == NodeState.FUTURE:
+                # not started yet, i.e., the entire subtree is ahead
+                reachable |= self.labels[i]
+                if self.model_moves and self.labels[i].isdisjoint(remaining):
+                    skip_costs += self.cheapest[i]
+                i = compiled.last[i]+1
+            else:
+                if node_state == NodeState.ACTIVE and compiled.types[i] == CompiledTree.LOOP:
+                    # the loop can repeat all of its leafs
+                    reachable |= self.labels[i]
+                i += 1
+        log_costs = 0
+        for label in remaining:
+            if label not in reachable:
+                log_costs += self.log_costs[label][state.trace_pos]
+        return log_costs + skip_costs
+
+
+class PrefixTrie(object):
+    """
+    Trie of traces. Each node stands for the prefix of activities on the path from the root to it.
+    """
+
+    def __init__(self, prefix:List[str]=[], parent:"PrefixTrie"=None) -> None:
+        self.prefix = prefix
+        self.parent = parent
+        self.children = {} # activity -> PrefixTrie
+        self.ends:List[int] = [] # indices of the traces equal to prefix
+        self.limit = float('inf') # maximal costs of states still needed by a trace in this subtrie
+        self.time_spent = 0 # computation time in ns spent on states for this prefix
+
+    def add(self, trace:List[str], index:int) -> "PrefixTrie":
+        """
+        Adds trace with the given index and returns the node of trace.
+        """
+        node = self
+        for activity in trace:
+            child = node.children.get(activity)
+            if child is None:
+                child = PrefixTrie(node.prefix + [activity], node)
+                node.children[activity] = child
+            node = child
+        node.ends.append(index)
+        return node
+
+    def path_time(self) -> int:
+        """
+        Returns the computation time in ns spent on all prefixes of this node.
+        """
+        node = self
+        time_spent = 0
+        while node is not None:
+            time_spent += node.time_spent
+            node = node.parent
+        return time_spent
+
+    def update_limits(self, limits:List[float]) -> None:
+        """
+        Recomputes the limits of this node and its ancestors from the limits per trace.
+        """
+        node = self
+        while node is not None:
+            node.limit = max([limits[i] for i in node.ends] + [c.limit for c in node.children.values()], default=float('-inf'))
+            node = node.parent
+
 class Aligner(object):
     """
     Wrapper for the A* algorithm to compute optimal akip alignments in normal form.
     """
 
-    def __init__(self, tree:ProcessTree) -> None:
+    def __init__(self, tree:ProcessTree, heuristic:Heuristic=Heuristic.NONE, frontier:Frontier=Frontier.PRIORITY_QUEUE, symmetry_reduction:bool=False) -> None:
+        """
+        tree: process tree to align to
+        heuristic: lower bound guiding the search. Default: Heuristic.NONE, i.e., uniform cost search
+        frontier: data structure of the open list. Default: Frontier.PRIORITY_QUEUE
+        symmetry_reduction: If True, align2 expands only one of the states with equal node states, costs and loop history, e.g., of the interleavings of And branches, and unfolds the others for the optimal alignments only. Default: False
+        """
         self.tree = tree
-        self.mapper = Mapper(self.tree)
+        self.heuristic = heuristic
+        self.frontier = frontier
+        self.symmetry_reduction = symmetry_reduction
+        self.compiled = CompiledTree(self.tree)
+        self.mapper = Mapper(self.tree, self.compiled)
 
     @staticmethod
     def set_level_incentive(l):
@@ -954,7 +1379,7 @@ class Aligner(object):
         else:
             return min([self.min_model_move_cost(c) for c in node.children])
     
-    def align2(self, trace: List[str], log_move_costs:Optional[List[int]], all_optimal=False, debug=False, timeout=None):
+    def align2(self, trace: List[str], log_move_costs:Optional[List[int]], all_optimal=False, debug=False, timeout=None, deadline=None):
         """
         Main A* algorithm.
         Returns a list of goal states and the paths to reach them. state.path is the skip alignment you may look for.
@@ -964,6 +1389,7 @@ class Aligner(object):
         all_optimal: If True, returns all optimal skip alignments in normal form, otherwise one. Default: False
         debug: If True, prints the search stack. Default: False
         timeout: If not None, this is the maximal computation time in s
+        deadline: If not None, the search stops as on timeout at this wall-clock time (time.time()), e.g., the end of a global budget
 
         Returns: 
             if all_optimal == True:
@@ -971,9 +1397,20 @@ class Aligner(object):
             else:
                 state for a optimal skip alignment in normal form
         """
-        openlist:queue.PriorityQueue[State] = queue.PriorityQueue()
-        closedset = []
-        openlist.put(State.initial_state(self.tree, trace, self.mapper))
+        if self.frontier == Frontier.BUCKETS:
+            openlist = BucketQueue()
+        else:
+            openlist:queue.PriorityQueue[State] = queue.PriorityQueue()
+        closedset = ClosedSet()
+        # symmetry reduction: expanded states per closed key with their loop history, successors of expanded states and the expanded state a state was merged into
+        classes = {}
+        successors_of = {}
+        merged_into = {}
+        initial_state = State.initial_state(self.tree, trace, self.mapper)
+        if self.heuristic == Heuristic.REMAINING_COST:
+            # skip costs with a level incentive are no sums of leaf costs anymore
+            initial_state.estimator = CostEstimator(self.compiled, trace, log_move_costs, level_incentive == 0)
+        openlist.put(initial_state)
 
         tau_cost = self.max_tau_cost(self.tree)
         activity_cost = min(min(log_move_costs), self.min_model_move_cost(self.tree))
@@ -989,6 +1426,8 @@ class Aligner(object):
         while not openlist.empty():
             if timeout is not None and time.process_time() - time_start > timeout:
                 return optimal_states, -1
+            if deadline is not None and time.time() > deadline:
+                return optimal_states, -1
             if debug:
                 print()
                 print("Open:  ", openlist.queue)
@@ -1008,23 +1447,42 @@ class Aligner(object):
                         optimal_states.append(state)
                     else:
                         # not optimal anymore
+                        if self.symmetry_reduction:
+                            optimal_states = self.unfold_symmetric(initial_state, optimal_states, successors_of, merged_into, log_move_costs)
                         return optimal_states, time.process_time_ns()-time_start_ns
                 else:
                     return state
             else:
-                other = self.find_in_set(state, closedset)
+                other = closedset.find(state)
                 if other is None or other.costs() >= state.costs(): # NOTE: >= is needed only if we want all optimal alignments ???
+                    if self.symmetry_reduction:
+                        key = state.closed_key()
+                        if other is None or other.costs() > state.costs():
+                            classes[key] = []
+                        history = state.loop_history()
+                        equivalent = None
+                        for member in classes[key]:
+                            if member[1] == history:
+                                equivalent = member[0]
+                                break
+                        if equivalent is not None:
+                            if debug:
+                                print("Same successors as", equivalent)
+                            merged_into[state] = equivalent
+                            continue
+                        classes[key].append((state, history))
+                        successors_of[state] = []
                     if debug:
                         print("Expanding state since other is", other)
-                    if other is not None:
-                        # remove to only have one in
-                        closedset.remove(other)
-                    closedset.append(state)
+                    # replaces other to only have one in
+                    closedset.replace(state)
                     # do expansion
                     if len(optimal_states) > 0 and state.acc_costs > optimal_states[0].acc_costs:
                         # can never get optimal anymore
                         continue
                     successors = state.successors2(log_move_costs, time_start+timeout)
+                    if self.symmetry_reduction:
+                        successors_of[state] = successors
                     if debug:
                         print("Successors:", len(successors))
                     for s in successors:
@@ -1034,37 +1492,425 @@ class Aligner(object):
                 else:
                     if debug:
                         print("Already inspected (better) state, skip.")
+        if self.symmetry_reduction:
+            optimal_states = self.unfold_symmetric(initial_state, optimal_states, successors_of, merged_into, log_move_costs)
         return optimal_states, time.process_time_ns() - time_start_ns
+
+    def unfold_symmetric(self, initial_state:State, optimal_states:List[State], successors_of:dict, merged_into:dict, log_move_costs:List[int]) -> List[State]:
+        """
+        Returns the goal states align2 finds without symmetry reduction. Merged states are expanded again, but only towards the goal states in optimal_states.
+
+        initial_state: initial state of the search
+        optimal_states: goal states found by the reduced search
+        successors_of: expanded state -> its successors
+        merged_into: merged state -> expanded state with the same successors
+        """
+        goals = set(optimal_states)
+        useful = {}
+
+        def is_useful(root:State) -> bool:
+            # whether a goal state is reachable from the state, depth-first with an explicit stack as paths may be long
+            stack = [root]
+            while len(stack) > 0:
+                state = stack[-1]
+                if state in useful:
+                    stack.pop()
+                    continue
+                if state in goals:
+                    useful[state] = True
+                    stack.pop()
+                    continue
+                children = [merged_into[state]] if state in merged_into else successors_of.get(state, [])
+                pending = [c for c in children if c not in useful]
+                if len(pending) > 0:
+                    stack.extend(reversed(pending))
+                else:
+                    useful[state] = any(useful[c] for c in children)
+                    stack.pop()
+            return useful[root]
+
+        results = []
+        if not is_useful(initial_state):
+            return results
+        # pairs (state, expanded state with the same successors), expanded is None for goal states to be reported
+        stack = [(initial_state, initial_state)]
+        while len(stack) > 0:
+            state, expanded = stack.pop()
+            if expanded is None:
+                results.append(state)
+                continue
+            if state is expanded:
+                successors = successors_of[expanded]
+            else:
+                successors = state.successors2(log_move_costs, float('inf'))
+                assert len(successors) == len(successors_of[expanded])
+            # reversed, such that the successors are unfolded in their order
+            for s, original in reversed(list(zip(successors, successors_of[expanded]))):
+                if not is_useful(original):
+                    continue
+                if original in goals:
+                    stack.append((s, None))
+                else:
+                    stack.append((s, merged_into.get(original, original)))
+        return sorted(results)
     
-    def find_in_set(self, state:State, set:Set) -> State|None:
-        for other in set:
-            if state.matches_without_cost(other):
-                return other
-        return None
-    
+    def align_trie(self, traces:List[List[str]], log_move_cost:int, timeout=None):
+        """
+        Computes all optimal skip alignments in normal form for several traces at once, sharing the search for common prefixes.
+        Every successor aligns exactly one more activity except for the final completion. So, the searches of all traces run as one uniform cost search over pairs (prefix in a trie of the traces, state), where a state for a prefix is expanded as long as a trace with this prefix may still need it.
+        The results are the same as of align2(trace, [log_move_cost]*len(trace), True) per trace.
+
+        traces: List of traces, i.e., lists of activities
+        log_move_cost: Costs of a log move on any activity
+        timeout: If not None, this is the maximal computation time in s spent on the prefixes of a trace, shared prefixes count for all their traces
+
+        Returns: List with a tuple (list of states for optimal skip alignments in normal form, computation time in ns or -1 on timeout) per trace
+        """
+        tau_cost = self.max_tau_cost(self.tree)
+        activity_cost = min(log_move_cost, self.min_model_move_cost(self.tree))
+        assert tau_cost < activity_cost
+
+        trie = PrefixTrie()
+        ends = [trie.add(list(trace), i) for i, trace in enumerate(traces)]
+        optimal_costs:List[int|None] = [None]*len(traces)
+        cost_bounds = [float('inf')]*len(traces)
+        limits = [float('inf')]*len(traces) # maximal costs of states to expand per trace
+        results = [[] for _ in traces]
+        times = [None]*len(traces)
+        pending = set(range(len(traces)))
+
+        def finish(i, time_spent):
+            pending.discard(i)
+            times[i] = time_spent
+            limits[i] = float('-inf')
+            ends[i].update_limits(limits)
+
+        def check(current_costs):
+            for i in list(pending):
+                if current_costs > cost_bounds[i]:
+                    # all goal states within the bound are known
+                    finish(i, ends[i].path_time())
+                elif timeout is not None and ends[i].path_time() > timeout*1e9:
+                    results[i] = []
+                    finish(i, -1)
+
+        # entries (costs, counter, node, state, costs of the state completed into the goal state or None)
+        openlist = [(0, 0, trie, State.initial_state(self.tree, [], self.mapper), None)]
+        counter = 1
+        closed = {} # (node, node states) -> minimal costs
+        inspected = 0
+        while len(openlist) > 0 and len(pending) > 0:
+            costs, _, node, state, completed_from = heapq.heappop(openlist)
+            inspected += 1
+            if inspected % 256 == 0:
+                check(costs)
+            if completed_from is not None:
+                # goal state of the traces ending at node
+                for i in node.ends:
+                    if i not in pending:
+                        continue
+                    if optimal_costs[i] is None:
+                        # first one is surely optimal
+                        optimal_costs[i] = costs
+                        cost_bounds[i] = (costs // activity_cost) * activity_cost + activity_cost-1
+                        limits[i] = costs
+                        node.update_limits(limits)
+                    if costs <= cost_bounds[i] and completed_from <= optimal_costs[i]:
+                        results[i].append(state)
+                continue
+            if costs > node.limit:
+                # no trace with this prefix can get optimal with it
+                continue
+            key = (node, bytes(state.state))
+            other = closed.get(key)
+            if other is not None and other < costs:
+                continue
+            closed[key] = costs
+            time_start_ns = time.process_time_ns()
+            successors = []
+            if any(costs <= limits[i] for i in node.ends):
+                state.full_trace = node.prefix
+                successors += [(s, node, costs) for s in state.successors2([log_move_cost]*len(node.prefix), float('inf'))]
+            for child in node.children.values():
+                if costs <= child.limit:
+                    state.full_trace = child.prefix
+                    successors += [(s, child, None) for s in state.successors2([log_move_cost]*len(child.prefix), float('inf'))]
+            for s, s_node, s_completed_from in successors:
+                heapq.heappush(openlist, (s.acc_costs, counter, s_node, s, s_completed_from))
+                counter += 1
+            node.time_spent += time.process_time_ns() - time_start_ns
+        for i in list(pending):
+            finish(i, ends[i].path_time())
+        return [(results[i], times[i]) for i in range(len(traces))]
+
+    def align_bounded(self, trace:List[str], log_move_costs:List[int], state_budget:Optional[int]=None, timeout=None):
+        """
+        Memory-bounded variant of align2(trace, log_move_costs, True) with the same results.
+        The search is an iterative deepening depth-first search on cost thresholds of the form k*activity_cost + activity_cost - 1, which is the cost bound of align2 for optimal costs in [k*activity_cost, (k+1)*activity_cost). Instead of an open list and a closed set of states it keeps only the current branch and a CostTable with the lowest costs of at most state_budget node states, which is kept over all passes.
+        align2 expands a state only if no cheaper state with the same node states was found. Goal states reached through other states are dropped at the end. The lowest costs of node states that were evicted from the table are computed by further passes, which stop at these node states and pin state_budget/2 of them at a time.
+        The table is the only duplicate detection of the search: states of node states outside the table are expanded again for every path reaching them. So, the computation time grows exponentially in the length of the trace as the budget shrinks below the number of node states align2 expands.
+
+        trace: List of activities
+        log_move_costs: List of integers for the costs of log moves on the activities of trace. Requires len(log_move_costs) == len(trace)
+        state_budget: Maximal number of node states whose lowest costs are kept. Default: None, i.e., no bound
+        timeout: If not None, this is the maximal computation time in s
+
+        Returns: (list of states for optimal skip alignments in normal form, computation time in ns or -1 on timeout)
+        """
+        time_start = time.process_time()
+        time_start_ns = time.process_time_ns()
+        time_bound = time_start + timeout if timeout is not None else float('inf')
+        initial_state = State.initial_state(self.tree, trace, self.mapper)
+        if self.heuristic == Heuristic.REMAINING_COST:
+            initial_state.estimator = CostEstimator(self.compiled, trace, log_move_costs, level_incentive == 0)
+
+        tau_cost = self.max_tau_cost(self.tree)
+        activity_cost = min(min(log_move_costs), self.min_model_move_cost(self.tree))
+        assert tau_cost < activity_cost
+        assert state_budget is None or state_budget > 0
+
+        # lowest costs of node states, kept over all passes
+        table = CostTable(state_budget)
+        threshold = (initial_state.costs() // activity_cost) * activity_cost + activity_cost - 1
+        while True:
+            search = self._bounded_pass(initial_state, log_move_costs, threshold, float('inf'), table, time_bound, True)
+            if search is None:
+                return [], -1
+            candidates, next_costs = search
+            if len(candidates) > 0:
+                break
+            if next_costs is None:
+                # no goal state at all
+                return [], time.process_time_ns() - time_start_ns
+            threshold = (next_costs // activity_cost) * activity_cost + activity_cost - 1
+
+        optimal_costs = min(state.acc_costs for state, _ in candidates)
+        # the first threshold with a goal state is the cost bound of align2
+        candidates = [(state, [a for a in ancestors if a[1] <= optimal_costs]) for state, ancestors in candidates if all(g <= optimal_costs for _, g in ancestors)]
+        while True:
+            # costs in the table were reached, i.e., higher costs are never the lowest, and exact costs are the lowest
+            candidates = [(state, [a for a in ancestors if not table.is_exact(a[0])]) for state, ancestors in candidates if all(a[0] not in table or a[1] <= table.get(a[0]) for a in ancestors) and all(a[1] == table.get(a[0]) for a in ancestors if table.is_exact(a[0]))]
+            # node states whose lowest costs are unknown with the highest costs they are reached with by candidates
+            unknown = {}
+            for _, ancestors in candidates:
+                for key, g in ancestors:
+                    unknown[key] = max(g, unknown.get(key, g))
+            if len(unknown) == 0:
+                break
+            # the ones closest to the start of the trace are pinned while another pass finds their lowest costs, the pass does not need to go beyond them
+            keys = sorted(unknown, key=lambda k: -k[1])
+            if state_budget is not None:
+                keys = keys[:(state_budget+1)//2]
+            table.pin(keys)
+            if self._bounded_pass(initial_state, log_move_costs, threshold, max(unknown[k] for k in keys), table, time_bound, False, min(k[1] for k in keys)) is None:
+                return [], -1
+            table.unpin()
+        return sorted(state for state, _ in candidates), time.process_time_ns() - time_start_ns
+
+    def _bounded_pass(self, initial_state:State, log_move_costs:List[int], threshold:int, best:int, table:CostTable, time_bound:float, collect:bool, min_remaining:int=0):
+        """
+        One depth-first pass of align_bounded over all states with costs up to threshold.
+        table holds the lowest costs found for node states, states with higher costs are not expanded. It is updated in place.
+
+        best: States with higher accumulated costs are not expanded
+        collect: If True, goal states are collected together with the node states and costs of the states they were reached through
+        min_remaining: States with less activities left to be aligned are not expanded
+
+        Returns: None on timeout, otherwise (list of (goal state, list of (node states, costs)), lowest costs above threshold or None)
+        """
+        candidates = []
+        next_costs = None
+        table.start_pass(collect)
+        stack = [(initial_state, Trail())]
+        while len(stack) > 0:
+            if time.process_time() > time_bound:
+                return None
+            state, ancestors = stack.pop()
+            costs = state.costs()
+            if costs > threshold:
+                if next_costs is None or costs < next_costs:
+                    next_costs = costs
+                continue
+            if state.is_final():
+                if collect:
+                    candidates.append((state, ancestors))
+                    best = min(best, state.acc_costs)
+                continue
+            if state.acc_costs > best or state.remaining() < min_remaining:
+                # can never get optimal anymore or beyond the node states of interest
+                continue
+            key = state.closed_key()
+            known = table.get(key)
+            if known is not None and state.acc_costs > known:
+                continue
+            table.update(key, state.acc_costs)
+            successors = state.successors2(log_move_costs, time_bound)
+            if collect:
+                ancestors = ancestors.push((key, state.acc_costs))
+            for s in reversed(successors):
+                stack.append((s, ancestors))
+        if time.process_time() > time_bound:
+            return None
+        return candidates, next_costs
+
+
+class OnlineAligner(object):
+    """
+    Incremental skip alignments for running cases whose events arrive one by one.
+    Every successor of a state aligns exactly one more event, so the search for a prefix of n events passes through a layer of states that aligned all n of them. Per case, only this layer is kept, reduced to the cheapest states per node states. Appending an event expands the layer once.
+    By default, one state per node states is kept, so the costs of append depend on the size of the tree but not on the length of the case, as needed for monitoring.
+    With all_optimal, the layer keeps every cheapest state per node states, i.e., one per optimal prefix alignment reaching them. Its size, and so the costs of append, are bounded by the number of optimal prefix alignments only, which may grow exponentially with the length of the case, e.g., for a loop that can match a repeated event in several ways. Then, the alignments of a case are the ones of align2(prefix, log_move_costs, True), where the prefix is completed by skips.
+    """
+
+    def __init__(self, tree:ProcessTree, log_move_cost:int=100000, all_optimal:bool=False) -> None:
+        """
+        tree: process tree to align to
+        log_move_cost: Costs of a log move on an event if append does not get any
+        all_optimal: If True, all optimal skip alignments in normal form are kept, otherwise one state per node states. Default: False, i.e., bounded layers for monitoring
+        """
+        self.tree = tree
+        self.log_move_cost = log_move_cost
+        self.all_optimal = all_optimal
+        self.aligner = Aligner(self.tree)
+        # case -> (events, log move costs, layer of states)
+        self.cases = {}
+
+    def append(self, case:Any, activity:str, log_move_cost:Optional[int]=None) -> None:
+        """
+        Adds the next event of case, a case is opened by its first event.
+
+        case: Hashable id of the case
+        activity: Activity of the event
+        log_move_cost: Costs of a log move on the event. Default: the log_move_cost of the aligner
+        """
+        if case not in self.cases:
+            trace = []
+            self.cases[case] = (trace, [], [State.initial_state(self.tree, trace, self.aligner.mapper)])
+        trace, log_move_costs, layer = self.cases[case]
+        # the states of a case share the lists, i.e., all of them see the new event
+        trace.append(activity)
+        log_move_costs.append(log_move_cost if log_move_cost is not None else self.log_move_cost)
+        cheapest = {}
+        for state in layer:
+            for s in state.successors2(log_move_costs, float('inf')):
+                key = s.closed_key()
+                others = cheapest.get(key)
+                if others is None or others[0].acc_costs > s.acc_costs:
+                    cheapest[key] = [s]
+                elif others[0].acc_costs == s.acc_costs and self.all_optimal:
+                    # like the closed set of align2, states of the same costs are kept
+                    others.append(s)
+        self.cases[case] = (trace, log_move_costs, [s for others in cheapest.values() for s in others])
+
+    def alignments(self, case:Any) -> List[State]:
+        """
+        Returns the states for all optimal skip alignments in normal form of the events of case so far, completed by skips. The case stays open.
+        Without all_optimal, only the optimal ones that complete the kept states are returned, at least one.
+        """
+        trace, log_move_costs, layer = self.cases[case]
+        activity_cost = min(log_move_costs + [self.aligner.min_model_move_cost(self.tree)])
+        assert self.aligner.max_tau_cost(self.tree) < activity_cost
+        # pairs of (costs of the state before completion, final state)
+        finals = []
+        for state in layer:
+            state = state.copy()
+            # later events must not change the returned states
+            state.full_trace = list(trace)
+            if state.is_final():
+                finals.append((state.acc_costs, state))
+                continue
+            finals += [(state.acc_costs, s) for s in state.successors2(list(log_move_costs), float('inf'))]
+        if len(finals) == 0:
+            return []
+        optimal_costs = min(s.acc_costs for _, s in finals)
+        cost_bound = (optimal_costs // activity_cost) * activity_cost + activity_cost - 1
+        # states more expensive than the optimum are not completed by align2
+        return sorted(s for costs, s in finals if costs <= optimal_costs and s.acc_costs <= cost_bound)
+
+    def close(self, case:Any) -> List[State]:
+        """
+        Returns the alignments of the completed case and forgets it.
+        """
+        res = self.alignments(case)
+        del self.cases[case]
+        return res
+
+
+class LeafTransition(object):
+    """
+    Static part of going on from the leaf act1 to the leaf act2: their LCA, whether act2 can follow act1 and the LCAs to turn at (see State.get_generalized_lca).
+    If the LCA is an And node, the answers depend on the node states on the path from act2 up to the And. Then, path holds the (index, node) pairs of that path, possible and lcas cover the Loop nodes above the And only.
+    Otherwise, path is None and possible and lcas are the final answers.
+    """
 
+    def __init__(self, compiled:CompiledTree, act1:ProcessTree, act2:ProcessTree) -> None:
+        self.lca = compiled.lca(act1, act2)
+        assert self.lca is not None
+        self.path:List[tuple]|None = None
+        if isinstance(self.lca, LeafNode):
+            # same node again
+            self.possible = compiled.has_loop_before(self.lca)
+            self.lcas = [(x,False) for x in compiled.loops_before(self.lca)]
+        elif isinstance(self.lca, Sequence):
+            # current activity has to come first or a Loop was before
+            for c in self.lca.children:
+                if compiled.contains(c, act1):
+                    self.possible = True
+                    self.lcas = [(self.lca,False)] + [(x,False) for x in compiled.loops_before(self.lca.parent)]
+                    break
+                if compiled.contains(c, act2):
+                    self.possible = compiled.has_loop_before(self.lca)
+                    self.lcas = [(x,False) for x in compiled.loops_before(self.lca)]
+                    break
+        elif isinstance(self.lca, Xor):
+            # only possible, if a Loop node was executed before
+            self.possible = compiled.has_loop_before(self.lca)
+            self.lcas = [(x,False) for x in compiled.loops_before(self.lca)]
+        elif isinstance(self.lca, And):
+            self.path = []
+            current_node = act2
+            while current_node != self.lca:
+                self.path.append((compiled.node_index(current_node), current_node))
+                current_node = current_node.parent
+            self.possible = compiled.has_loop_before(self.lca)
+            self.lcas = [(x,False) for x in compiled.loops_before(self.lca)]
+        elif isinstance(self.lca, Loop):
+            # a loop can always repeat
+            self.possible = True
+            self.lcas = [(self.lca,False)] + [(x,False) for x in compiled.loops_before(self.lca.parent)]
+        else:
+            raise ValueError("Did not expect the LCA to be a non-inner node:", self.lca, act1, act2)
 
 class Mapper(object):
     """
-    Efficient mapper to access the nodes of a tree in a list.
+    Efficient mapper to access the nodes of a tree in a list. The nodes are ordered in preorder as in the compiled tree.
     """
 
-    def __init__(self, tree:ProcessTree) -> None:
+    def __init__(self, tree:ProcessTree, compiled:CompiledTree=None) -> None:
         self.tree = tree
-        self.order = self.traverse_nodes(self.tree)
-        self.reverse_lookup = {t:i for i, t in enumerate(self.order)}
-    
-    def traverse_nodes(self, tree:ProcessTree):
-        if isinstance(tree, LeafNode):
-            return [tree]
-        children = []
-        for c in tree.children:
-            children += self.traverse_nodes(c)
-        return [tree] + children
+        self.compiled = compiled if compiled is not None else CompiledTree(self.tree)
+        self.order = self.compiled.nodes
+        self.reverse_lookup = self.compiled.index
+        self.leafs = [i for i in range(len(self.order)) if isinstance(self.order[i], LeafNode)] # indices from left to right
+        self.activities = defaultdict(list) # label -> Activity leafs from left to right
+        for i in self.leafs:
+            if isinstance(self.order[i], Activity):
+                self.activities[self.order[i].name].append(self.order[i])
+        self.activities = dict(self.activities)
+        self.loops = [i for i in range(len(self.order)) if self.compiled.types[i] == CompiledTree.LOOP]
+        self.loop_slots = {loop: i for i, loop in enumerate(self.loops)} # index of a Loop node -> its position in loop_history
+        self.transitions = {} # (index of act1, index of act2) -> LeafTransition, filled on first use
     
+    def get_transition(self, act1:ProcessTree, act2:ProcessTree) -> LeafTransition:
+        key = (self.reverse_lookup[act1], self.reverse_lookup[act2])
+        transition = self.transitions.get(key)
+        if transition is None:
+            transition = LeafTransition(self.compiled, act1, act2)
+            self.transitions[key] = transition
+        return transition
+
     def node_to_index(self, tree:ProcessTree):
-        return self.order.index(tree)
-        #return self.reverse_lookup[tree]
+        return self.reverse_lookup[tree]
     
     def index_to_node(self, index:int) -> ProcessTree:
         # assert 0 <= index and index < len(self.order)
@@ -1072,3 +1918,109 @@ class Mapper(object):
     
     def size(self):
         return len(self.order)
+
+
+class StateCodec(object):
+    """
+    Compact encoding of states for the transport from worker processes. The states of a list are flattened into a few arrays of ints, nodes are given by their index in the mapper, i.e., neither the tree nor Execution objects are pickled.
+    Decoding binds the states to the tree of the decoding mapper in time linear in the size of the encoding. The trace is not encoded, decode gets it from the caller.
+    """
+    SYNC = 0
+    LOG = 1
+    SKIP = 2
+    TAU_PATH = 3
+
+    def __init__(self, mapper:Mapper) -> None:
+        self.mapper = mapper
+
+    def encode(self, states:List[State]) -> tuple:
+        """
+        Returns the tuple (node states, header, moves, executions, fired leafs, AND indices) of bytes and int arrays for the states. Per state, the header holds accumulated costs, trace position, execution count and the numbers of moves, executions, fired leafs, AND starts and AND stops. Moves are quadruples of kind, node index, index in the trace and skip costs; executions are triples of node index, start and stop; AND indices are pairs of node index and path index.
+        """
+        index = self.mapper.reverse_lookup
+        node_states = bytearray()
+        header = array('q')
+        moves = array('q')
+        executions = array('q')
+        fired = array('q')
+        ands = array('q')
+        for state in states:
+            node_states += state.state
+            trace_idx = 0
+            for label, move in state.path:
+                if move == '>>':
+                    moves.extend((StateCodec.LOG, -1, trace_idx, 0))
+                    trace_idx += 1
+                elif isinstance(move, Skip):
+                    moves.extend((StateCodec.SKIP, index[move.node], -1, move.skip_cost))
+                elif isinstance(move, TauPath):
+                    moves.extend((StateCodec.TAU_PATH, index[move.node], -1, 0))
+                elif label != '>>':
+                    moves.extend((StateCodec.SYNC, index[move], trace_idx, 0))
+                    trace_idx += 1
+                else:
+                    raise ValueError("Cannot encode move", (label, move))
+            for e in state.executions:
+                executions.extend((index[e.node] if e.node is not None else -1, e.start if e.start is not None else -1, e.stop if e.stop is not None else -1))
+            for leaf in state.already_fired:
+                fired.append(index[leaf])
+            for and_indices in (state.and_starts, state.and_stops):
+                for node, idxs in and_indices.items():
+                    for idx in idxs:
+                        ands.extend((index[node], idx))
+            header.extend((state.acc_costs, state.trace_pos, state.execution_count, len(state.path), len(state.executions), len(state.already_fired), sum(len(v) for v in state.and_starts.values()), sum(len(v) for v in state.and_stops.values())))
+        return (bytes(node_states), header, moves, executions, fired, ands)
+
+    def decode(self, encoded:tuple, trace:List[str]) -> List[State]:
+        """
+        Returns the states of encode(states) bound to the tree of the mapper.
+
+        encoded: Result of encode
+        trace: List of activities aligned by the states
+        """
+        node_states, header, moves, executions, fired, ands = encoded
+        nodes = self.mapper.order
+        size = self.mapper.size()
+        states = []
+        m = e = f = a = 0
+        for i in range(len(header)//8):
+            acc_costs, trace_pos, execution_count, n_moves, n_execs, n_fired, n_starts, n_stops = header[8*i:8*i+8]
+            state = State.__new__(State)
+            state.name = None
+            state.tree = self.mapper.tree
+            state.mapper = self.mapper
+            state.state = bytearray(node_states[size*i:size*(i+1)])
+            state.full_trace = trace
+            state.trace_pos = trace_pos
+            path = []
+            for kind, node, trace_idx, cost in zip(moves[4*m:4*(m+n_moves):4], moves[4*m+1:4*(m+n_moves):4], moves[4*m+2:4*(m+n_moves):4], moves[4*m+3:4*(m+n_moves):4]):
+                if kind == StateCodec.SYNC:
+                    path.append((nodes[node].name, nodes[node]))
+                elif kind == StateCodec.LOG:
+                    path.append((trace[trace_idx], '>>'))
+                elif kind == StateCodec.SKIP:
+                    path.append(('>>', Skip(nodes[node], cost)))
+                else:
+                    path.append(('>>', TauPath(nodes[node])))
+            m += n_moves
+            state.path = Trail() + path
+            state.acc_costs = acc_costs
+            state.already_fired = Trail()
+            state.last_fired = (None,)*len(self.mapper.loops)
+            state.fire([nodes[idx] for idx in fired[f:f+n_fired]])
+            f += n_fired
+            state.running = {}
+            state.finished = Trail()
+            state.execution_count = execution_count
+            state._executions = [Execution(nodes[node] if node != -1 else None, start if start != -1 else None, stop if stop != -1 else None) for node, start, stop in zip(executions[3*e:3*(e+n_execs):3], executions[3*e+1:3*(e+n_execs):3], executions[3*e+2:3*(e+n_execs):3])]
+            e += n_execs
+            state.and_starts = defaultdict(Trail)
+            state.and_stops = defaultdict(Trail)
+            for and_indices, n in ((state.and_starts, n_starts), (state.and_stops, n_stops)):
+                for node, idx in zip(ands[2*a:2*(a+n):2], ands[2*a+1:2*(a+n):2]):
+                    and_indices[nodes[node]] = and_indices[nodes[node]].push(idx)
+                a += n
+            state.estimator = None
+            state.estimate = None
+            states.append(state)
+        return states
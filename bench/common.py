@@ -0,0 +1,65 @@
+"""
+Shared helpers of the benchmark scripts. Run the scripts from the root of the repository, e.g., python -m bench.frontier
+"""
+import random
+import sys
+
+import pm4py
+
+from alignment import *
+from processtree import *
+from pvoid import MM_COST, TAU_COST, SYNCH_COST
+
+
+
+DEFAULT_LOG = 'logs/rtfm_fine_appeal.xes.gz'
+DEFAULT_MODEL = 'models/rtfm_extra.ptml'
+
+
+
+def load_tree(modelname):
+    return ProcessTree.from_pm4py(pm4py.read_ptml(modelname), MM_COST, TAU_COST, SYNCH_COST)
+
+def load_variants(logname):
+    log = pm4py.read_xes(logname)
+    return [list(v) for v in pm4py.statistics.variants.log.get.get_variants_from_log_trace_idx(log).keys()]
+
+def noisy(variant, rng, activities):
+    # inserts, deletes or swaps one event
+    trace = list(variant)
+    kind = rng.choice(['insert', 'delete', 'swap'])
+    if kind == 'insert' or len(trace) < 2:
+        trace.insert(rng.randint(0, len(trace)), rng.choice(activities))
+    elif kind == 'delete':
+        trace.pop(rng.randrange(len(trace)))
+    else:
+        i = rng.randrange(len(trace)-1)
+        trace[i], trace[i+1] = trace[i+1], trace[i]
+    return trace
+
+def noisy_traces(variants, copies, rng):
+    # the variants followed by noisy copies of them
+    activities = sorted({a for v in variants for a in v})
+    return variants + [noisy(v, rng, activities) for v in variants for _ in range(copies)]
+
+def bench_args():
+    # usage: python -m bench.<script> [log] [model] [noisy copies per variant] [seed]
+    logname = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LOG
+    modelname = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_MODEL
+    copies = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    rng = random.Random(int(sys.argv[4]) if len(sys.argv) > 4 else 0)
+    return logname, modelname, copies, rng
+
+def move_key(m):
+    if isinstance(m, str):
+        return m
+    if isinstance(m, Skip) or isinstance(m, TauPath):
+        return (type(m).__name__, m.node.id)
+    return m.id
+
+def state_key(s):
+    return (s.acc_costs, bytes(s.state), tuple((l, move_key(m)) for l, m in s.path), tuple((e.node.id, e.start, e.stop) for e in s.executions))
+
+def result_key(states):
+    # order-independent representation of the optimal skip alignments
+    return sorted((s.acc_costs, tuple((l, move_key(m)) for l, m in s.path), tuple(sorted((e.node.id, e.start, e.stop) for e in s.executions))) for s in states)
@@ -0,0 +1,35 @@
+import sys
+import time
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+from alignment import *
+from bench.common import MM_COST, bench_args, load_tree, load_variants, noisy_traces, result_key
+
+
+
+def align_all(tree, traces, frontier, timeout):
+    results = []
+    time_start = time.process_time()
+    for trace in traces:
+        Aligner.set_level_incentive(0)
+        states, _ = Aligner(tree, frontier=frontier).align2(trace, [MM_COST]*len(trace), True, timeout=timeout)
+        results.append(result_key(states))
+    return results, time.process_time() - time_start
+
+def bench_main():
+    # compares the frontiers of align2, usage: python -m bench.frontier [log] [model] [noisy copies per variant] [seed]
+    logname, modelname, copies, rng = bench_args()
+    tree = load_tree(modelname)
+    variants = load_variants(logname)
+    traces = noisy_traces(variants, copies, rng)
+    print("Traces:", len(traces), "(" + str(len(variants)) + " variants)")
+    reference, reference_time = align_all(tree, traces, Frontier.PRIORITY_QUEUE, 600)
+    print("Frontier.PRIORITY_QUEUE (s):", round(reference_time, 2))
+    results, results_time = align_all(tree, traces, Frontier.BUCKETS, 600)
+    print("Frontier.BUCKETS (s):", round(results_time, 2))
+    print("Traces with different optimal skip alignments:", sum(a != b for a, b in zip(reference, results)))
+
+
+if __name__ == '__main__':
+    bench_main()
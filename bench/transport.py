@@ -0,0 +1,33 @@
+import pickle
+import sys
+import time
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+from alignment import *
+from bench.common import DEFAULT_LOG, DEFAULT_MODEL, MM_COST, load_tree, load_variants, state_key
+
+
+
+def bench_main():
+    # compares pickled states with pickled StateCodec encodings, usage: python -m bench.transport [log] [model]
+    logname = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LOG
+    modelname = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_MODEL
+    tree = load_tree(modelname)
+    variants = load_variants(logname)
+    print("Variants:", len(variants))
+    Aligner.set_level_incentive(0)
+    results = [Aligner(tree).align2(var, [MM_COST]*len(var), True, timeout=600)[0] for var in variants]
+    codec = StateCodec(Mapper(tree))
+    print("Pickled states (bytes):", sum(len(pickle.dumps(states)) for states in results))
+    print("Pickled encodings (bytes):", sum(len(pickle.dumps(codec.encode(states))) for states in results))
+    # decoding on a tree of its own, as in the parent of the workers
+    parent = StateCodec(Mapper(load_tree(modelname)))
+    time_start = time.process_time()
+    decoded = [parent.decode(pickle.loads(pickle.dumps(codec.encode(states))), var) for var, states in zip(variants, results)]
+    print("Encoding, pickling and decoding (s):", round(time.process_time() - time_start, 3))
+    print("Variants with different decoded states:", sum([state_key(s) for s in a] != [state_key(s) for s in b] for a, b in zip(results, decoded)))
+
+
+if __name__ == '__main__':
+    bench_main()
@@ -0,0 +1,29 @@
+import sys
+import time
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+from alignment import *
+from bench.common import MM_COST, bench_args, load_tree, load_variants, noisy_traces, result_key
+
+
+
+def bench_main():
+    # compares align_trie with align2 per trace, usage: python -m bench.trie [log] [model] [noisy copies per variant] [seed]
+    logname, modelname, copies, rng = bench_args()
+    tree = load_tree(modelname)
+    variants = load_variants(logname)
+    traces = noisy_traces(variants, copies, rng)
+    print("Traces:", len(traces), "(" + str(len(variants)) + " variants)")
+    Aligner.set_level_incentive(0)
+    time_start = time.process_time()
+    reference = [result_key(Aligner(tree).align2(trace, [MM_COST]*len(trace), True, timeout=600)[0]) for trace in traces]
+    print("align2 per trace (s):", round(time.process_time() - time_start, 2))
+    time_start = time.process_time()
+    results = [result_key(states) for states, _ in Aligner(tree).align_trie(traces, MM_COST, timeout=600)]
+    print("align_trie (s):", round(time.process_time() - time_start, 2))
+    print("Traces with different optimal skip alignments:", sum(a != b for a, b in zip(reference, results)))
+
+
+if __name__ == '__main__':
+    bench_main()
@@ -5,6 +5,7 @@ from typing import Tuple
 import pm4py
 from alignment import *
 from processtree import *
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from alignall import *
@@ -14,14 +15,23 @@ from tqdm import tqdm
 from execution import *
 from probabilities import *
 from skips import Skipper
+from sagncache import RuntimeHistory, SagnCache, tree_hash
 
 class EbiWeights(Enum):
     OCCURANCE = 1
     UNIFORM = 2
 
+class SagnMode(Enum):
+    VARIANTS = 1 # every variant on its own
+    PREFIX_TRIE = 2 # variants sharing prefixes together
+
+class CoincidingMode(Enum):
+    ALIGNMENTS = 1 # all coinciding optimal alignments
+    COUNTS = 2 # only their number per model path
+
 class DerivationPipeline(object):
     
-    def __init__(self, tree:ProcessTree, aligned_log:Any, pl:Dict[Tuple[str], float]=None, pn_log:Any=None, pn_method:str=None, pn_measure=None, sagn_timeout=600):
+    def __init__(self, tree:ProcessTree, aligned_log:Any, pl:Dict[Tuple[str], float]=None, pn_log:Any=None, pn_method:str=None, pn_measure=None, sagn_timeout=600, sagn_mode=SagnMode.VARIANTS, sagn_cache:SagnCache=None, sagn_budget:float=None, sagn_workers:int=None, sagn_history:RuntimeHistory=None, coinciding_mode=CoincidingMode.ALIGNMENTS):
         """
         Derivation pipeline for skip probabilities.
 
@@ -32,6 +42,12 @@ class DerivationPipeline(object):
         pn_method: The stochastic method used to derive the model distribution; only used if pn_log is not None
         pn_measure: Probability distribution on the model paths
         sagn_timeout: Timeout for the skip alignment computation in s; default 10 min
+        sagn_mode: Whether the skip alignments are computed per variant or along a prefix trie of the variants; default SagnMode.VARIANTS
+        sagn_cache: Persistent cache of skip alignments; only variants not in the cache are aligned; default None, i.e., no caching
+        sagn_budget: Time for the skip alignments of all variants in s, shared by frequency and length of the variants; variants that exceed their share are cut and left out of the derivation; only for SagnMode.VARIANTS; default None, i.e., no budget. The budget is a wall-clock bound: alignments still running at its end are stopped and cut
+        sagn_workers: Number of worker processes for the skip alignments; default None, i.e., the number of available cores
+        sagn_history: Recorded computation times of skip alignments; variants expected to be expensive are started first, the new times are recorded; default None, i.e., estimates by the variant lengths
+        coinciding_mode: Whether the coinciding optimal alignments of the skip alignments are computed or only counted per model path; counting avoids the log move interleavings but leaves C without alignments and skips their validation; default CoincidingMode.ALIGNMENTS
         """
         self.tree = tree
         self.aligned_log = aligned_log
@@ -48,8 +64,19 @@ class DerivationPipeline(object):
             self.pn_log = None
             self.pn_method = None
         self.sagn_timeout = sagn_timeout
+        self.sagn_mode = sagn_mode
+        self.sagn_cache = sagn_cache
+        self.sagn_budget = sagn_budget
+        self.sagn_workers = sagn_workers
+        self.sagn_history = sagn_history
+        self.coinciding_mode = coinciding_mode
+        if self.sagn_budget is not None and self.sagn_mode != SagnMode.VARIANTS:
+            raise ValueError("A time budget for skip alignments requires SagnMode.VARIANTS")
+        self.sagn_cut = []
         
         self.variants = self.get_variant_dict(self.aligned_log)
+        self.compiled = CompiledTree(self.tree)
+        self.execution_counts = {} # state -> executions per node
     
     def write(self, obj:Any, path:str, name:str):
         file = open(path + "/" + name,"wb")
@@ -86,13 +113,19 @@ class DerivationPipeline(object):
         else:
             raise ValueError("Not implemented ebi weights method used:", self.pn_method)
         time_start_ns_agns = time.process_time_ns()
-        C, global_C = em.coninciding_agns(skip_dict)
+        if self.coinciding_mode == CoincidingMode.COUNTS:
+            C, global_C = em.coinciding_counts(skip_dict)
+        else:
+            C, global_C = em.coninciding_agns(skip_dict)
         time_stop_ns_agns = time.process_time_ns()
-        self.agn_time = ((time_stop_ns_agns-time_start_ns_agns)/sum(len(v) for k,v in skip_dict.items()), time_stop_ns_agns-time_start_ns_agns) # avg, total
-        em.validate(global_C)
+        sagn_count = sum(len(v) for k,v in skip_dict.items()) # 0 if all variants are cut
+        self.agn_time = ((time_stop_ns_agns-time_start_ns_agns)/max(sagn_count, 1), time_stop_ns_agns-time_start_ns_agns) # avg, total
+        if self.coinciding_mode == CoincidingMode.COUNTS:
+            var_C = em.coinciding_counts_var(global_C)
+        else:
+            var_C = em.coinciding_agns_var(global_C, validate=True)
         self.C = C
         self.global_C = global_C
-        var_C = em.coinciding_agns_var(global_C)
         self.var_C = var_C
         activity_to_id = ebi.write_tree_to_petri(self.tree)
         print(activity_to_id)
@@ -145,12 +178,21 @@ class DerivationPipeline(object):
         print("---=== Skip alignment computation (timeout = " + str(self.sagn_timeout) + "s) ===---")
         print("Avg. number of sagns per trace variant [incl timeouts]:", sum(len(v) for v in self.skip_dict.values())/len(self.variants))
         print("Total number of sagns [incl timeouts]:", sum(len(v) for v in self.skip_dict.values()))
-        print("Avg. time per log trace variant (ns) [no timeouts]:", sum(v for v in self.skip_times.values() if v != -1)/sum(v!=-1 for v in self.skip_times.values()))
+        print("Avg. time per log trace variant (ns) [no timeouts]:", sum(v for v in self.skip_times.values() if v != -1)/max(sum(v!=-1 for v in self.skip_times.values()), 1))
         print("Total time all sagns (ns) [no timeouts]:", sum(v for v in self.skip_times.values() if v != -1))
+        if self.sagn_budget is not None:
+            print("Variants cut by the time budget (" + str(self.sagn_budget) + "s):", len(self.sagn_cut))
+            for v in self.sagn_cut:
+                print("\t", ", ".join(v))
 
         print("---=== Unfolding skip alignments ===---")
-        print("Avg. number of agns for a trace variant [incl timeouts] (ns):", sum(len(v) for v in self.var_C.values())/len(self.var_C))
-        print("Total number of agns [incl timeouts]:", sum(len(v) for v in self.var_C.values()))
+        if self.coinciding_mode == CoincidingMode.COUNTS:
+            # var_C holds the number of agns per model path
+            agn_count = sum(sum(v.values()) for v in self.var_C.values())
+        else:
+            agn_count = sum(len(v) for v in self.var_C.values())
+        print("Avg. number of agns for a trace variant [incl timeouts] (ns):", agn_count/len(self.var_C))
+        print("Total number of agns [incl timeouts]:", agn_count)
         print("Avg. time per set of agns for a skip alignment (ns):", self.agn_time[0])
         print("Total time for all agns (ns):", self.agn_time[1])
 
@@ -200,18 +242,58 @@ class DerivationPipeline(object):
         return variant_probs
 
     # skip alignments
+    def estimate_variant_costs(self, variants:List[List[str]]) -> List[float]:
+        # estimated computation costs of the skip alignments of the variants, used to dispatch the expensive ones first
+        cost_model = VariantCostModel(self.tree, self.sagn_history)
+        return [cost_model.estimate(variant) for variant in variants]
+
     def compute_skip_alignments(self, timeout=600):
         skip_dict = {}
         skip_times = {}
-        Aligner.set_level_incentive(0)
+        level_incentive = 0
+        Aligner.set_level_incentive(level_incentive)
         variant_strings = [list(var) for var in self.variants.keys()]
-        futures = align_sk_all(variant_strings, self.tree, timeout=timeout)
-        for index, variant in enumerate(futures):
-            agns, t = futures[index].result()
+        results = [None]*len(variant_strings)
+        digest = tree_hash(self.tree)
+        codec = StateCodec(Mapper(self.tree))
+        if self.sagn_cache is not None:
+            for index, variant in enumerate(variant_strings):
+                results[index] = self.sagn_cache.get(digest, variant, level_incentive, True, codec)
+        missing = [index for index in range(len(variant_strings)) if results[index] is None]
+        if self.sagn_cache is not None:
+            print("Cached skip alignments for", len(variant_strings)-len(missing), "of", len(variant_strings), "variants.")
+        missing_strings = [variant_strings[index] for index in missing]
+        if self.sagn_budget is not None:
+            frequencies = [self.variants[tuple(variant)] for variant in missing_strings]
+            computed = align_sk_all_budget(missing_strings, frequencies, self.tree, self.sagn_budget, timeout=timeout, max_workers=self.sagn_workers, costs=self.estimate_variant_costs(missing_strings))
+        elif self.sagn_mode == SagnMode.PREFIX_TRIE:
+            # the trie dispatches subtrees of prefixes, not variants, i.e., no costs per variant are needed
+            computed = align_sk_all_trie(missing_strings, self.tree, timeout=timeout, max_workers=self.sagn_workers)
+        else:
+            computed = align_sk_all(missing_strings, self.tree, timeout=timeout, max_workers=self.sagn_workers, costs=self.estimate_variant_costs(missing_strings))
+        for index, (agns, t) in zip(missing, computed):
+            results[index] = (agns, t)
+            if self.sagn_cache is not None and t != -1:
+                # timeouts are retried in the next run
+                self.sagn_cache.put(digest, variant_strings[index], level_incentive, True, agns, t, codec)
+            if self.sagn_history is not None and t != -1 and self.sagn_mode == SagnMode.VARIANTS:
+                # times of the trie mode are shared by prefixes
+                self.sagn_history.record(digest, variant_strings[index], t)
+        if self.sagn_cache is not None:
+            self.sagn_cache.evict()
+        if self.sagn_history is not None:
+            self.sagn_history.save()
+        self.sagn_cut = [tuple(variant_strings[index]) for index, (_, t) in enumerate(results) if t == -1]
+        for index, (agns, t) in enumerate(results):
+            if self.sagn_budget is not None and t == -1:
+                # partial results of cut variants would bias the derivation; without skip alignments they are not counted
+                agns = []
             skip_dict[", ".join(variant_strings[index])] = agns
             skip_times[", ".join(variant_strings[index])] = t
         print("Number of computed optimal skip alignments in normal form:", sum(len(v) for k,v in skip_dict.items()))
         print("Timeouts:", sum(v==-1 for k,v in skip_times.items()))
+        if self.sagn_budget is not None:
+            print("Cut by the time budget:", len(self.sagn_cut), "variants with probability", sum(self.pl.get(v, 0.) for v in self.sagn_cut))
         return skip_dict, skip_times
     
     def rename_sagns(self, states:Dict[str,List[State]]):
@@ -221,6 +303,23 @@ class DerivationPipeline(object):
                 s.name = counter
                 counter += 1
     
+    def executions(self, state:State) -> np.ndarray:
+        """
+        Returns the number of skip and non-skip executions of every node in the skip alignment of state, indexed in the preorder of the compiled tree. The counts are computed once per state.
+        """
+        executions = self.execution_counts.get(state)
+        if executions is None:
+            skips, non_skips = Skipper().execution_counts(self.tree, state, self.compiled)
+            executions = skips + non_skips
+            self.execution_counts[state] = executions
+        return executions
+
+    def node_executions(self, node:ProcessTree, state:State) -> int:
+        """
+        Returns the number of skip and non-skip executions of node in the skip alignment of state.
+        """
+        return self.executions(state)[self.compiled.node_index(node)]
+
     # skip probabilities
     def prob_per_state_and_node(self, node:ProcessTree, state_id:int, variant:tuple[str], skip_prob:Dict[State,Dict[ProcessTree,float]], sagn_prob:Dict[State,float], variant_prob:Dict[tuple[str],float], id_to_skip_dict:Dict[int,State], id_to_skip_dict_backup:Dict[int,State]):
         f1 = skip_prob[id_to_skip_dict_backup[state_id]][node]
@@ -235,9 +334,7 @@ class DerivationPipeline(object):
         # we need to fix the conditional skip alignment probability for those sagns that never reach the node
         prob_of_sagns_reaching_n = 0.
         for s in skip_dict_backup[", ".join(variant)]:
-            skip_cnt = Skipper().count_skip_executions(node, s, 1)
-            nskip_cnt = Skipper().count_non_skip_executions(node, s, 1)
-            prob_of_sagns_reaching_n += ((skip_cnt+nskip_cnt) > 0) * sagn_prob[node][id_to_skip_dict[s.name]]
+            prob_of_sagns_reaching_n += (self.node_executions(node, s) > 0) * sagn_prob[node][id_to_skip_dict[s.name]]
         if prob_of_sagns_reaching_n == 0:
             return 0.
         return prob * 1/prob_of_sagns_reaching_n
@@ -249,26 +346,40 @@ class DerivationPipeline(object):
         # we need to fix the variant probability for those variants that never reach the node (i.e., in no skip alignment)
         prob_of_traces_reaching_n = 0.
         for v in variants.keys():
-            skip_cnt = 0
-            nskip_cnt = 0
+            executions = 0
             for s in skip_dict_backup[", ".join(v)]:
-                skip_cnt += Skipper().count_skip_executions(node, s, 1)
-                nskip_cnt += Skipper().count_non_skip_executions(node, s, 1)
-            prob_of_traces_reaching_n += ((skip_cnt+nskip_cnt) > 0) * variant_prob[v]
+                executions += self.node_executions(node, s)
+            prob_of_traces_reaching_n += (executions > 0) * variant_prob[v]
         if prob_of_traces_reaching_n == 0:
             return 0.
         return prob * 1/prob_of_traces_reaching_n
     
     # skip probabilities
     def recur_node_prob(self, tree:ProcessTree, variants:Dict[tuple[str],int], skip_dict:Dict[str,List[State]], skip_prob:Dict[State,Dict[ProcessTree,float]], sagn_prob:Dict[State,float], variant_prob:Dict[tuple[str],float], id_to_skip_dict:Dict[int,State], id_to_skip_dict_backup:Dict[int,State], skip_dict_backup:Dict[str, List[State]]):
-        result = {}
-        if isinstance(tree, LeafNode):
-            result[tree] = self.prob_per_node(tree, variants, skip_dict, skip_prob, sagn_prob, variant_prob, id_to_skip_dict, id_to_skip_dict_backup, skip_dict_backup)
-            return result
-        else:
-            for c in tree.children:
-                res_tmp = self.recur_node_prob(c, variants, skip_dict, skip_prob, sagn_prob, variant_prob, id_to_skip_dict, id_to_skip_dict_backup, skip_dict_backup)
-                for k,v in res_tmp.items():
-                    result[k] = v
-            result[tree] = self.prob_per_node(tree, variants, skip_dict, skip_prob, sagn_prob, variant_prob, id_to_skip_dict, id_to_skip_dict_backup, skip_dict_backup)
-            return result
+        """
+        Returns prob_per_node for every node of tree (children before their parent). The factors are collected once in matrices with a row per skip alignment and a column per node; the sums over the alignments of a variant and over the variants are then matrix operations.
+        """
+        nodes = self.compiled.nodes
+        skips, agn_probs, reaches, rows, pl = [], [], [], [], []
+        for v in variants.keys():
+            states = skip_dict[", ".join(v)]
+            if len(states) == 0:
+                continue
+            rows.append(len(skips))
+            pl.append(variant_prob[v])
+            for s in states:
+                backup = id_to_skip_dict_backup[s.name]
+                skips.append([skip_prob[backup][n] for n in nodes])
+                agn_probs.append([sagn_prob[n][id_to_skip_dict[s.name]] for n in nodes])
+                reaches.append(self.executions(backup) > 0)
+        probs = np.zeros(len(nodes))
+        if len(rows) > 0:
+            skips, agn_probs, reaches, pl = np.array(skips), np.array(agn_probs), np.array(reaches), np.array(pl)
+            # per variant: P(skip n|v) = sum_a P(skip n|a)*P(a|v)*P(v) / sum_{a reaching n} P(a|v)
+            prob = np.add.reduceat(skips*agn_probs, rows, axis=0) * pl[:,None]
+            prob_of_sagns_reaching_n = np.add.reduceat(reaches*agn_probs, rows, axis=0)
+            prob = np.divide(prob, prob_of_sagns_reaching_n, out=np.zeros_like(prob), where=prob_of_sagns_reaching_n != 0)
+            # we need to fix the variant probability for those variants that never reach the node (i.e., in no skip alignment)
+            prob_of_traces_reaching_n = pl @ (np.add.reduceat(reaches, rows, axis=0) > 0)
+            probs = np.divide(prob.sum(axis=0), prob_of_traces_reaching_n, out=probs, where=prob_of_traces_reaching_n != 0)
+        return {n:float(probs[self.compiled.node_index(n)]) for n in Skipper()._traverse_tree(tree)}
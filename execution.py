@@ -1,4 +1,5 @@
-from typing import Dict, Set
+from math import comb
+from typing import Dict, Iterator, Set, Tuple
 
 from tqdm import tqdm
 from processtree import *
@@ -48,62 +49,113 @@ class ExecutionTree(object):
         return self.__str__()
 
     def all_order_preserving_shuffles(self, *paths):
-        inter = []
-        for comb in itertools.combinations(range(len(paths[0])+len(paths[1])), len(paths[0])):
-            inter.append(self.assign(paths[1], list(zip(comb, paths[0]))))
-        if len(paths) == 2:
-            return inter
-        res = []
-        for new_path in inter:
-            res += self.all_order_preserving_shuffles(new_path, *paths[2:])
-        return res
+        # generator of the interleavings of paths that keep the order within every path
+        for positions in itertools.combinations(range(len(paths[0])+len(paths[1])), len(paths[0])):
+            inter = self.assign(paths[1], list(zip(positions, paths[0])))
+            if len(paths) == 2:
+                yield inter
+            else:
+                yield from self.all_order_preserving_shuffles(inter, *paths[2:])
 
     def assign(self, fillup_list, insert_list):
+        # insert_list: (position, move) pairs sorted by position; fillup_list fills the remaining positions in order
         l = []
+        next_insert = 0
+        next_fillup = 0
         for i in range(len(insert_list)+len(fillup_list)):
-            if len(insert_list) > 0 and insert_list[0][0] == i:
-                l.append(insert_list[0][1])
-                insert_list = insert_list[1:]
+            if next_insert < len(insert_list) and insert_list[next_insert][0] == i:
+                l.append(insert_list[next_insert][1])
+                next_insert += 1
             else:
-                l.append(fillup_list[0])
-                fillup_list = fillup_list[1:]
+                l.append(fillup_list[next_fillup])
+                next_fillup += 1
         return l
+
+    def sync_order_preserving_shuffles(self, sync_rank:Dict[str,int], *paths):
+        # as all_order_preserving_shuffles, but only the interleavings whose sync moves are in the order of sync_rank (label -> position in the log)
+        for inter in self._merge_in_sync_order(paths[0], paths[1], sync_rank):
+            if len(paths) == 2:
+                yield inter
+            else:
+                yield from self.sync_order_preserving_shuffles(sync_rank, inter, *paths[2:])
+
+    def in_sync_order(self, path:List[tuple], sync_rank:Dict[str,int]) -> bool:
+        # True if the sync moves of path are known to sync_rank and strictly increasing in it
+        # a path that is not in sync order stays out of order in every interleaving and concatenation containing it
+        last = -1
+        for l, _ in path:
+            if l != '>>':
+                rank = sync_rank.get(l)
+                if rank is None or rank <= last:
+                    return False
+                last = rank
+        return True
+
+    def _merge_in_sync_order(self, a:List[tuple], b:List[tuple], sync_rank:Dict[str,int]):
+        # depth-first over the merges of a and b; a sync move is only taken before the next sync move of the other path
+        # for a and b in sync order every prefix built this way can be completed, i.e., no merge is started and discarded
+        if not self.in_sync_order(a, sync_rank) or not self.in_sync_order(b, sync_rank):
+            return
+        next_sync = []
+        for path in (a, b):
+            ranks = [float('inf')]*(len(path)+1) # rank of the first sync move in path[i:]
+            for i in range(len(path)-1, -1, -1):
+                ranks[i] = sync_rank[path[i][0]] if path[i][0] != '>>' else ranks[i+1]
+            next_sync.append(ranks)
+        next_a, next_b = next_sync
+        merged = []
+        stack = [(0, 0, None)]
+        while len(stack) > 0:
+            i, j, move = stack.pop()
+            if move is not None:
+                del merged[i+j-1:]
+                merged.append(move)
+            if i == len(a) and j == len(b):
+                yield list(merged)
+                continue
+            # b is pushed first, i.e., moves of a are taken first
+            if j < len(b) and (b[j][0] == '>>' or next_b[j] < next_a[i]):
+                stack.append((i, j+1, b[j]))
+            if i < len(a) and (a[i][0] == '>>' or next_a[i] < next_b[j]):
+                stack.append((i+1, j, a[i]))
+
+    def _product(self, state:State, children:List["ExecutionTree"], sync_rank:Optional[Dict[str,int]]):
+        # generator of the combinations of one partial alignment per child, in the order of itertools.product
+        # the generators of the later children are restarted instead of storing their partial alignments
+        if len(children) == 0:
+            yield []
+            return
+        for path in children[0].shuffle(state, sync_rank):
+            for rest in self._product(state, children[1:], sync_rank):
+                yield [path] + rest
     
-    def shuffle(self, state:State) -> List[List[tuple]]:
+    def shuffle(self, state:State, sync_rank:Optional[Dict[str,int]]=None) -> Iterator[List[tuple]]:
         # computes the reshuffling according to the model semantics
-        # output: List of lists where the inner list is the new partial alignment
-        # TODO: don't even create alignments where there are is disagreement in the log components to the original one
+        # input: sync_rank: sync move label -> position in the log; if given, interleavings that disagree with the log are not generated
+        # output: generator of lists where the list is the new partial alignment
         if isinstance(self.execution.node, LeafNode):
             # no change, return the move
-            return [state.path[self.execution.start:self.execution.stop]]
+            yield list(state.path[self.execution.start:self.execution.stop])
         elif isinstance(self.execution.node, Sequence) or isinstance(self.execution.node, Loop):
             # no change, fix order
-            res_c = []
-            for c in self.children:
-                res_c.append(c.shuffle(state))
-            res = []
-            for path in list(itertools.product(*res_c)):
+            for path in self._product(state, self.children, sync_rank):
                 # path = [ [agn1 for c1], [agn1 for c2], ... ]
                 agn = []
                 for sub_path in path:
                     agn += sub_path
-                res.append(agn)
-            return res
+                if sync_rank is None or self.in_sync_order(agn, sync_rank):
+                    yield agn
         elif isinstance(self.execution.node, Xor):
             # no change, fix selection
-            return self.children[0].shuffle(state)
+            yield from self.children[0].shuffle(state, sync_rank)
         elif isinstance(self.execution.node, And):
             # changes order
-            res_c = []
-            for c in self.children:
-                res_c.append(c.shuffle(state))
-            # res_c is [ [ [agn1 for c1], [agn2 for c1], ... ], [ [agn1 for c2], [agn2 for c2], ... ], ...]
-            #            child1 c1                              child2 c2
-            res = []
-            for path in list(itertools.product(*res_c)):
+            for path in self._product(state, self.children, sync_rank):
                 # path = [ [agn1 for c1], [agn1 for c2], ... ]
-                res += self.all_order_preserving_shuffles(*path)
-            return res
+                if sync_rank is None:
+                    yield from self.all_order_preserving_shuffles(*path)
+                else:
+                    yield from self.sync_order_preserving_shuffles(sync_rank, *path)
         else:
             raise ValueError("Execution is covering an unexpected type of node:", self.execution.node)
 
@@ -111,160 +163,192 @@ class ExecutionManager(object):
     def __init__(self):
         pass
 
-    def correct_to_narrowest_moves(self, state:State):
-        # we might need to narrow in the execution indices
-        for i in range(len(state.executions)):
-            while state.executions[i].stop > state.executions[i].start:
-                # log move on start
-                if state.path[state.executions[i].start][1] == '>>':
-                    state.executions[i].start += 1
-                # log move on stop
-                elif state.path[state.executions[i].stop-1][1] == '>>':
-                    state.executions[i].stop -= 1
-                # not contained node, Skip or Taupath
-                elif (isinstance(state.path[state.executions[i].start][1], Skip) or isinstance(state.path[state.executions[i].start][1], TauPath)) and not state.executions[i].node.contains_tree(state.path[state.executions[i].start][1].node):
-                    state.executions[i].start += 1
-                # not contained node, Skip or Taupath
-                elif (isinstance(state.path[state.executions[i].stop-1][1], Skip) or isinstance(state.path[state.executions[i].stop-1][1], TauPath)) and not state.executions[i].node.contains_tree(state.path[state.executions[i].stop-1][1].node):
-                    state.executions[i].stop -= 1
-                # not contained node
-                elif not isinstance(state.path[state.executions[i].start][1], Skip) and not isinstance(state.path[state.executions[i].start][1], TauPath) and not state.executions[i].node.contains_tree(state.path[state.executions[i].start][1]):
-                    state.executions[i].start += 1
-                # not contained node
-                elif not isinstance(state.path[state.executions[i].stop-1][1], Skip) and not isinstance(state.path[state.executions[i].stop-1][1], TauPath) and not state.executions[i].node.contains_tree(state.path[state.executions[i].stop-1][1]):
-                    state.executions[i].stop -= 1
-                else:
-                    break
-    
-    def remove_log_moves(self, state:State):
-        # expects correct_to_narrowest_moves before
-        i = 0
+    def normalize(self, state:State):
+        # narrows the executions to their outermost contained moves and removes the log moves in one pass over the path
+        # the containment checks are index comparisons in the compiled tree; the bounds of the executions are shifted by the number of log moves before them
+        compiled = state.mapper.compiled
+        path = list(state.path)
+        n = len(path)
+        node_index = [] # compiled index of the model node of every move, -1 for log moves and nodes not in the tree
+        rank = [] # 0 for log moves, 1 for Skips and TauPaths, 2 otherwise: the order in which not contained moves are removed at the bounds
+        log_before = [0] # number of log moves before every position
+        new_path = []
         log_moves = []
         log_path = []
-        while i < len(state.path):
-            if state.path[i][1] == '>>':
-                log_moves.append(state.path[i][0] + str(len(log_path)))
-                log_path.append(state.path[i][0] + str(len(log_path)))
-                for exec in state.executions:
-                    if exec.start < i and exec.stop > i:
-                        # ........ logmove .......
-                        # start... stop    ....... -> is okay, as only part before logmove contains execution
-                        # start............stop... -> deduce end position
-                        exec.stop -= 1
-                    elif exec.start > i:
-                        exec.start -= 1
-                        exec.stop -= 1
-                    # i is never a start position after applying correct_to_narrowest_moves
-                state.path.pop(i)
+        for l, m in path:
+            if m == '>>':
+                node_index.append(-1)
+                rank.append(0)
+                log_moves.append(l + str(len(log_path)))
+                log_path.append(l + str(len(log_path)))
+                log_before.append(log_before[-1] + 1)
+                continue
+            skip = isinstance(m, Skip) or isinstance(m, TauPath)
+            index = compiled.index.get(m.node if skip else m)
+            node_index.append(-1 if index is None else index)
+            rank.append(1 if skip else 2)
+            log_before.append(log_before[-1])
+            if l != '>>':
+                # sync move
+                l = l + str(len(log_path))
+                log_path.append(l)
+            new_path.append((l, m))
+        # only needed for executions without contained moves
+        # next_above[r][p]: first position >= p of rank > r; last_from[r][p]: one after the last position < p of rank >= r
+        next_above = [[n]*(n+1) for _ in range(2)]
+        last_from = [[0]*(n+1) for _ in range(3)]
+        for p in range(n-1, -1, -1):
+            for r in range(2):
+                next_above[r][p] = p if rank[p] > r else next_above[r][p+1]
+        for p in range(1, n+1):
+            for r in range(3):
+                last_from[r][p] = p if rank[p-1] >= r else last_from[r][p-1]
+        for execution in state.executions:
+            i = compiled.index.get(execution.node)
+            start, stop = execution.start, execution.stop
+            first = None if i is None else next((p for p in range(start, stop) if i <= node_index[p] <= compiled.last[i]), None)
+            if first is not None:
+                # outermost contained moves
+                last = next(p for p in range(stop-1, first-1, -1) if i <= node_index[p] <= compiled.last[i])
+                start, stop = first, last+1
             else:
-                if state.path[i][0] != '>>':
-                    # sync move
-                    state.path[i] = (state.path[i][0] + str(len(log_path)), state.path[i][1])
-                    log_path.append(state.path[i][0])
-                i += 1
+                # the bound of lower rank is removed, the start on ties; runs of moves are removed at once
+                while stop > start:
+                    if rank[start] <= rank[stop-1]:
+                        start = next_above[rank[stop-1]][start] if rank[stop-1] < 2 else stop
+                        start = min(start, stop)
+                    else:
+                        stop = max(last_from[rank[start]][stop], start)
+            execution.start = start - log_before[start]
+            execution.stop = stop - log_before[stop]
+        state.path = new_path
         return log_moves, log_path
     
     def build_execution_tree(self, state:State, node:Execution=None) -> ExecutionTree:
-        # expects remove_log_moves before
-        state.executions = sorted(state.executions, key=lambda x:(x.start, -x.stop, x.node.get_distance_to_root()))
+        # expects normalize before
+        # one sweep over the executions sorted by (start, -stop, depth): the executions of a node are disjoint, i.e., the parent of an
+        # execution is the last execution of the parent node, if it contains the execution; the branches of an And interleave, so
+        # the nesting of the intervals alone does not determine the parent
+        state.executions = sorted(state.executions, key=lambda x:(x.start, -x.stop, state.mapper.compiled.distance_to_root(x.node)))
 
         if node is None:
             node = state.executions[0]
-            state.executions.remove(node)
-        
+            executions = state.executions[1:]
+        else:
+            executions = state.executions
+
         tree = ExecutionTree(None, [], node)
+        last = {node.node:tree} # node -> last execution tree of node
+        unused = []
+        for execution in executions:
+            parent = last.get(execution.node.parent)
+            if parent is None or not (parent.execution.start <= execution.start and parent.execution.stop >= execution.stop):
+                unused.append(execution)
+                continue
+            parent_node = parent.execution.node
+            if isinstance(parent_node, Xor) and len(parent.children) > 0:
+                unused.append(execution)
+            elif (isinstance(parent_node, Sequence) or isinstance(parent_node, And)) and any(c.execution.node == execution.node for c in parent.children):
+                unused.append(execution)
+            else:
+                tree_c = ExecutionTree(None, [], execution)
+                parent.children.append(tree_c)
+                tree_c.set_parent(parent)
+                last[execution.node] = tree_c
+        state.executions = unused
+
+        # children of Sequence and And in the order of the model, the children of a Loop in the order of the executions
+        stack = [tree]
+        while len(stack) > 0:
+            t = stack.pop()
+            if isinstance(t.execution.node, Sequence) or isinstance(t.execution.node, And):
+                assert len(t.children) == len(t.execution.node.children)
+                position = {c:i for i, c in enumerate(t.execution.node.children)}
+                t.children.sort(key=lambda c:position[c.execution.node])
+            elif isinstance(t.execution.node, Xor):
+                assert len(t.children) == 1
+            elif isinstance(t.execution.node, Loop):
+                assert len(t.children) > 0
+            elif not isinstance(t.execution.node, LeafNode):
+                raise ValueError("Unexpected type of execution found:", t.execution)
+            stack += t.children
+        return tree
+
+    def _log_gaps(self, log_moves:List[str], log_path:List[str]) -> Tuple[Dict[str,int], List[List[tuple]]]:
+        # output: sync_rank: sync move label -> position among the sync moves of the log
+        #         gaps:      log moves before the i-th sync move of the log, the last entry after the last sync move
+        log_move_set = set(log_moves)
+        sync_rank = {}
+        gaps = [[]]
+        for l in log_path:
+            if l in log_move_set:
+                gaps[-1].append((l, '>>'))
+            else:
+                sync_rank[l] = len(sync_rank)
+                gaps.append([])
+        return sync_rank, gaps
+
+    def _model_interleavings(self, state:State, log_moves:List[str], log_path:List[str], execution_tree:ExecutionTree):
+        # output: generator of the distinct interleavings of the execution tree whose sync moves are exactly the sync moves of the log
+        # the execution tree never yields an interleaving twice, i.e., nothing is stored to drop duplicates: the children of an And cover
+        # disjoint subtrees, so an interleaving of their partial alignments determines the partial alignment of every child and the
+        # positions of its moves, and Sequences and Loops concatenate partial alignments of fixed lengths
+        sync_rank, _ = self._log_gaps(log_moves, log_path)
+        sync_moves_log = list(sync_rank)
+        for agn in execution_tree.shuffle(state, sync_rank):
+            # agn is a list of pairs, not a state
+            if [l for l,_ in agn if l != '>>'] == sync_moves_log:
+                yield agn
 
-        if isinstance(tree.execution.node, LeafNode):
-            return tree
-        if isinstance(tree.execution.node, Sequence) or isinstance(tree.execution.node, And):
-            # search for the children in bounds of tree.execution
-            for c in tree.execution.node.children:
-                tree_c = None
-                for i in range(len(state.executions)):
-                    if state.executions[i].node == c and tree.execution.start <= state.executions[i].start and tree.execution.stop >= state.executions[i].stop:
-                        exec_c = state.executions.pop(i)
-                        tree_c = self.build_execution_tree(state, exec_c)
-                        break
-                assert tree_c is not None
-                tree.children.append(tree_c)
-                tree_c.set_parent(tree)
-            return tree
-        if isinstance(tree.execution.node, Xor):
-            # search for the executed child in bounds of tree.execution
-            tree_c = None
-            for i in range(len(state.executions)):
-                if state.executions[i].node.parent == tree.execution.node and tree.execution.start <= state.executions[i].start and tree.execution.stop >= state.executions[i].stop:
-                    exec_c = state.executions.pop(i)
-                    tree_c = self.build_execution_tree(state, exec_c)
-                    break
-            assert tree_c is not None
-            tree.children.append(tree_c)
-            tree_c.set_parent(tree)
-            return tree
-        if isinstance(tree.execution.node, Loop):
-            # search for all executed children in bounds of tree.execution
-            # note that they already appear in appropriate order in the execution
-            i = 0
-            tree_c = []
-            while i < len(state.executions) and state.executions[i].start < tree.execution.stop:
-                if state.executions[i].node.parent == tree.execution.node and tree.execution.start <= state.executions[i].start and tree.execution.stop >= state.executions[i].stop:
-                    exec_c = state.executions.pop(i)
-                    tree_c.append(self.build_execution_tree(state, exec_c))
-                else:
-                    i += 1
-            assert len(tree_c) > 0
-            tree.children = tree_c
-            for c in tree_c:
-                c.set_parent(tree)
-            return tree
-        raise ValueError("Unexpected type of execution found:", tree.execution)
-    
     def shuffle(self, state:State, log_moves:List[str], log_path:List[str], execution_tree:ExecutionTree):
         # state is representing an alignment, not a skip alignment
         # state is not modified but used to copy the data
         # output: generator that yields all the coinciding optimal alignments for an optiaml skip alignment
-        sync_moves_log = [l for l in log_path if l not in log_moves]
-        coinciding_agns = execution_tree.shuffle(state)
-        for agn in coinciding_agns:
-            # agn is a list of pairs, not a state
-            if [l for l,_ in agn if l != '>>'] == sync_moves_log:
-                # merge in log moves
-                base_agn = [[(l, m) for l,m in agn]]
-                new_base = []
-                for l in log_moves:
-                    for a in base_agn:
-                        merge_start = 0
-                        merge_end = len(a)
-                        log_path_copy = [str(s) for s in log_path]
-                        #print(log_moves, log_path)
-                        while merge_start < len(a):
-                            #print("merge_start =", merge_start, a[merge_start][0])
-                            if a[merge_start][0] == '>>' or a[merge_start][0] == log_path_copy[0]:
-                                if a[merge_start][0] == log_path_copy[0]:
-                                    log_path_copy = log_path_copy[1:]
-                                merge_start += 1
-                            else:
-                                break
-                        # go back to the last '>>'
-                        while merge_start > 0 and a[merge_start-1][0] == '>>':
-                            merge_start -= 1
-                        # possibly there is no move with '>>' to sink in, so start at merge_start
-                        merge_end = merge_start
-                        while merge_end < len(a):
-                            if a[merge_end][0] == '>>':
-                                merge_end += 1
-                            else:
-                                break
-                        #print("Merging", l, "at", merge_start, merge_end, "into", a)
-                        for sink_in in execution_tree.all_order_preserving_shuffles(a[merge_start:merge_end], [(l, '>>')]):
-                            new_base.append(a[:merge_start] + sink_in + a[merge_end:])
-                    base_agn = [[(m1,m2) for m1,m2 in na] for na in new_base]
-                    new_base = []
-                for a in base_agn:
-                    if [l for l,_ in a if l != '>>'] == log_path:
-                        yield a
+        # the log moves between two sync moves of the log are placed directly among the model moves between these sync moves,
+        # every placement keeps the order of the log, i.e., no alignment is built and filtered out afterwards
+        _, gaps = self._log_gaps(log_moves, log_path)
+        for agn in self._model_interleavings(state, log_moves, log_path, execution_tree):
+            # model moves before every sync move of agn, the last entry after the last sync move
+            segments = [[]]
+            sync_moves = []
+            for move in agn:
+                if move[0] == '>>':
+                    segments[-1].append(move)
+                else:
+                    sync_moves.append(move)
+                    segments.append([])
+            merges = [list(execution_tree.all_order_preserving_shuffles(gap, segment)) for gap, segment in zip(gaps, segments)]
+            for merged in itertools.product(*merges):
+                a = list(merged[0])
+                for sync_move, m in zip(sync_moves, merged[1:]):
+                    a.append(sync_move)
+                    a += m
+                yield a
         return
     
+    def shuffle_counts(self, state:State, log_moves:List[str], log_path:List[str], execution_tree:ExecutionTree) -> Dict[tuple,int]:
+        # counts the coinciding optimal alignments of shuffle without merging in the log moves
+        # shuffle places the k log moves between two sync moves of the log among the m model moves between these sync moves
+        # in C(k+m, k) ways, which do not change the model path
+        # output: model path -> number of coinciding optimal alignments with this model path
+        _, gaps = self._log_gaps(log_moves, log_path)
+        counts = {}
+        for agn in self._model_interleavings(state, log_moves, log_path, execution_tree):
+            multiplicity = 1
+            gap = 0
+            model_moves = 0
+            for l, _ in agn:
+                if l == '>>':
+                    model_moves += 1
+                else:
+                    multiplicity *= comb(len(gaps[gap])+model_moves, model_moves)
+                    gap += 1
+                    model_moves = 0
+            multiplicity *= comb(len(gaps[gap])+model_moves, model_moves)
+            model_path = tuple([m for _,m in agn])
+            counts[model_path] = counts.get(model_path, 0) + multiplicity
+        return counts
+
     def coninciding_agns(self, skip_dict:Dict[str, List[State]]):
         C = {} # state -> set(agns); state can be a skip alignment or an unfolded skip alignment
         global_C = {} # var -> list(set(agns)); list of sets of coinciding agns for the sagns in nf per variant
@@ -272,35 +356,76 @@ class ExecutionManager(object):
         for var, states in tqdm(skip_dict.items()):
             already_found = []
             for state in states:
-                self.correct_to_narrowest_moves(state)
-                log_moves, log_path = self.remove_log_moves(state)
-                for s in state.unfold():
+                log_moves, log_path = self.normalize(state)
+                unfolded = state.unfold()
+                for s in unfolded:
                     exec_tree = self.build_execution_tree(s.copy())
                     C_state = self.shuffle(s, log_moves, log_path, exec_tree)
-                    C[s] = frozenset([tuple(c) for c in C_state])
-                    if state not in C:
-                        C[state] = C[s]
-                    else:
-                        C[state] = frozenset(set(C[state]).union(set(C[s])))
+                    C[s] = frozenset(tuple(c) for c in C_state)
                     already_found.append(C[s])
-            ratio_per_var.append(sum(len(x) for x in already_found)/len(states))
+                # one union of the sets of the unfolded sagns
+                C[state] = already_found[-1] if len(unfolded) == 1 else frozenset().union(*already_found[-len(unfolded):])
+            if len(states) > 0:
+                # variants cut by the budget or timed out have no sagns
+                ratio_per_var.append(sum(len(x) for x in already_found)/len(states))
             global_C[var] = already_found
-        print("Compression in skip alignments was 1 :", sum(ratio_per_var)/len(ratio_per_var))
+        if len(ratio_per_var) > 0:
+            print("Compression in skip alignments was 1 :", sum(ratio_per_var)/len(ratio_per_var))
         return C, global_C
     
+    def coinciding_counts(self, skip_dict:Dict[str, List[State]]) -> Tuple[Dict[State,Dict[tuple,int]], Dict[str,List[Dict[tuple,int]]]]:
+        # as coninciding_agns, but only the number of coinciding agns per model path is computed
+        # the coinciding agns of different sagns are disjoint (see validate), i.e., their counts add up
+        C = {} # state -> model path -> number of coinciding agns
+        global_C = {} # var -> list(model path -> number of coinciding agns) for the sagns in nf per variant
+        ratio_per_var = []
+        for var, states in tqdm(skip_dict.items()):
+            already_found = []
+            for state in states:
+                log_moves, log_path = self.normalize(state)
+                state_counts = {}
+                for s in state.unfold():
+                    exec_tree = self.build_execution_tree(s.copy())
+                    C[s] = self.shuffle_counts(s, log_moves, log_path, exec_tree)
+                    for model_path, count in C[s].items():
+                        state_counts[model_path] = state_counts.get(model_path, 0) + count
+                    already_found.append(C[s])
+                C[state] = state_counts
+            if len(states) > 0:
+                # variants cut by the budget or timed out have no sagns
+                ratio_per_var.append(sum(sum(x.values()) for x in already_found)/len(states))
+            global_C[var] = already_found
+        if len(ratio_per_var) > 0:
+            print("Compression in skip alignments was 1 :", sum(ratio_per_var)/len(ratio_per_var))
+        return C, global_C
+
+    def owners(self, var:str, agns:List[Set[List|tuple]], validate:bool=True) -> Dict[tuple,int]:
+        # single pass over the sets of coinciding agns of the sagns of var
+        # output: agn -> index of the set in agns owning it; with validate, an agn owned by two sets raises a ValueError
+        owner = {}
+        for i, fs in enumerate(agns):
+            for agn in fs:
+                if owner.setdefault(agn, i) != i and validate:
+                    raise ValueError("Overlap in coinciding agns violating theorem:", var)
+        return owner
+
     def validate(self, global_C:Dict[str, Set[List[List|tuple]]]):
         for var, agns in global_C.items():
-            for i in range(len(agns)):
-                for j in range(i+1, len(agns)):
-                    if len(set(agns[i]).intersection(set(agns[j]))) > 0:
-                        raise ValueError("Overlap in coinciding agns violating theorem:", var)
+            self.owners(var, agns)
         return
     
-    def coinciding_agns_var(self, global_C:Dict[str, List[Set[List|tuple]]]):
-        var_C = {} # var -> set(agns)
+    def coinciding_agns_var(self, global_C:Dict[str, List[Set[List|tuple]]], validate:bool=False):
+        # with validate, validate(global_C) is checked in the same pass
+        var_C = {} # var -> list(agns)
+        for k, v in global_C.items():
+            var_C[k] = list(self.owners(k, v, validate))
+        return var_C
+
+    def coinciding_counts_var(self, global_C:Dict[str, List[Dict[tuple,int]]]):
+        var_C = {} # var -> model path -> number of coinciding agns
         for k, v in global_C.items():
-            var_C[k] = set()
-            for fs in v:
-                var_C[k] = var_C[k].union(set(fs))
-            var_C[k] = list(var_C[k])
-        return var_C
\ No newline at end of file
+            var_C[k] = {}
+            for counts in v:
+                for model_path, count in counts.items():
+                    var_C[k][model_path] = var_C[k].get(model_path, 0) + count
+        return var_C
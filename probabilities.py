@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Tuple
 from processtree import *
 from alignment import *
 import random
@@ -156,13 +156,16 @@ class EbiOccurance(object):
                 raise ValueError(f"Could not parse Ebi return value: {res}")
         return resprob, (time_end-time_start)
     
-    def trace_probs(self, agns:Dict[str, List[List|tuple]], measure:Optional[Dict[List[str], float]]=None, model='smodel.slpn'):
-        # input: agns:    var -> List[agn]
+    def trace_probs(self, agns:Dict[str, List[List|tuple]|Dict[tuple,int]], measure:Optional[Dict[List[str], float]]=None, model='smodel.slpn'):
+        # input: agns:    var -> List[agn], or var -> pi2(agn) -> int if only the number of agns is known (see ExecutionManager.coinciding_counts_var)
         #        measure: var id list -> model prob
         # output: pi2(agn) IDS -> float, var -> pi2(agn) -> int
         trace_counts = {}
         trace_probs_d = {}
         for var, ass in tqdm(agns.items()):
+            if isinstance(ass, dict):
+                trace_counts[var] = dict(ass)
+                continue
             if var not in trace_counts:
                 trace_counts[var] = {}
             for agn in ass:
@@ -172,9 +175,8 @@ class EbiOccurance(object):
                 else:
                     trace_counts[var][model_path] = trace_counts[var][model_path] + 1
         if measure is not None:
-            for var, ass in tqdm(agns.items()):
-                for agn in ass:
-                    model_path = tuple([m for m in list(zip(*agn))[1] if m != '>>'])
+            for var, model_paths in tqdm(trace_counts.items()):
+                for model_path in model_paths:
                     model_path_ids = tuple([n.id for n in model_path])
                     if not model_path_ids in trace_probs_d:
                         trace_probs_d[model_path_ids] = measure[model_path_ids]
@@ -184,9 +186,8 @@ class EbiOccurance(object):
         with ProcessPoolExecutor(max_workers=14) as executor:
             futures = []
             checked_ids = []
-            for var, ass in tqdm(agns.items()):
-                for agn in ass:
-                    model_path = tuple([m for m in list(zip(*agn))[1] if m != '>>'])
+            for var, model_paths in tqdm(trace_counts.items()):
+                for model_path in model_paths:
                     model_path_ids = tuple([n.id for n in model_path])
                     if not model_path_ids in checked_ids:
                         futures.append(executor.submit(self.ebi_trace_prob, 
@@ -204,54 +205,79 @@ class EbiOccurance(object):
                 total_time += needed_time
         return trace_probs_d, trace_counts, total_time
     
-    def _skip_agn_probs(self, state:State, node:ProcessTree, var:str, agns:Set[List|tuple], trace_probs:Dict[List[LeafNode], float], trace_counts:Dict[List[LeafNode], int]):
-        prob = 0 # skip agn prob
-        if not node.id in [e.node.id for e in state.executions]+[m.node.id for l,m in state.path if isinstance(m,Skip)]+[m.node.id for l,m in state.path if isinstance(m,TauPath)]:
-            return prob
-        for agn in agns:
-            model_path = tuple([m for m in list(zip(*agn))[1] if m != '>>'])
-            model_path_ids = tuple([n.id for n in model_path])
-            prob += trace_probs[model_path_ids]/trace_counts[var][model_path]
-        return prob
-    
-    def skip_agn_probs_per_node(self, node:ProcessTree, skip_dict:Dict[str,List[State]], C:Dict[State,Set[List|tuple]], trace_probs:Dict[tuple,float], trace_counts:Dict[tuple,int]):
+    def _touched_nodes(self, state:State) -> Set[str]:
+        # ids of the nodes executed, skipped or passed by a tau path in the skip alignment
+        return set([e.node.id for e in state.executions]+[m.node.id for l,m in state.path if isinstance(m,Skip) or isinstance(m,TauPath)])
+
+    def sagn_index(self, skip_dict:Dict[str,List[State]], C:Dict[State,Set[List|tuple]|Dict[tuple,int]], trace_probs:Dict[tuple,float], trace_counts:Dict[tuple,int]) -> Tuple[Dict[State,float], Dict[State,Set[str]]]:
+        # input: as skip_agn_probs_per_node
+        # output: base_score: sagn -> sum(partial prob of coinciding agns), i.e., the score of the nodes touched by sagn
+        #         touched:    sagn -> ids of the nodes touched by sagn
+        base_score = {}
+        touched = {}
+        for var, states in skip_dict.items():
+            for state in states:
+                prob = 0
+                if isinstance(C[state], dict):
+                    # number of coinciding agns per model path
+                    for model_path, count in C[state].items():
+                        prob += count*trace_probs[tuple([n.id for n in model_path])]/trace_counts[var][model_path]
+                else:
+                    for agn in C[state]:
+                        model_path = tuple([m for m in list(zip(*agn))[1] if m != '>>'])
+                        model_path_ids = tuple([n.id for n in model_path])
+                        prob += trace_probs[model_path_ids]/trace_counts[var][model_path]
+                base_score[state] = prob
+                touched[state] = self._touched_nodes(state)
+        return base_score, touched
+
+    def skip_agn_probs_per_node(self, node:ProcessTree, skip_dict:Dict[str,List[State]], C:Dict[State,Set[List|tuple]], trace_probs:Dict[tuple,float], trace_counts:Dict[tuple,int], index:Optional[Tuple[Dict[State,float], Dict[State,Set[str]]]]=None):
         # input: node:         node to calculate for
         #        skip_dict:    var -> List[sagn]
-        #        C:            sagn -> Set[agn] coinciding agns
+        #        C:            sagn -> Set[agn] coinciding agns, or sagn -> pi2(agn) -> int (see ExecutionManager.coinciding_counts)
         #        trace_probs:  pi2(agn) -> float
         #        trace_counts: pi2(agn) -> int
+        #        index:        output of sagn_index, computed if None
         # output: score_sagn:  sagn -> sum(partial prob of coinciding agns)
         #         cond_prob:   sagn -> P(sagn|var)
+        if index is None:
+            index = self.sagn_index(skip_dict, C, trace_probs, trace_counts)
+        base_score, touched = index
         score_sagn = {}
         cond_prob = {}
         for var, states in skip_dict.items():
+            total = 0
             for state in states:
-                score_sagn[state] = self._skip_agn_probs(state, node, var, C[state], trace_probs, trace_counts)
+                score_sagn[state] = base_score[state] if node.id in touched[state] else 0
+                total += score_sagn[state]
             for state in states:
-                cond_prob[state] = score_sagn[state]/sum(score_sagn[s] for s in states) if sum(score_sagn[s] for s in states) > 0 else 0.0
+                cond_prob[state] = score_sagn[state]/total if total > 0 else 0.0
         return score_sagn, cond_prob
     
-    def skip_agn_probs_traversal(self, tree:ProcessTree, skip_dict:Dict[str,List[State]], C:Dict[State,Set[List|tuple]], trace_probs:Dict[tuple,float], trace_counts:Dict[tuple,int]):
+    def skip_agn_probs_traversal(self, tree:ProcessTree, skip_dict:Dict[str,List[State]], C:Dict[State,Set[List|tuple]], trace_probs:Dict[tuple,float], trace_counts:Dict[tuple,int], index:Optional[Tuple[Dict[State,float], Dict[State,Set[str]]]]=None):
         # input: tree:         process tree whose nodes are alanyzed
         #        skip_dict:    var -> List[sagn]
         #        C:            sagn -> Set[agn] coinciding agns
         #        trace_probs:  pi2(agn) -> float
         #        trace_counts: pi2(agn) -> int
+        #        index:        output of sagn_index, computed once for all nodes if None
         # output: score_sagn:  sagn -> sum(partial prob of coinciding agns)
         #         cond_prob:   sagn -> P(sagn|var)
+        if index is None:
+            index = self.sagn_index(skip_dict, C, trace_probs, trace_counts)
         score_sagn = {}
         cond_prob = {}
         if isinstance(tree, LeafNode):
-            score, cprob = self.skip_agn_probs_per_node(tree, skip_dict, C, trace_probs, trace_counts)
+            score, cprob = self.skip_agn_probs_per_node(tree, skip_dict, C, trace_probs, trace_counts, index)
             score_sagn[tree] = score
             cond_prob[tree] = cprob
             return score_sagn, cond_prob
         else:
-            score, cprob = self.skip_agn_probs_per_node(tree, skip_dict, C, trace_probs, trace_counts)
+            score, cprob = self.skip_agn_probs_per_node(tree, skip_dict, C, trace_probs, trace_counts, index)
             score_sagn[tree] = score
             cond_prob[tree] = cprob
             for c in tree.children:
-                nscore, ncprob = self.skip_agn_probs_traversal(c, skip_dict, C, trace_probs, trace_counts)
+                nscore, ncprob = self.skip_agn_probs_traversal(c, skip_dict, C, trace_probs, trace_counts, index)
                 for k,v in nscore.items():
                     score_sagn[k] = v
                 for k,v in ncprob.items():
@@ -12,20 +12,79 @@ class ProcessTree(object):
     Pseudostructures are provided for skips (Sskip, TauPath).
     """
     __metaclass__ = abc.ABCMeta
-    parent:Optional["ProcessTree"] = None
-    children:List["ProcessTree"] = []
 
     id:str = ""
 
     def __init__(self, parent:"ProcessTree"=None, children:List["ProcessTree"]=[]) -> None:
-        self.parent = parent
-        self.children = children
+        self._parent = parent
+        self._children = children
+        # derived properties, computed on first use
         self.leafs = None
         self.leaf_labels = None
+        self.max_depth = None
+        self.cheapest = None # (cost, only Taus?) of the cheapest execution without level incentive
+        self.distance_to_root = None
+
+    def __setstate__(self, state:dict):
+        # trees pickled before parent and children became properties store them as plain attributes and lack the later caches
+        state = dict(state)
+        for name in ("parent", "children"):
+            if name in state:
+                state["_" + name] = state.pop(name)
+        for name in ("leafs", "leaf_labels", "max_depth", "cheapest", "distance_to_root"):
+            state.setdefault(name, None)
+        self.__dict__.update(state)
+
+    @property
+    def parent(self) -> Optional["ProcessTree"]:
+        return self._parent
+
+    @parent.setter
+    def parent(self, parent:Optional["ProcessTree"]):
+        old_parent = self._parent
+        self._parent = parent
+        self.invalidate_distances()
+        for node in (old_parent, parent):
+            if node is not None:
+                node.invalidate()
+
+    @property
+    def children(self) -> List["ProcessTree"]:
+        """
+        Child nodes. Assign a new list to change them; in-place changes of the list require a call of invalidate().
+        """
+        return self._children
+
+    @children.setter
+    def children(self, children:List["ProcessTree"]):
+        self._children = children
+        self.invalidate()
     
     def set_parent(self, parent:"ProcessTree"):
         self.parent = parent
 
+    def invalidate(self):
+        """
+        Drops the cached properties depending on the subtree, i.e., leafs, leaf labels, depth and cheapest execution, of this node and all its ancestors.
+        """
+        node = self
+        while node is not None:
+            node.leafs = None
+            node.leaf_labels = None
+            node.max_depth = None
+            node.cheapest = None
+            node = node._parent
+
+    def invalidate_distances(self):
+        """
+        Drops the cached distances to the root of all nodes in this subtree.
+        """
+        stack = [self]
+        while len(stack) > 0:
+            node = stack.pop()
+            node.distance_to_root = None
+            stack += node._children
+
     @staticmethod
     def from_pm4py(process_tree:pm4py.objects.process_tree.obj.ProcessTree, model_move_activity_cost:int, model_move_tau_cost:int, sync_move_cost:int, id:str="0"):
         """
@@ -170,24 +229,32 @@ class ProcessTree(object):
         """        
         if isinstance(self, Skip) or isinstance(self, TauPath):
             return self.node.get_max_depth()
+        if self.max_depth is not None:
+            return self.max_depth
         if isinstance(self, LeafNode):
-            return 0
+            self.max_depth = 0
         else:
             max_depth = 0
             for c in self.children:
                 max_depth = max(max_depth, c.get_max_depth())
-            return max_depth+1
+            self.max_depth = max_depth+1
+        return self.max_depth
     
     def get_distance_to_root(self):
         """
         Returns the level of the current subtree.
         """
-        if self.parent is None:
-            return 0
-        return self.parent.get_distance_to_root() + 1
+        if self.distance_to_root is None:
+            self.distance_to_root = 0 if self.parent is None else self.parent.get_distance_to_root() + 1
+        return self.distance_to_root
     
     def _get_cheapest_execution(self, level_incentive:int):
-        # returns (cost, only Taus?)
+        # returns (cost, only Taus?), the level incentive is applied only on top
+        if self.cheapest is None:
+            self.cheapest = self._compute_cheapest_execution(level_incentive)
+        return self.cheapest
+
+    def _compute_cheapest_execution(self, level_incentive:int):
         if isinstance(self, Tau):
             #return (self.skip_cost, True)
             return (0, True) # TAUs produce no costs
@@ -428,3 +495,138 @@ class Execution(object):
     
     def __repr__(self) -> str:
         return self.__str__()
+
+class CompiledTree(object):
+    """
+    Flat array representation of a process tree for the hot paths of the alignment computation.
+    Nodes are numbered in preorder, i.e., the subtree of node i spans the indices i, ..., last[i] (Euler tour interval). This allows for constant time subtree containment checks without pointer chasing.
+    """
+    SEQUENCE = 0
+    XOR = 1
+    AND = 2
+    LOOP = 3
+    ACTIVITY = 4
+    TAU = 5
+
+    def __init__(self, tree:ProcessTree) -> None:
+        self.tree = tree
+        self.nodes:List[ProcessTree] = [] # index -> node
+        self.parent:List[int] = [] # index -> index of parent, -1 for the root
+        self.children:List[List[int]] = [] # index -> indices of children
+        self.types:List[int] = [] # index -> node type code
+        self.depth:List[int] = [] # index -> distance to root
+        self.last:List[int] = [] # index -> largest index in the subtree
+        self.loops:List[List[int]] = [] # index -> indices of all Loop nodes on the path to the root, nearest first
+        self.index = {} # node -> index
+        self.ids = {} # node id -> index
+        self._compile()
+
+    def _compile(self):
+        stack = [(self.tree, -1)]
+        while len(stack) > 0:
+            node, parent = stack.pop()
+            i = len(self.nodes)
+            self.nodes.append(node)
+            self.index[node] = i
+            self.ids.setdefault(node.id, i) # the first node in preorder wins for duplicate ids
+            self.parent.append(parent)
+            self.children.append([])
+            self.types.append(self._type_code(node))
+            if parent == -1:
+                self.depth.append(0)
+                loops = []
+            else:
+                self.children[parent].append(i)
+                self.depth.append(self.depth[parent]+1)
+                loops = self.loops[parent]
+            self.loops.append([i] + loops if self.types[i] == CompiledTree.LOOP else loops)
+            self.last.append(i)
+            for c in reversed(node.children):
+                stack.append((c, i))
+        # subtrees are contiguous in preorder, i.e., the last index of a subtree is the last index of its last child
+        for i in range(len(self.nodes)-1, -1, -1):
+            if len(self.children[i]) > 0:
+                self.last[i] = self.last[self.children[i][-1]]
+
+    @staticmethod
+    def _type_code(node:ProcessTree) -> int:
+        if isinstance(node, Sequence):
+            return CompiledTree.SEQUENCE
+        if isinstance(node, Xor):
+            return CompiledTree.XOR
+        if isinstance(node, And):
+            return CompiledTree.AND
+        if isinstance(node, Loop):
+            return CompiledTree.LOOP
+        if isinstance(node, Activity):
+            return CompiledTree.ACTIVITY
+        if isinstance(node, LeafNode):
+            return CompiledTree.TAU
+        raise TypeError("Process tree does contain non-standard node", node)
+
+    def size(self) -> int:
+        return len(self.nodes)
+
+    def node_index(self, node:ProcessTree) -> int:
+        return self.index[node]
+
+    def node_by_id(self, id:str) -> Optional[ProcessTree]:
+        """
+        Returns the node with the provided id, None if there is no such node.
+        """
+        if id not in self.ids:
+            return None
+        return self.nodes[self.ids[id]]
+
+    def contains_index(self, i:int, j:int) -> bool:
+        """
+        Returns true iff the node with index j is in the subtree of the node with index i.
+        """
+        return i <= j and j <= self.last[i]
+
+    def contains(self, tree:ProcessTree, node:ProcessTree) -> bool:
+        """
+        Returns true iff node is in the subtree tree; equivalent to tree.contains_tree(node).
+        """
+        i = self.index.get(tree)
+        j = self.index.get(node)
+        if i is None or j is None:
+            return False
+        return i <= j and j <= self.last[i]
+
+    def lca_index(self, i:int, j:int) -> int:
+        while self.depth[i] > self.depth[j]:
+            i = self.parent[i]
+        while self.depth[j] > self.depth[i]:
+            j = self.parent[j]
+        while i != j:
+            i = self.parent[i]
+            j = self.parent[j]
+        return i
+
+    def lca(self, child1:ProcessTree, child2:ProcessTree) -> Optional[ProcessTree]:
+        """
+        Returns the least common ancestor of child1 and child2; equivalent to ProcessTree.get_lca.
+        """
+        if child1 is None or child2 is None:
+            return None
+        return self.nodes[self.lca_index(self.index[child1], self.index[child2])]
+
+    def distance_to_root(self, node:ProcessTree) -> int:
+        return self.depth[self.index[node]]
+
+    def loops_before(self, node:Optional[ProcessTree]) -> List[ProcessTree]:
+        """
+        Returns all Loop nodes on the path from node to the root, nearest first.
+        """
+        if node is None:
+            return []
+        return [self.nodes[i] for i in self.loops[self.index[node]]]
+
+    def has_loop_before(self, node:Optional[ProcessTree]) -> bool:
+        """
+        Returns true iff node or one of its ancestors is a Loop node.
+        """
+        if node is None:
+            return False
+        return len(self.loops[self.index[node]]) > 0
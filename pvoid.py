@@ -13,6 +13,7 @@ import pm4py
 
 from coveragemass import *
 from derivation import DerivationPipeline, EbiWeights
+from sagncache import SagnCache
 import probabilities
 from processtree import *
 import slpn_importer
@@ -94,10 +95,10 @@ def update_pair_taus(tree:ProcessTree):
         return
 
 
-def skipprob(log, pt, slpn_path ):
+def skipprob(log, pt, slpn_path, sagn_cache=None ):
     dv = DerivationPipeline(pt, log, pn_log=log, 
                             pn_method=EbiWeights.OCCURANCE,
-                            sagn_timeout=600)
+                            sagn_timeout=600, sagn_cache=sagn_cache)
     dv.compute(path='var', slpn_path=slpn_path ) 
     return dv
 
@@ -110,7 +111,8 @@ def main():
                                              SYNCH_COST )
     update_pair_taus(pt)
     slpn_path = 'var/spmodel.slpn'
-    dv = skipprob(logx, pt, slpn_path)
+    sagn_cache = SagnCache( sys.argv[3] ) if len(sys.argv) > 3 else None
+    dv = skipprob(logx, pt, slpn_path, sagn_cache)
     show_skip_outcome(dv)
     print( f'Skip probabilities calculated at {datetime.datetime.now()}')
     slpn = slpn_importer.read_slpn(slpn_path)
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import pickle
+from typing import Dict, List, Optional, Tuple
+from processtree import *
+from alignment import StateCodec
+
+
+def tree_hash(tree:ProcessTree) -> str:
+    """
+    Returns a hash of the structure of tree including node types, ids, labels and costs. Equal trees have equal hashes also across runs.
+    Labels of Tau leafs are left out, they do not change the alignments and may differ between runs (see pvoid.update_pair_taus).
+    """
+    parts = []
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, Tau):
+            parts.append("%s(%s,%s,%s)" % (type(node).__name__, node.id, node.skip_cost, node.sync_move_cost))
+        elif isinstance(node, LeafNode):
+            parts.append("%s(%s,%s,%s,%s)" % (type(node).__name__, node.id, node.name, node.skip_cost, node.sync_move_cost))
+        else:
+            parts.append("%s(%s,%d)" % (type(node).__name__, node.id, len(node.children)))
+            stack += reversed(node.children)
+    return hashlib.sha256("".join(parts).encode('utf-8')).hexdigest()
+
+
+class SagnCache(object):
+    """
+    Persistent cache for the optimal skip alignments of trace variants. An entry is a file named by the hash of (tree, variant, level incentive, all optimal), i.e., entries stay valid if the log changes and are never shared by different trees.
+    Entries hold the states encoded by a StateCodec, i.e., no tree is pickled and get rebuilds the states on the tree of the codec.
+    The total size of the entries is bounded; the least recently used entries are evicted first. Use is tracked by the modification times of the files.
+    """
+
+    def __init__(self, path:str, max_bytes:int=2**30) -> None:
+        """
+        path: Directory of the cache, created if needed
+        max_bytes: Maximal total size of the entries in bytes; default 1 GiB
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, tree_digest:str, variant:List[str], level_incentive:int, all_optimal:bool) -> str:
+        return hashlib.sha256(repr((StateCodec.__name__, tree_digest, tuple(variant), level_incentive, all_optimal)).encode('utf-8')).hexdigest()
+
+    def _file(self, key:str) -> str:
+        return os.path.join(self.path, key + ".pkl")
+
+    def get(self, tree_digest:str, variant:List[str], level_incentive:int, all_optimal:bool, codec:StateCodec) -> Optional[Tuple[list, int]]:
+        """
+        Returns the cached tuple (states, computation time in ns) for the variant, None if there is none. The states are decoded by codec, i.e., bound to its tree.
+        """
+        file = self._file(self.key(tree_digest, variant, level_incentive, all_optimal))
+        try:
+            with open(file, "rb") as f:
+                res = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(file) # mark as recently used
+        encoded, time_ns = res
+        return codec.decode(encoded, list(variant)), time_ns
+
+    def put(self, tree_digest:str, variant:List[str], level_incentive:int, all_optimal:bool, states:list, time_ns:int, codec:StateCodec) -> None:
+        """
+        Stores the states computed for the variant, encoded by codec. Call evict() after storing to bound the size of the cache.
+        """
+        file = self._file(self.key(tree_digest, variant, level_incentive, all_optimal))
+        tmp = file + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((codec.encode(states), time_ns), f)
+        os.replace(tmp, file) # readers never see partial entries
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used entries until the cache fits max_bytes. Returns the number of removed entries.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.path):
+            if entry.is_file() and entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, entry.path, stat.st_size))
+                total += stat.st_size
+        entries.sort()
+        removed = 0
+        for _, file, size in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(file)
+            total -= size
+            removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return sum(1 for entry in os.scandir(self.path) if entry.name.endswith(".pkl"))
+
+
+class RuntimeHistory(object):
+    """
+    Persistent record of the computation times of the skip alignments per tree and variant, kept in one JSON file. The times are used to estimate the costs of variants in later runs.
+    """
+
+    def __init__(self, path:str) -> None:
+        """
+        path: JSON file of the history, created on save
+        """
+        self.path = path
+        self.times = {} # tree digest -> JSON encoded variant -> computation time in ns
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.times = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def record(self, tree_digest:str, variant:List[str], time_ns:int) -> None:
+        """
+        Stores the computation time of the variant, replacing an older one. Call save() to persist it.
+        """
+        self.times.setdefault(tree_digest, {})[json.dumps(list(variant))] = time_ns
+
+    def runtimes(self, tree_digest:str) -> Dict[Tuple[str], int]:
+        """
+        Returns the recorded computation times in ns of the variants aligned to the tree.
+        """
+        return {tuple(json.loads(variant)):t for variant, t in self.times.get(tree_digest, {}).items()}
+
+    def save(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.times, f)
+        os.replace(tmp, self.path)
+
+    def __len__(self) -> int:
+        return sum(len(times) for times in self.times.values())
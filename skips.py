@@ -1,4 +1,5 @@
-from typing import Dict
+from typing import Dict, Tuple
+import numpy as np
 from alignment import State
 from processtree import *
 
@@ -16,23 +17,27 @@ class Skipper(object):
                 return res
         return None
 
-    def fix_tree_references(self, tree:ProcessTree, agn:State):
+    def fix_tree_references(self, tree:ProcessTree, agn:State, compiled:CompiledTree=None):
+        if compiled is None:
+            compiled = CompiledTree(tree)
+        agn.path = list(agn.path) # edited in place
         for i in range(len(agn.path)):
             if agn.path[i][1] != '>>':
                 if isinstance(agn.path[i][1], Skip):
                     # Skip
-                    agn.path[i] = (agn.path[i][0], Skip(self.get_tree_node_by_id(tree, agn.path[i][1].node.id), agn.path[i][1].skip_cost))
+                    agn.path[i] = (agn.path[i][0], Skip(compiled.node_by_id(agn.path[i][1].node.id), agn.path[i][1].skip_cost))
                 elif isinstance(agn.path[i][1], TauPath):
                     # Tau Skip
-                    agn.path[i] = (agn.path[i][0], TauPath(self.get_tree_node_by_id(tree, agn.path[i][1].node.id)))
+                    agn.path[i] = (agn.path[i][0], TauPath(compiled.node_by_id(agn.path[i][1].node.id)))
                 else:
                     # Activity
-                    agn.path[i] = (agn.path[i][0], self.get_tree_node_by_id(tree, agn.path[i][1].id))
+                    agn.path[i] = (agn.path[i][0], compiled.node_by_id(agn.path[i][1].id))
 
     def fix_sagns(self, tree:ProcessTree, skip_dict:Dict[str, List[State]]):
+        compiled = CompiledTree(tree)
         for agns in skip_dict.values():
             for agn in agns:
-                self.fix_tree_references(tree, agn)
+                self.fix_tree_references(tree, agn, compiled)
 
     def count_skip_executions(self, tree:ProcessTree, state:State, number_of_executions:int):
         alignment = state.path
@@ -80,6 +85,41 @@ class Skipper(object):
             assert child_executions[0] - sum(child_executions[1:]) >= 0 # no more redo parts than do parts
             return (child_executions[0] - sum(child_executions[1:])) # number of isolated executions
     
+    def execution_counts(self, tree:ProcessTree, state:State, compiled:CompiledTree=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the numbers of skip executions and non-skip executions of all nodes of tree in the skip alignment of state, i.e., count_skip_executions and count_non_skip_executions for every node with number_of_executions=1.
+        The counts are arrays indexed like compiled. They are computed bottom up in one pass over the path and one over the nodes.
+        """
+        if compiled is None:
+            compiled = CompiledTree(tree)
+        skips = np.zeros(compiled.size(), dtype=np.int64)
+        non_skips = np.zeros(compiled.size(), dtype=np.int64)
+        for _, m in state.path:
+            if m == '>>':
+                continue
+            if isinstance(m, Skip) or isinstance(m, TauPath):
+                i = compiled.index.get(m.node)
+                if i is not None:
+                    skips[i] += 1
+            else:
+                i = compiled.index.get(m)
+                if i is not None and (compiled.types[i] == CompiledTree.ACTIVITY or compiled.types[i] == CompiledTree.TAU):
+                    non_skips[i] += 1
+        for i in range(compiled.size()-1, -1, -1):
+            children = compiled.children[i]
+            if len(children) == 0:
+                continue
+            child_executions = [skips[c]+non_skips[c] for c in children]
+            if compiled.types[i] == CompiledTree.SEQUENCE or compiled.types[i] == CompiledTree.AND:
+                assert len(child_executions) == child_executions.count(child_executions[0]) # all children executed equally often
+                non_skips[i] = child_executions[0]
+            elif compiled.types[i] == CompiledTree.XOR:
+                non_skips[i] = sum(child_executions)
+            elif compiled.types[i] == CompiledTree.LOOP:
+                assert child_executions[0] - sum(child_executions[1:]) >= 0 # no more redo parts than do parts
+                non_skips[i] = child_executions[0] - sum(child_executions[1:]) # number of isolated executions
+        return skips, non_skips
+
     def _conditional_skip_prob(self, node:ProcessTree, state:State):
         skip_cnt = self.count_skip_executions(node, state, 1)
         nskip_cnt = self.count_non_skip_executions(node, state, 1)
@@ -101,9 +141,14 @@ class Skipper(object):
         # computes P(skip n|sagn)
         # output: sagn_to_node_to_prob: state -> node -> P(skip node | state)
         sagn_to_node_to_prob = {}
+        compiled = CompiledTree(tree)
+        nodes = self._traverse_tree(tree)
+        indices = [compiled.node_index(node) for node in nodes]
         for _, states in skip_dict.items():
             for state in states:
-                sagn_to_node_to_prob[state] = {}
-                for node in self._traverse_tree(tree):
-                    sagn_to_node_to_prob[state][node] = self._conditional_skip_prob(node, state)
+                skips, non_skips = self.execution_counts(tree, state, compiled)
+                executions = skips + non_skips
+                # 0 if we did never come to the subtree
+                probs = np.divide(skips, executions, out=np.zeros(len(executions)), where=executions > 0)
+                sagn_to_node_to_prob[state] = {node:float(probs[i]) for node, i in zip(nodes, indices)}
         return sagn_to_node_to_prob
\ No newline at end of file
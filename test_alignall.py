@@ -0,0 +1,60 @@
+import sys
+import time
+import unittest
+
+from processtree import *
+from alignment import *
+from alignall import AlignerPool, align_sk_all, align_sk_all_budget
+from testutil import ACTIVITY_COST, align, example_tree, loop_tree, quiet
+
+
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+
+
+TRACES = [['a','c','b'], ['a','x','c'], ['c','a','b','b'], ['a','c','x','c','b','d'], ['d','d']]
+
+def paths(states):
+    return sorted((s.acc_costs, str(s.path)) for s in states)
+
+
+class AlignerPoolTest(unittest.TestCase):
+
+    def test_pool_matches_serial(self):
+        serial = [paths(align(example_tree(), trace)) for trace in TRACES]
+        Aligner.set_level_incentive(0)
+        tree = example_tree()
+        with AlignerPool(tree, 2) as pool:
+            pooled = pool.align(TRACES, 60)
+            future = pool.submit(TRACES[:2], 60)
+            submitted = pool.results(future, TRACES[:2])
+        self.assertEqual( [t != -1 for _, t in pooled], [True]*len(TRACES) )
+        self.assertEqual( [paths(states) for states, _ in pooled], serial )
+        self.assertEqual( [paths(states) for states, _ in submitted], serial[:2] )
+        results = quiet(align_sk_all, TRACES, example_tree(), 60, 2)
+        self.assertEqual( [paths(states) for states, _ in results], serial )
+
+    def test_pool_shuts_down(self):
+        with AlignerPool(example_tree(), 1) as pool:
+            pool.results(pool.submit([['a']], 60), [['a']])
+        with self.assertRaises(RuntimeError):
+            pool.submit([['a']], 60)
+
+
+
+class BudgetTest(unittest.TestCase):
+
+    def test_expired_deadline_stops_search(self):
+        Aligner.set_level_incentive(0)
+        trace = ['a','b','b','a']*8
+        self.assertEqual( Aligner(loop_tree()).align2(trace, [ACTIVITY_COST]*len(trace), True, timeout=600, deadline=time.time()-1), ([], -1) )
+        with AlignerPool(loop_tree(), 1) as pool:
+            self.assertEqual( pool.results(pool.submit([trace], 600, time.time()-1), [trace]), [([], -1)] )
+
+    def test_running_variants_are_cut_at_deadline(self):
+        Aligner.set_level_incentive(0)
+        variants = [['a','b','b','a']*8, ['b','a','a','b']*8]
+        # started within the budget, but far from done at its end
+        results = quiet(align_sk_all_budget, variants, [1, 1], loop_tree(), 0.5, 600, 2)
+        self.assertEqual( results, [([], -1), ([], -1)] )
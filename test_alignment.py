@@ -0,0 +1,278 @@
+import pickle
+import sys
+import unittest
+from unittest import mock
+
+import alignment
+from processtree import *
+from alignment import *
+from testutil import ACTIVITY_COST, activity, align, example_tree, loop_tree, operator, tau
+
+
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+
+
+class ClosedSetTest(unittest.TestCase):
+
+    def test_replace_keeps_one_state_per_key(self):
+        tree = example_tree()
+        mapper = Mapper(tree)
+        closed = ClosedSet()
+        s1 = State.initial_state(tree, ['a','b'], mapper)
+        s2 = s1.copy()
+        s2.acc_costs = 5
+        self.assertIsNone( closed.find(s1) )
+        closed.replace(s1)
+        self.assertIs( closed.find(s2), s1 )
+        closed.replace(s2)
+        self.assertIs( closed.find(s1), s2 )
+        self.assertEqual( len(closed), 1 )
+
+    def test_key_distinguishes_trace_position(self):
+        tree = example_tree()
+        mapper = Mapper(tree)
+        closed = ClosedSet()
+        s1 = State.initial_state(tree, ['a','b'], mapper)
+        s2 = State.initial_state(tree, ['b'], mapper)
+        closed.replace(s1)
+        self.assertIsNone( closed.find(s2) )
+
+
+class TrailTest(unittest.TestCase):
+
+    def test_adding_keeps_original(self):
+        t1 = Trail() + [1, 2]
+        t2 = t1 + [3]
+        self.assertEqual( list(t1), [1, 2] )
+        self.assertEqual( list(t2), [1, 2, 3] )
+        self.assertEqual( list(reversed(t2)), [3, 2, 1] )
+        self.assertEqual( t2[-1], 3 )
+        self.assertEqual( t2[0:2], [1, 2] )
+        self.assertEqual( len(t2), 3 )
+
+    def test_pickle_long_trail(self):
+        t = Trail() + range(10000)
+        self.assertEqual( pickle.loads(pickle.dumps(t)), list(range(10000)) )
+
+
+class StateTest(unittest.TestCase):
+
+    def test_copy_is_independent(self):
+        tree = example_tree()
+        s1 = State.initial_state(tree, ['a','b'], Mapper(tree))
+        s2 = s1.shortest_path_to_activate('a', float('inf'))[0]
+        s3 = s2.copy()
+        s3.stop_execution(tree.children[0])
+        self.assertEqual( len(s1.path), 0 )
+        self.assertEqual( s2.trace, ['b'] )
+        self.assertEqual( [e.stop for e in s2.executions], [None, None] )
+        self.assertEqual( [e.stop for e in s3.executions], [None, 1] )
+
+
+class BucketQueueTest(unittest.TestCase):
+
+    def test_cheapest_first_then_fifo(self):
+        tree = example_tree()
+        mapper = Mapper(tree)
+        states = [State.initial_state(tree, ['a'], mapper) for _ in range(4)]
+        for state, costs in zip(states, [5, 0, 5, 0]):
+            state.acc_costs = costs
+        openlist = BucketQueue()
+        for state in states:
+            openlist.put(state)
+        self.assertEqual( len(openlist), 4 )
+        order = []
+        while not openlist.empty():
+            order.append(openlist.get())
+        self.assertEqual( [states.index(s) for s in order], [1, 3, 0, 2] )
+
+
+class AlignerTest(unittest.TestCase):
+
+    def test_fitting_trace(self):
+        states = align(example_tree(), ['a','c','b','c','d'])
+        self.assertEqual( len(states), 1 )
+        self.assertEqual( states[0].acc_costs, 0 )
+
+    def test_all_optimal_with_deviation(self):
+        states = align(example_tree(), ['a','x','c'])
+        self.assertTrue( len(states) > 0 )
+        for s in states:
+            self.assertEqual( s.acc_costs, 2*ACTIVITY_COST )
+            self.assertTrue( ('x','>>') in s.path )
+
+    def test_heuristic_keeps_optimal_alignments(self):
+        for trace in (['a','x','c'], ['c','a','b','b'], ['d','d']):
+            plain = sorted(str(s.path) for s in align(example_tree(), trace))
+            guided = sorted(str(s.path) for s in align(example_tree(), trace, Heuristic.REMAINING_COST))
+            self.assertEqual( plain, guided )
+
+    def test_buckets_keep_optimal_alignments(self):
+        for trace in (['a','x','c'], ['c','a','b','b'], ['d','d']):
+            plain = sorted(str(s.path) for s in align(example_tree(), trace))
+            buckets = sorted(str(s.path) for s in align(example_tree(), trace, frontier=Frontier.BUCKETS))
+            self.assertEqual( plain, buckets )
+
+    def test_symmetry_reduction_keeps_optimal_alignments(self):
+        for trace in (['a','x','c'], ['c','a','b','b'], ['a','c','b','c','x','d'], ['d','d']):
+            plain = sorted(str(s.path) for s in align(example_tree(), trace))
+            Aligner.set_level_incentive(0)
+            states, _ = Aligner(example_tree(), symmetry_reduction=True).align2(trace, [ACTIVITY_COST]*len(trace), True, timeout=60)
+            self.assertEqual( plain, sorted(str(s.path) for s in states) )
+
+    def test_symmetry_reduction_on_long_trace(self):
+        # ↺( ∧( a, b ), τ ) with more events than the recursion limit
+        loop = operator(Loop, [operator(And, [activity('a',1), activity('b',2)], 3), tau(4)], 5)
+        trace = ['a','b']*600
+        plain = sorted(str(s.path) for s in align(loop, trace))
+        Aligner.set_level_incentive(0)
+        states, t = Aligner(loop, symmetry_reduction=True).align2(trace, [ACTIVITY_COST]*len(trace), True, timeout=60)
+        self.assertNotEqual( t, -1 )
+        self.assertEqual( plain, sorted(str(s.path) for s in states) )
+
+    def test_trie_matches_single_traces(self):
+        traces = [['a','c','b'], ['a','c','b','d'], ['a','c','x'], ['a'], ['d','d'], []]
+        Aligner.set_level_incentive(0)
+        results = Aligner(example_tree()).align_trie(traces, ACTIVITY_COST, timeout=60)
+        self.assertEqual( len(results), len(traces) )
+        for trace, (states, t) in zip(traces, results):
+            self.assertNotEqual( t, -1 )
+            if len(trace) == 0:
+                self.assertEqual( len(states), 1 )
+                continue
+            single = sorted(str(s.path) for s in align(example_tree(), trace))
+            self.assertEqual( sorted(str(s.path) for s in states), single )
+
+    def test_bounded_matches_align2(self):
+        Aligner.set_level_incentive(0)
+        for trace in [['a','c','b'], ['a','c','x','c','b','d'], ['d','d']]:
+            single = sorted(str(s.path) for s in align(example_tree(), trace))
+            for state_budget in [None, 1]:
+                states, t = Aligner(example_tree()).align_bounded(trace, [ACTIVITY_COST]*len(trace), state_budget, timeout=60)
+                self.assertNotEqual( t, -1 )
+                self.assertEqual( sorted(str(s.path) for s in states), single )
+
+    def test_bounded_keeps_table_within_budget(self):
+        # ×( d, a, ∧( d, ∧( ∧( b, d, b ), ↺( c, d ), a ), ×( a, ∧( d, b, b ) ) ) )
+        inner = operator(And, [operator(And, [activity('b',1), activity('d',2), activity('b',3)], 4), operator(Loop, [activity('c',5), activity('d',6)], 7), activity('a',8)], 9)
+        choice = operator(Xor, [activity('a',10), operator(And, [activity('d',11), activity('b',12), activity('b',13)], 14)], 15)
+        tree = operator(Xor, [activity('d',16), activity('a',17), operator(And, [activity('d',18), inner, choice], 19)], 20)
+        trace = ['d','b','b','z','c','b','d']
+        single = sorted(str(s.path) for s in align(tree, trace))
+        tables = []
+        class RecordingCostTable(CostTable):
+            def __init__(self, capacity=None):
+                super().__init__(capacity)
+                self.largest = 0
+                tables.append(self)
+            def update(self, key, costs):
+                super().update(key, costs)
+                self.largest = max(self.largest, len(self.costs))
+        with mock.patch.object(alignment, 'CostTable', RecordingCostTable):
+            states, t = Aligner(tree).align_bounded(trace, [ACTIVITY_COST]*len(trace), 10, timeout=60)
+        self.assertNotEqual( t, -1 )
+        self.assertEqual( sorted(str(s.path) for s in states), single )
+        self.assertEqual( len(tables), 1 )
+        self.assertLessEqual( tables[0].largest, 10 )
+        self.assertGreater( tables[0].evictions, 0 )
+
+
+class OnlineAlignerTest(unittest.TestCase):
+
+    def test_prefixes_match_align2(self):
+        Aligner.set_level_incentive(0)
+        trace = ['a','c','x','c','b','d']
+        online = OnlineAligner(example_tree(), ACTIVITY_COST, all_optimal=True)
+        for i, event in enumerate(trace):
+            online.append('case', event)
+            single = sorted(str(s.path) for s in align(example_tree(), trace[:i+1]))
+            self.assertEqual( sorted(str(s.path) for s in online.alignments('case')), single )
+        self.assertEqual( len(online.close('case')), len(single) )
+        self.assertNotIn( 'case', online.cases )
+
+    def test_one_state_per_node_states(self):
+        # ↺( →( a, b ), τ ), the layer of all optimal prefix alignments grows with every a b b a
+        Aligner.set_level_incentive(0)
+        loop = loop_tree()
+        trace = ['a','b','b','a']*6
+        online = OnlineAligner(loop, ACTIVITY_COST, all_optimal=False)
+        layers = []
+        for i, event in enumerate(trace):
+            online.append('case', event)
+            layers.append(len(online.cases['case'][2]))
+            if i < 12:
+                single = align(loop, trace[:i+1])
+                states = online.alignments('case')
+                self.assertTrue( len(states) > 0 )
+                self.assertTrue( set(str(s.path) for s in states) <= set(str(s.path) for s in single) )
+        self.assertEqual( max(layers[4:]), layers[4] )
+
+    def test_default_layer_stays_bounded(self):
+        Aligner.set_level_incentive(0)
+        loop = loop_tree()
+        online = OnlineAligner(loop, ACTIVITY_COST)
+        layers = []
+        for event in ['a','b','b','a']*100:
+            online.append('case', event)
+            layers.append(len(online.cases['case'][2]))
+        # one state per node states, whatever the length of the case
+        self.assertEqual( max(layers), layers[4] )
+        self.assertTrue( len(online.close('case')) > 0 )
+
+
+class StateCodecTest(unittest.TestCase):
+
+    def test_roundtrip_binds_to_tree(self):
+        trace = ['a','c','x','b','d']
+        worker_tree = example_tree()
+        states = align(worker_tree, trace)
+        tree = example_tree()
+        encoded = pickle.loads(pickle.dumps(StateCodec(Mapper(worker_tree)).encode(states)))
+        decoded = StateCodec(Mapper(tree)).decode(encoded, trace)
+        self.assertEqual( [str(s.path) for s in decoded], [str(s.path) for s in states] )
+        self.assertEqual( [s.acc_costs for s in decoded], [s.acc_costs for s in states] )
+        for s, d in zip(states, decoded):
+            self.assertEqual( d.state, s.state )
+            self.assertEqual( [(e.node.id, e.start, e.stop) for e in d.executions], [(e.node.id, e.start, e.stop) for e in s.executions] )
+            self.assertEqual( {k.id:list(v) for k,v in d.and_starts.items()}, {k.id:list(v) for k,v in s.and_starts.items()} )
+            for _, move in d.path:
+                if move != '>>':
+                    node = move.node if isinstance(move, Skip) or isinstance(move, TauPath) else move
+                    self.assertTrue( tree.contains_tree(node) )
+
+
+class LeafTransitionTest(unittest.TestCase):
+
+    def test_static_transitions(self):
+        tree = example_tree()
+        mapper = Mapper(tree)
+        a, b, c = tree.children[0], tree.children[1].children[0], tree.children[1].children[1].children[0]
+        d = tree.children[2].children[0]
+        self.assertEqual( mapper.activities['c'], [c] )
+        self.assertIsNone( mapper.get_transition(a, b).path )
+        self.assertTrue( mapper.get_transition(a, b).possible )
+        self.assertFalse( mapper.get_transition(d, a).possible )
+        loop = tree.children[1].children[1]
+        self.assertEqual( mapper.get_transition(c, c).lcas, [(loop, False)] )
+        # b and c meet at the And, i.e., the answer depends on the node states
+        self.assertEqual( [n for _, n in mapper.get_transition(b, c).path], [c, loop] )
+        self.assertIs( mapper.get_transition(b, c), mapper.get_transition(b, c) )
+
+
+class CostEstimatorTest(unittest.TestCase):
+
+    def test_forced_log_moves_and_skips(self):
+        tree = example_tree()
+        mapper = Mapper(tree)
+        trace = ['a','x','d']
+        costs = [ACTIVITY_COST]*len(trace)
+        estimator = CostEstimator(mapper.compiled, trace, costs)
+        state = State.initial_state(tree, trace, mapper)
+        # x can never be matched
+        self.assertEqual( estimator.estimate(state), ACTIVITY_COST )
+        state = state.shortest_path_to_activate('a', float('inf'))[0]
+        state.trace_pos = 2
+        # a is fired, x is gone, ∧(b, ↺(c,τ)) has to be skipped
+        self.assertEqual( estimator.estimate(state), 2*ACTIVITY_COST )
@@ -0,0 +1,68 @@
+import random
+import sys
+import unittest
+
+from processtree import *
+from alignment import *
+from derivation import DerivationPipeline
+from testutil import activity, align, example_tree, operator, tau
+
+
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+
+
+def nested_loop_tree():
+    # ↺( →( a, ↺( b, τ ), ×( c, τ ) ), τ )
+    inner = operator(Loop, [activity('b',2), tau(3)], 4)
+    choice = operator(Xor, [activity('c',5), tau(6)], 7)
+    body = operator(Sequence, [activity('a',1), inner, choice], 8)
+    return operator(Loop, [body, tau(9)], 10)
+
+def pipeline(tree, variants):
+    dv = DerivationPipeline.__new__(DerivationPipeline)
+    dv.tree = tree
+    dv.compiled = CompiledTree(tree)
+    dv.execution_counts = {}
+    dv.variants = variants
+    return dv
+
+def recursive_node_prob(dv, tree, *args):
+    # reference: prob_per_node for every node, children before their parent
+    result = {}
+    if not isinstance(tree, LeafNode):
+        for c in tree.children:
+            result.update(recursive_node_prob(dv, c, *args))
+    result[tree] = dv.prob_per_node(tree, *args)
+    return result
+
+
+class RecurNodeProbTest(unittest.TestCase):
+
+    def test_matches_recursion_per_node(self):
+        rng = random.Random(5)
+        cases = [
+            (example_tree(), [['a','c','b'], ['a','x','c'], ['c','a','b','b'], ['a','c','b','c','d']]),
+            (nested_loop_tree(), [['a','b','c'], ['a','b','b','a'], ['a','c','a','b','b','b','c'], ['b','a'], ['x']]),
+        ]
+        for tree, traces in cases:
+            variants = {tuple(t):rng.randint(1, 5) for t in traces}
+            variants[('cut',)] = 2 # left out of the derivation, as a variant cut by the budget
+            skip_dict = {", ".join(v):(align(tree, list(v)) if v != ('cut',) else []) for v in variants}
+            dv = pipeline(tree, variants)
+            dv.rename_sagns(skip_dict)
+            skip_dict_backup = {k:[s.copy() for s in v] for k,v in skip_dict.items()}
+            id_to_skip_dict = {s.name:s for _,sl in skip_dict.items() for s in sl}
+            id_to_skip_dict_backup = {s.name:s for _,sl in skip_dict_backup.items() for s in sl}
+            nodes = dv.compiled.nodes
+            skip_prob = {s:{n:rng.random() for n in nodes} for s in id_to_skip_dict_backup.values()}
+            sagn_prob = {n:{s:rng.random() for s in id_to_skip_dict.values()} for n in nodes}
+            variant_prob = {v:c/sum(variants.values()) for v,c in variants.items()}
+            args = (variants, skip_dict, skip_prob, sagn_prob, variant_prob, id_to_skip_dict, id_to_skip_dict_backup, skip_dict_backup)
+            expected = recursive_node_prob(dv, tree, *args)
+            probs = dv.recur_node_prob(tree, *args)
+            self.assertEqual( list(probs), list(expected) )
+            for n in expected:
+                self.assertAlmostEqual( probs[n], expected[n] )
+            self.assertTrue( any(0 < p < 1 for p in probs.values()) )
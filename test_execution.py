@@ -0,0 +1,331 @@
+import itertools
+import random
+import sys
+import unittest
+from collections import Counter
+
+from processtree import *
+from alignment import *
+from alignall import align_sk_all_budget
+from execution import ExecutionManager, ExecutionTree
+from testutil import activity, align, example_tree, operator, quiet, random_tree, tau
+
+
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+
+
+def correct_to_narrowest_moves(state):
+    # reference: narrows the executions move by move
+    for i in range(len(state.executions)):
+        while state.executions[i].stop > state.executions[i].start:
+            # log move on start
+            if state.path[state.executions[i].start][1] == '>>':
+                state.executions[i].start += 1
+            # log move on stop
+            elif state.path[state.executions[i].stop-1][1] == '>>':
+                state.executions[i].stop -= 1
+            # not contained node, Skip or Taupath
+            elif (isinstance(state.path[state.executions[i].start][1], Skip) or isinstance(state.path[state.executions[i].start][1], TauPath)) and not state.mapper.compiled.contains(state.executions[i].node, state.path[state.executions[i].start][1].node):
+                state.executions[i].start += 1
+            # not contained node, Skip or Taupath
+            elif (isinstance(state.path[state.executions[i].stop-1][1], Skip) or isinstance(state.path[state.executions[i].stop-1][1], TauPath)) and not state.mapper.compiled.contains(state.executions[i].node, state.path[state.executions[i].stop-1][1].node):
+                state.executions[i].stop -= 1
+            # not contained node
+            elif not isinstance(state.path[state.executions[i].start][1], Skip) and not isinstance(state.path[state.executions[i].start][1], TauPath) and not state.mapper.compiled.contains(state.executions[i].node, state.path[state.executions[i].start][1]):
+                state.executions[i].start += 1
+            # not contained node
+            elif not isinstance(state.path[state.executions[i].stop-1][1], Skip) and not isinstance(state.path[state.executions[i].stop-1][1], TauPath) and not state.mapper.compiled.contains(state.executions[i].node, state.path[state.executions[i].stop-1][1]):
+                state.executions[i].stop -= 1
+            else:
+                break
+
+def remove_log_moves(state):
+    # reference: removes the log moves move by move; expects correct_to_narrowest_moves before
+    state.path = list(state.path) # edited in place
+    i = 0
+    log_moves = []
+    log_path = []
+    while i < len(state.path):
+        if state.path[i][1] == '>>':
+            log_moves.append(state.path[i][0] + str(len(log_path)))
+            log_path.append(state.path[i][0] + str(len(log_path)))
+            for exec in state.executions:
+                if exec.start < i and exec.stop > i:
+                    # ........ logmove .......
+                    # start... stop    ....... -> is okay, as only part before logmove contains execution
+                    # start............stop... -> deduce end position
+                    exec.stop -= 1
+                elif exec.start > i:
+                    exec.start -= 1
+                    exec.stop -= 1
+                # i is never a start position after applying correct_to_narrowest_moves
+            state.path.pop(i)
+        else:
+            if state.path[i][0] != '>>':
+                # sync move
+                state.path[i] = (state.path[i][0] + str(len(log_path)), state.path[i][1])
+                log_path.append(state.path[i][0])
+            i += 1
+    return log_moves, log_path
+
+def build_execution_tree_greedy(state, node=None):
+    # reference: searches the children of every execution in the remaining executions
+    state.executions = sorted(state.executions, key=lambda x:(x.start, -x.stop, state.mapper.compiled.distance_to_root(x.node)))
+
+    if node is None:
+        node = state.executions[0]
+        state.executions.remove(node)
+    
+    tree = ExecutionTree(None, [], node)
+
+    if isinstance(tree.execution.node, LeafNode):
+        return tree
+    if isinstance(tree.execution.node, Sequence) or isinstance(tree.execution.node, And):
+        # search for the children in bounds of tree.execution
+        for c in tree.execution.node.children:
+            tree_c = None
+            for i in range(len(state.executions)):
+                if state.executions[i].node == c and tree.execution.start <= state.executions[i].start and tree.execution.stop >= state.executions[i].stop:
+                    exec_c = state.executions.pop(i)
+                    tree_c = build_execution_tree_greedy(state, exec_c)
+                    break
+            assert tree_c is not None
+            tree.children.append(tree_c)
+            tree_c.set_parent(tree)
+        return tree
+    if isinstance(tree.execution.node, Xor):
+        # search for the executed child in bounds of tree.execution
+        tree_c = None
+        for i in range(len(state.executions)):
+            if state.executions[i].node.parent == tree.execution.node and tree.execution.start <= state.executions[i].start and tree.execution.stop >= state.executions[i].stop:
+                exec_c = state.executions.pop(i)
+                tree_c = build_execution_tree_greedy(state, exec_c)
+                break
+        assert tree_c is not None
+        tree.children.append(tree_c)
+        tree_c.set_parent(tree)
+        return tree
+    if isinstance(tree.execution.node, Loop):
+        # search for all executed children in bounds of tree.execution
+        # note that they already appear in appropriate order in the execution
+        i = 0
+        tree_c = []
+        while i < len(state.executions) and state.executions[i].start < tree.execution.stop:
+            if state.executions[i].node.parent == tree.execution.node and tree.execution.start <= state.executions[i].start and tree.execution.stop >= state.executions[i].stop:
+                exec_c = state.executions.pop(i)
+                tree_c.append(build_execution_tree_greedy(state, exec_c))
+            else:
+                i += 1
+        assert len(tree_c) > 0
+        tree.children = tree_c
+        for c in tree_c:
+            c.set_parent(tree)
+        return tree
+    raise ValueError("Unexpected type of execution found:", tree.execution)
+
+def list_order_preserving_shuffles(*paths):
+    # reference: all interleavings as a list
+    inter = []
+    for comb in itertools.combinations(range(len(paths[0])+len(paths[1])), len(paths[0])):
+        fillup_list, insert_list = list(paths[1]), list(zip(comb, paths[0]))
+        l = []
+        for i in range(len(insert_list)+len(fillup_list)):
+            if len(insert_list) > 0 and insert_list[0][0] == i:
+                l.append(insert_list.pop(0)[1])
+            else:
+                l.append(fillup_list.pop(0))
+        inter.append(l)
+    if len(paths) == 2:
+        return inter
+    res = []
+    for new_path in inter:
+        res += list_order_preserving_shuffles(new_path, *paths[2:])
+    return res
+
+def list_shuffle(tree, state):
+    # reference: the reshuffling of every execution as a list, children first
+    if isinstance(tree.execution.node, LeafNode):
+        return [list(state.path[tree.execution.start:tree.execution.stop])]
+    if isinstance(tree.execution.node, Xor):
+        return list_shuffle(tree.children[0], state)
+    res = []
+    for path in itertools.product(*[list_shuffle(c, state) for c in tree.children]):
+        if isinstance(tree.execution.node, And):
+            res += list_order_preserving_shuffles(*path)
+        else:
+            res.append([move for sub_path in path for move in sub_path])
+    return res
+
+def filtered_shuffle(state, log_moves, log_path, execution_tree):
+    # reference: all interleavings, filtered by the sync moves of the log, every log move merged in breadth-first
+    sync_moves_log = [l for l in log_path if l not in log_moves]
+    for agn in execution_tree.shuffle(state):
+        if [l for l,_ in agn if l != '>>'] == sync_moves_log:
+            base_agn = [list(agn)]
+            for l in log_moves:
+                new_base = []
+                for a in base_agn:
+                    log_path_copy = list(log_path)
+                    merge_start = 0
+                    while merge_start < len(a) and (a[merge_start][0] == '>>' or a[merge_start][0] == log_path_copy[0]):
+                        if a[merge_start][0] == log_path_copy[0]:
+                            log_path_copy = log_path_copy[1:]
+                        merge_start += 1
+                    while merge_start > 0 and a[merge_start-1][0] == '>>':
+                        merge_start -= 1
+                    merge_end = merge_start
+                    while merge_end < len(a) and a[merge_end][0] == '>>':
+                        merge_end += 1
+                    for sink_in in execution_tree.all_order_preserving_shuffles(a[merge_start:merge_end], [(l, '>>')]):
+                        new_base.append(a[:merge_start] + sink_in + a[merge_end:])
+                base_agn = new_base
+            for a in base_agn:
+                if [l for l,_ in a if l != '>>'] == log_path:
+                    yield a
+
+
+class ExecutionManagerTest(unittest.TestCase):
+
+    def test_counts_match_alignments(self):
+        for trace in (['a','x','y'], ['a','x','c','y'], ['x','a','c','b','z']):
+            states = align(example_tree(), trace)
+            variant = ", ".join(trace)
+            em = ExecutionManager()
+            _, global_C = quiet(em.coninciding_agns, {variant:[s.copy() for s in states]})
+            C, global_counts = quiet(em.coinciding_counts, {variant:states})
+            for agns, counts in zip(global_C[variant], global_counts[variant]):
+                self.assertEqual( dict(Counter(tuple(m for _,m in agn if m != '>>') for agn in agns)), counts )
+            var_C = em.coinciding_agns_var(global_C)
+            self.assertEqual( sum(em.coinciding_counts_var(global_counts)[variant].values()), len(var_C[variant]) )
+            self.assertEqual( sum(sum(C[s].values()) for s in states), len(var_C[variant]) )
+
+    def test_pruned_shuffles_match_filtered(self):
+        trace = ['a','x','c','b','y','c','d']
+        em = ExecutionManager()
+        for state in align(example_tree(), trace):
+            log_moves, log_path = em.normalize(state)
+            sync_rank, _ = em._log_gaps(log_moves, log_path)
+            tree = em.build_execution_tree(state.copy())
+            filtered = [agn for agn in tree.shuffle(state) if sorted(sync_rank, key=sync_rank.get) == [l for l,_ in agn if l != '>>']]
+            self.assertEqual( sorted(map(str, tree.shuffle(state, sync_rank))), sorted(map(str, filtered)) )
+
+    def test_log_move_merge_matches_filtered(self):
+        rng = random.Random(8)
+        em = ExecutionManager()
+        checked = 0
+        for _ in range(60):
+            root = random_tree(rng, 3, itertools.count(1))
+            if isinstance(root, LeafNode):
+                continue
+            for _ in range(3):
+                trace = rng.choices('abcdz', k=rng.randint(1, 6))
+                for state in align(root, trace):
+                    log_moves, log_path = em.normalize(state)
+                    for s in state.unfold():
+                        try:
+                            tree = em.build_execution_tree(s.copy())
+                        except AssertionError:
+                            # executions that do not nest are rejected before shuffling, in both versions
+                            continue
+                        expected = list(filtered_shuffle(s, log_moves, log_path, tree))
+                        shuffled = list(em.shuffle(s, log_moves, log_path, tree))
+                        self.assertEqual( sorted(map(str, shuffled)), sorted(map(str, expected)) )
+                        # no duplicates although the interleavings are not stored
+                        self.assertEqual( len(set(map(tuple, shuffled))), len(shuffled) )
+                        counts = Counter(tuple(m for _,m in agn if m != '>>') for agn in set(map(tuple, expected)))
+                        self.assertEqual( em.shuffle_counts(s, log_moves, log_path, tree), dict(counts) )
+                        checked += 1
+        self.assertGreater(checked, 100)
+
+    def test_cut_variants_are_skipped(self):
+        cut = quiet(align_sk_all_budget, [['a','x','y']], [1], example_tree(), 0., 10, 1)
+        self.assertEqual( cut, [([], -1)] )
+        em = ExecutionManager()
+        states = align(example_tree(), ['a','c','b'])
+        skip_dict = {"a, x, y":cut[0][0], "a, c, b":states}
+        _, global_C = quiet(em.coninciding_agns, {k:[s.copy() for s in v] for k,v in skip_dict.items()})
+        _, global_counts = quiet(em.coinciding_counts, skip_dict)
+        self.assertEqual( global_C["a, x, y"], [] )
+        self.assertEqual( global_counts["a, x, y"], [] )
+        self.assertEqual( em.coinciding_agns_var(global_C, validate=True)["a, x, y"], [] )
+        self.assertEqual( len(em.coinciding_agns_var(global_C)["a, c, b"]), sum(em.coinciding_counts_var(global_counts)["a, c, b"].values()) )
+        _, global_C = quiet(em.coninciding_agns, {"a, x, y":[]})
+        self.assertEqual( global_C, {"a, x, y":[]} )
+
+    def test_overlap_is_detected(self):
+        em = ExecutionManager()
+        global_C = {'v':[frozenset([(1,)]), frozenset([(2,), (3,)])], 'w':[frozenset([(1,), (2,)]), frozenset([(2,)])]}
+        with self.assertRaises(ValueError):
+            em.validate(global_C)
+        with self.assertRaises(ValueError):
+            em.coinciding_agns_var(global_C, validate=True)
+        var_C = em.coinciding_agns_var(global_C)
+        self.assertEqual( sorted(var_C['v']), [(1,), (2,), (3,)] )
+        self.assertEqual( sorted(var_C['w']), [(1,), (2,)] )
+        em.validate({'v':global_C['v']})
+
+    def test_normalize_matches_two_passes(self):
+        rng = random.Random(3)
+        em = ExecutionManager()
+        for trace in (['a','x','c','b','y','c','d'], ['x','y','d'], ['c','a','b','b']):
+            for state in align(example_tree(), trace):
+                intervals = [[(e.start, e.stop) for e in state.executions]]
+                for _ in range(20):
+                    # random intervals, also without contained moves
+                    bounds = [sorted(rng.choices(range(len(state.path)+1), k=2)) for _ in state.executions]
+                    intervals.append(bounds)
+                for bounds in intervals:
+                    a, b = state.copy(), state.copy()
+                    a.executions = [Execution(e.node, start, stop) for e, (start, stop) in zip(state.executions, bounds)]
+                    b.executions = [Execution(e.node, start, stop) for e, (start, stop) in zip(state.executions, bounds)]
+                    correct_to_narrowest_moves(a)
+                    self.assertEqual( remove_log_moves(a), em.normalize(b) )
+                    self.assertEqual( list(a.path), list(b.path) )
+                    self.assertEqual( [(e.node, e.start, e.stop) for e in a.executions], [(e.node, e.start, e.stop) for e in b.executions] )
+
+    def test_execution_tree_matches_greedy(self):
+        def shape(t):
+            return ((t.execution.node, t.execution.start, t.execution.stop), tuple(shape(c) for c in t.children))
+        em = ExecutionManager()
+        body = operator(Sequence, [activity('a',1), operator(And, [activity('b',2), activity('c',3)], 4)], 5)
+        loop = operator(Loop, [body, tau(6)], 7)
+        for tree, trace in ((example_tree(), ['a','x','c','b','y','c','d']), (example_tree(), ['c','a','b','b']), (loop, ['a','b','c','a','c','b']*50)):
+            for state in align(tree, trace):
+                em.normalize(state)
+                for s in state.unfold():
+                    self.assertEqual( shape(em.build_execution_tree(s.copy())), shape(build_execution_tree_greedy(s.copy())) )
+
+
+class ExecutionTreeTest(unittest.TestCase):
+
+    def test_order_preserving_shuffles_match_list(self):
+        tree = ExecutionTree(None, [], None)
+        for paths in (([1,2], [3]), ([1,2], [3,4,5]), ([1], [2,3], [4,5]), ([], [1,2]), ([1,2], [3], [], [4])):
+            self.assertEqual( list(tree.all_order_preserving_shuffles(*paths)), list_order_preserving_shuffles(*paths) )
+
+    def test_shuffles_match_list(self):
+        em = ExecutionManager()
+        rng = random.Random(8)
+        body = operator(Sequence, [activity('a',1), operator(And, [activity('b',2), activity('c',3)], 4)], 5)
+        cases = [(example_tree(), ['a','x','c','b','y','c','d']), (example_tree(), ['c','a','b','b']), (operator(Loop, [body, tau(6)], 7), ['a','b','c','a','c','b'])]
+        for _ in range(20):
+            cases.append((random_tree(rng, 3, itertools.count(1)), rng.choices('abcd', k=rng.randint(1, 5))))
+        compared = 0
+        for root, trace in cases:
+            if isinstance(root, LeafNode):
+                continue
+            for state in align(root, trace):
+                em.normalize(state)
+                for s in state.unfold():
+                    try:
+                        tree = em.build_execution_tree(s.copy())
+                    except AssertionError:
+                        continue
+                    expected = list_shuffle(tree, s)
+                    if len(expected) > 2000:
+                        continue
+                    self.assertEqual( list(tree.shuffle(s)), expected )
+                    compared += 1
+        self.assertGreater(compared, 20)
@@ -0,0 +1,72 @@
+import random
+import sys
+import unittest
+
+from processtree import *
+from alignment import *
+from execution import ExecutionManager
+from probabilities import EbiOccurance
+from testutil import align, example_tree, quiet
+
+
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+
+
+class Measure(dict):
+    # model probability of every requested model path, drawn once
+    def __init__(self, rng):
+        self.rng = rng
+    def __missing__(self, model_path_ids):
+        self[model_path_ids] = self.rng.random()
+        return self[model_path_ids]
+
+def linear_skip_agn_probs(node, skip_dict, C, trace_probs, trace_counts):
+    # reference: scans the moves of every sagn and the coinciding agns per node
+    score_sagn = {}
+    cond_prob = {}
+    for var, states in skip_dict.items():
+        for state in states:
+            prob = 0
+            if node.id in [e.node.id for e in state.executions]+[m.node.id for l,m in state.path if isinstance(m,Skip)]+[m.node.id for l,m in state.path if isinstance(m,TauPath)]:
+                for agn in C[state]:
+                    model_path = tuple([m for m in list(zip(*agn))[1] if m != '>>'])
+                    prob += trace_probs[tuple([n.id for n in model_path])]/trace_counts[var][model_path]
+            score_sagn[state] = prob
+        for state in states:
+            cond_prob[state] = score_sagn[state]/sum(score_sagn[s] for s in states) if sum(score_sagn[s] for s in states) > 0 else 0.0
+    return score_sagn, cond_prob
+
+
+class SagnIndexTest(unittest.TestCase):
+
+    def test_index_matches_linear_scan(self):
+        tree = example_tree()
+        traces = [['a','c','b'], ['a','x','c'], ['c','a','b','b'], ['a','c','x','c','b','d'], ['x','y','d']]
+        skip_dict = {", ".join(t):align(tree, t) for t in traces}
+        counts_skip_dict = {k:[s.copy() for s in v] for k,v in skip_dict.items()}
+        original = {c:s for k in skip_dict for s, c in zip(skip_dict[k], counts_skip_dict[k])}
+        em = ExecutionManager()
+        ebi = EbiOccurance()
+        C, global_C = quiet(em.coninciding_agns, skip_dict)
+        trace_probs, trace_counts, _ = quiet(ebi.trace_probs, em.coinciding_agns_var(global_C), Measure(random.Random(2)))
+        counts_C, global_counts = quiet(em.coinciding_counts, counts_skip_dict)
+        _, counts_trace_counts, _ = quiet(ebi.trace_probs, em.coinciding_counts_var(global_counts), trace_probs)
+        index = ebi.sagn_index(skip_dict, C, trace_probs, trace_counts)
+        counts_index = ebi.sagn_index(counts_skip_dict, counts_C, trace_probs, counts_trace_counts)
+        traversal_score, traversal_cond = ebi.skip_agn_probs_traversal(tree, skip_dict, C, trace_probs, trace_counts)
+        scored = 0
+        for node in CompiledTree(tree).nodes:
+            score, cond = linear_skip_agn_probs(node, skip_dict, C, trace_probs, trace_counts)
+            scored += sum(v > 0 for v in score.values())
+            counts_score, counts_cond = ebi.skip_agn_probs_per_node(node, counts_skip_dict, counts_C, trace_probs, counts_trace_counts, counts_index)
+            for indexed in (ebi.skip_agn_probs_per_node(node, skip_dict, C, trace_probs, trace_counts),
+                            ebi.skip_agn_probs_per_node(node, skip_dict, C, trace_probs, trace_counts, index),
+                            ({original[c]:v for c,v in counts_score.items()}, {original[c]:v for c,v in counts_cond.items()}),
+                            (traversal_score[node], traversal_cond[node])):
+                self.assertEqual( set(indexed[0]), set(score) )
+                for s in score:
+                    self.assertAlmostEqual( indexed[0][s], score[s] )
+                    self.assertAlmostEqual( indexed[1][s], cond[s] )
+        self.assertGreater( scored, 0 )
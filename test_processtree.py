@@ -0,0 +1,124 @@
+import pickle
+import sys
+import unittest
+
+from processtree import *
+from testutil import ACTIVITY_COST, activity, operator
+
+
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+
+
+def example_tree():
+    # →( a, ↺( ∧( b, c ), d ), ×( e, ↺( f, g ) ) )
+    leafs = [activity(l,i) for i,l in enumerate('abcdefg')]
+    a, b, c, d, e, f, g = leafs
+    conc = operator(And, [b,c], 10)
+    loop1 = operator(Loop, [conc,d], 11)
+    loop2 = operator(Loop, [f,g], 12)
+    choice = operator(Xor, [e,loop2], 13)
+    return operator(Sequence, [a,loop1,choice], 14)
+
+def all_nodes(tree):
+    res = [tree]
+    for c in tree.children:
+        res += all_nodes(c)
+    return res
+
+
+class PropertyCacheTest(unittest.TestCase):
+
+    def test_children_change_invalidates_ancestors(self):
+        tree = example_tree()
+        choice = tree.children[2]
+        self.assertEqual( tree.get_leaf_labels(), list('abcdefg') )
+        self.assertEqual( tree.get_max_depth(), 3 )
+        self.assertEqual( tree.get_cheapest_execution(0), (4*ACTIVITY_COST, False) )
+        h = activity('h', 20)
+        choice.children = [e for e in choice.children] + [h]
+        h.set_parent(choice)
+        self.assertEqual( tree.get_leaf_labels(), list('abcdefgh') )
+        # e and h are equally cheap, e comes first
+        self.assertEqual( choice.get_cheapest_execution(0), (ACTIVITY_COST, False) )
+
+    def test_set_parent_invalidates_distances(self):
+        tree = example_tree()
+        loop2 = tree.children[2].children[1]
+        f = loop2.children[0]
+        self.assertEqual( f.get_distance_to_root(), 3 )
+        loop2.set_parent(tree)
+        self.assertEqual( f.get_distance_to_root(), 2 )
+        self.assertEqual( loop2.get_distance_to_root(), 1 )
+
+
+class PickleTest(unittest.TestCase):
+
+    def test_loads_pickles_with_plain_parent_and_children(self):
+        tree = example_tree()
+        # layout of trees pickled before parent and children became properties
+        for node in all_nodes(tree):
+            state = node.__dict__
+            state['parent'] = state.pop('_parent')
+            state['children'] = state.pop('_children')
+            for name in ('max_depth', 'cheapest', 'distance_to_root'):
+                del state[name]
+        loaded = pickle.loads(pickle.dumps(tree))
+        nodes = all_nodes(loaded)
+        self.assertEqual( [n.id for n in nodes], ['14','ACTIVITY_0','11','10','ACTIVITY_1','ACTIVITY_2','ACTIVITY_3','13','ACTIVITY_4','12','ACTIVITY_5','ACTIVITY_6'] )
+        for node in nodes:
+            for c in node.children:
+                self.assertIs( c.parent, node )
+        self.assertEqual( loaded.get_leaf_labels(), list('abcdefg') )
+        self.assertEqual( loaded.get_max_depth(), 3 )
+        self.assertEqual( nodes[-1].get_distance_to_root(), 3 )
+        self.assertEqual( len(CompiledTree(loaded).nodes), 12 )
+
+
+class CompiledTreeTest(unittest.TestCase):
+
+    def test_preorder_arrays(self):
+        tree = example_tree()
+        compiled = CompiledTree(tree)
+        nodes = all_nodes(tree)
+        self.assertEqual( compiled.nodes, nodes )
+        for i, node in enumerate(nodes):
+            self.assertEqual( compiled.node_index(node), i )
+            self.assertEqual( compiled.distance_to_root(node), node.get_distance_to_root() )
+            parent = compiled.parent[i]
+            self.assertEqual( compiled.nodes[parent] if parent >= 0 else None, node.parent )
+            self.assertEqual( [compiled.nodes[c] for c in compiled.children[i]], node.children )
+        self.assertEqual( compiled.types[0], CompiledTree.SEQUENCE )
+        self.assertEqual( compiled.types[compiled.node_index(tree.children[0])], CompiledTree.ACTIVITY )
+
+    def test_contains_and_lca_match_pointer_walks(self):
+        tree = example_tree()
+        compiled = CompiledTree(tree)
+        nodes = all_nodes(tree)
+        for n1 in nodes:
+            for n2 in nodes:
+                self.assertEqual( compiled.contains(n1,n2), n1.contains_tree(n2) )
+                self.assertIs( compiled.lca(n1,n2), ProcessTree.get_lca(n1,n2) )
+
+    def test_loops_before(self):
+        tree = example_tree()
+        compiled = CompiledTree(tree)
+        a = tree.children[0]
+        loop1 = tree.children[1]
+        b = loop1.children[0].children[0]
+        loop2 = tree.children[2].children[1]
+        g = loop2.children[1]
+        self.assertEqual( compiled.loops_before(a), [] )
+        self.assertFalse( compiled.has_loop_before(a) )
+        self.assertEqual( compiled.loops_before(b), [loop1] )
+        self.assertEqual( compiled.loops_before(g), [loop2] )
+        self.assertEqual( compiled.loops_before(loop2), [loop2] )
+        self.assertTrue( compiled.has_loop_before(b) )
+
+    def test_node_by_id(self):
+        tree = example_tree()
+        compiled = CompiledTree(tree)
+        self.assertIs( compiled.node_by_id('13'), tree.children[2] )
+        self.assertIsNone( compiled.node_by_id('missing') )
+
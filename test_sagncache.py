@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from processtree import *
+from alignment import *
+from sagncache import *
+from testutil import ACTIVITY_COST, activity, operator, tau
+
+
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+
+
+def example_tree(cost=ACTIVITY_COST, tau_name="TAU"):
+    # →( a, ×( b, τ ) )
+    choice = operator(Xor, [activity('b',2,cost), tau(3,tau_name)], 4)
+    return operator(Sequence, [activity('a',1,cost), choice], 5)
+
+
+class TreeHashTest(unittest.TestCase):
+
+    def test_equal_structure_equal_hash(self):
+        self.assertEqual( tree_hash(example_tree()), tree_hash(example_tree()) )
+
+    def test_costs_change_hash(self):
+        self.assertNotEqual( tree_hash(example_tree()), tree_hash(example_tree(ACTIVITY_COST+1)) )
+
+    def test_tau_names_keep_hash(self):
+        # pvoid.update_pair_taus gives the Taus random names
+        self.assertEqual( tree_hash(example_tree()), tree_hash(example_tree(tau_name="TAU_8f3a")) )
+
+
+class SagnCacheTest(unittest.TestCase):
+
+    def test_roundtrip(self):
+        tree = example_tree()
+        Aligner.set_level_incentive(0)
+        states, t = Aligner(tree).align2(['a','x'], [ACTIVITY_COST]*2, True, timeout=60)
+        live = example_tree(tau_name="TAU_8f3a")
+        live_codec = StateCodec(Mapper(live))
+        with tempfile.TemporaryDirectory() as path:
+            cache = SagnCache(path)
+            digest = tree_hash(tree)
+            self.assertIsNone( cache.get(digest, ['a','x'], 0, True, live_codec) )
+            cache.put(digest, ['a','x'], 0, True, states, t, StateCodec(Mapper(tree)))
+            cached, cached_t = cache.get(tree_hash(live), ['a','x'], 0, True, live_codec)
+            self.assertEqual( cached_t, t )
+            self.assertEqual( [(s.acc_costs, len(s.path)) for s in cached], [(s.acc_costs, len(s.path)) for s in states] )
+            live_nodes = set(id(node) for node in CompiledTree(live).nodes)
+            for s in cached:
+                # rebuilt on the live tree, not on the tree of put
+                self.assertTrue( all(id(getattr(m, 'node', m)) in live_nodes for _, m in s.path if m != '>>') )
+            self.assertIsNone( cache.get(digest, ['a','x'], 1, True, live_codec) )
+
+    def test_evicts_least_recently_used(self):
+        codec = StateCodec(Mapper(example_tree()))
+        with tempfile.TemporaryDirectory() as path:
+            cache = SagnCache(path, max_bytes=0)
+            cache.put('tree', ['a'], 0, True, [], 1, codec)
+            cache.put('tree', ['b'], 0, True, [], 1, codec)
+            cache.max_bytes = os.path.getsize(cache._file(cache.key('tree', ['a'], 0, True)))
+            os.utime(cache._file(cache.key('tree', ['a'], 0, True)), ns=(0, 0))
+            self.assertEqual( cache.evict(), 1 )
+            self.assertIsNone( cache.get('tree', ['a'], 0, True, codec) )
+            self.assertIsNotNone( cache.get('tree', ['b'], 0, True, codec) )
+
+
+class RuntimeHistoryTest(unittest.TestCase):
+
+    def test_roundtrip(self):
+        digest = tree_hash(example_tree())
+        with tempfile.TemporaryDirectory() as path:
+            history = RuntimeHistory(os.path.join(path, "times.json"))
+            history.record(digest, ['a','b'], 1000)
+            history.record(digest, ['a', 'b, c'], 2000)
+            history.record(digest, ['a','b'], 3000)
+            history.save()
+            loaded = RuntimeHistory(os.path.join(path, "times.json"))
+            self.assertEqual( loaded.runtimes(digest), {('a','b'):3000, ('a','b, c'):2000} )
+            self.assertEqual( loaded.runtimes("other"), {} )
+            self.assertEqual( len(loaded), 2 )
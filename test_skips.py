@@ -0,0 +1,35 @@
+import sys
+import unittest
+
+from processtree import *
+from alignment import *
+from skips import Skipper
+from testutil import ACTIVITY_COST, align, example_tree
+
+
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+
+
+class ExecutionCountsTest(unittest.TestCase):
+
+    def test_matches_counts_per_node(self):
+        tree = example_tree()
+        compiled = CompiledTree(tree)
+        skipper = Skipper()
+        for trace in (['a','c','b','c','d'], ['a','x','c'], ['c','a','b','b'], ['d','d']):
+            for state in align(tree, trace):
+                skips, non_skips = skipper.execution_counts(tree, state, compiled)
+                for node in skipper._traverse_tree(tree):
+                    i = compiled.node_index(node)
+                    self.assertEqual( skips[i], skipper.count_skip_executions(node, state, 1) )
+                    self.assertEqual( non_skips[i], skipper.count_non_skip_executions(node, state, 1) )
+
+    def test_conditional_skip_prob(self):
+        tree = example_tree()
+        states = align(tree, ['a','x','c'])
+        probs = Skipper().conditional_skip_prob(tree, {'a, x, c':states})
+        for state in states:
+            for node, p in probs[state].items():
+                self.assertEqual( p, Skipper()._conditional_skip_prob(node, state) )
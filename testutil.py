@@ -0,0 +1,62 @@
+"""
+Helpers shared by the tests: builders for small process trees, optimal skip alignments and silenced calls.
+"""
+import io
+from contextlib import redirect_stderr, redirect_stdout
+
+from processtree import *
+from alignment import *
+
+
+
+ACTIVITY_COST = 100000
+
+def activity(label, aid, cost=ACTIVITY_COST):
+    act = Activity(None, label, cost)
+    act.id = "ACTIVITY_" + str(aid)
+    return act
+
+def tau(aid, name="TAU"):
+    t = Tau(None, name, 0)
+    t.id = "TAU_" + str(aid)
+    return t
+
+def operator(op, children, aid):
+    node = op(None, children)
+    node.id = str(aid)
+    for c in children:
+        c.set_parent(node)
+    return node
+
+def example_tree():
+    # →( a, ∧( b, ↺( c, τ ) ), ×( d, τ ) )
+    a = activity('a',1)
+    b = activity('b',2)
+    c = activity('c',3)
+    d = activity('d',4)
+    loop = operator(Loop, [c, tau(5)], 6)
+    conc = operator(And, [b, loop], 7)
+    choice = operator(Xor, [d, tau(8)], 9)
+    return operator(Sequence, [a, conc, choice], 10)
+
+def loop_tree():
+    # ↺( →( a, b ), τ ), the number of optimal skip alignments of a b b a ... grows exponentially
+    return operator(Loop, [operator(Sequence, [activity('a',1), activity('b',2)], 3), tau(4)], 5)
+
+def random_tree(rng, depth, ids):
+    if depth == 0 or rng.random() < 0.5:
+        if rng.random() < 0.1:
+            return tau(next(ids))
+        return activity(rng.choice('abcd'), next(ids))
+    op = rng.choice([Sequence, And, Xor, Loop])
+    children = [random_tree(rng, depth-1, ids) for _ in range(2 if op is Loop else rng.randint(2, 3))]
+    return operator(op, children, next(ids))
+
+def align(tree, trace, heuristic=Heuristic.NONE, frontier=Frontier.PRIORITY_QUEUE, **kwargs):
+    Aligner.set_level_incentive(0)
+    states, _ = Aligner(tree, heuristic, frontier).align2(trace, [ACTIVITY_COST]*len(trace), True, timeout=60, **kwargs)
+    return states
+
+def quiet(f, *args):
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        return f(*args)